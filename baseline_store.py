@@ -0,0 +1,185 @@
+# coding: utf-8
+
+'''
+per-design baseline store
+an entry holds the full result record of a baseline run (per-iteration
+HPWL/overflow/density weight trajectory plus final GP/LG/DP metrics) and is
+keyed by (design, component configuration, params hash, code hash), so any
+change to the case parameters, params.json or the placer sources that the
+baseline runs on invalidates it without manual cleanup
+'''
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+root_dir = os.path.dirname(os.path.abspath(__file__))
+dreamplace_dir = os.path.join(root_dir, "dreamplace")
+
+# installed file of each swappable component, see batch_eval.build_placer
+component_files = {
+	"basic_place": "BasicPlace.py",
+	"place_obj": "PlaceObj.py",
+	"custom_optimizer": "CustomOptimizer.py",
+}
+
+
+def file_hash(filename):
+	sha = hashlib.sha1()
+	with open(filename, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+
+def code_hash(components):
+	"""
+	@brief hash of the placer sources a run executes, candidate files replace the installed ones;
+	covers the ops tree (.py and compiled .so) and the *_backup.py default modules restore_default_modules copies in
+	@param components {component: path or None}
+	"""
+	replaced = {component_files[k]: v for k, v in components.items() if v is not None}
+	sha = hashlib.sha1()
+	filenames = []
+	for dirpath, dirnames, files in os.walk(dreamplace_dir):
+		dirnames[:] = [dirname for dirname in dirnames if dirname != "__pycache__"]
+		for filename in files:
+			if filename.endswith(".py") or filename.endswith(".so"):
+				filenames.append(os.path.relpath(os.path.join(dirpath, filename), dreamplace_dir))
+	for filename in sorted(filenames):
+		path = replaced.get(filename, os.path.join(dreamplace_dir, filename))
+		sha.update(filename.encode())
+		sha.update(file_hash(path).encode())
+	return sha.hexdigest()
+
+
+def params_hash(params_file):
+	"""
+	@brief hash of the case parameters together with the defaults in params.json
+	"""
+	sha = hashlib.sha1()
+	sha.update(file_hash(os.path.join(dreamplace_dir, "params.json")).encode())
+	sha.update(file_hash(params_file).encode())
+	return sha.hexdigest()
+
+
+class BaselineStore(object):
+	"""
+	@brief baseline result records on disk, one json file per key
+	"""
+	def __init__(self, root_path="./prompt/baseline_store"):
+		self.root_path = root_path
+
+	def case_params_file(self, benchmark, case_name):
+		return os.path.join(root_dir, "test/{}_llm4placement/{}.json".format(benchmark, case_name))
+
+	def key(self, benchmark, case_name, components):
+		"""
+		@return (entry path, key dictionary)
+		"""
+		components = {k: os.path.abspath(v) for k, v in components.items() if v}
+		key = {
+			"design": "{}/{}".format(benchmark, case_name),
+			"components": components,
+			"params_hash": params_hash(self.case_params_file(benchmark, case_name)),
+			"code_hash": code_hash(components),
+		}
+		digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+		return os.path.join(self.root_path, benchmark, "{}.{}.json".format(case_name, digest)), key
+
+	def get(self, benchmark, case_name, components):
+		"""
+		@brief stored baseline record, None if missing or stale
+		"""
+		path, key = self.key(benchmark, case_name, components)
+		if not os.path.exists(path):
+			return None
+		with open(path, "r") as f:
+			entry = json.load(f)
+		# guard against digest collisions
+		if entry["key"] != json.loads(json.dumps(key)):
+			return None
+		return entry["record"]
+
+	def put(self, benchmark, case_name, components, record):
+		path, key = self.key(benchmark, case_name, components)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+		with os.fdopen(fd, "w") as f:
+			json.dump({"key": key, "created": time.time(), "record": record}, f)
+		os.replace(tmp_path, path)
+
+	def run(self, benchmark, case_name, components, timeout=None):
+		"""
+		@brief run the baseline in this interpreter and store its record
+		"""
+		import batch_eval
+
+		fd, record_file = tempfile.mkstemp(suffix=".jsonl")
+		os.close(fd)
+		try:
+			placer_module = batch_eval.build_placer(**components)
+			cur_HPWL, running_time = batch_eval.run_case(self.case_params_file(benchmark, case_name), placer_module, timeout,
+			                                             {"result_record_file": record_file})
+			with open(record_file, "r") as f:
+				record = json.loads(f.read().strip().splitlines()[-1])
+		finally:
+			os.remove(record_file)
+		record["cur_HPWL"] = cur_HPWL
+		record["running-time"] = running_time
+		self.put(benchmark, case_name, components, record)
+		return record
+
+	def baseline(self, benchmark, case_names, case_components=None, timeout=None):
+		"""
+		@brief baseline records of all cases, running only the missing or stale ones
+		@param case_components {case: {component: path}}, e.g. per-case evolved macro init
+		@return {case: record}, a record is None if its run failed
+		"""
+		case_components = case_components or {}
+		records = {}
+		for case_name in case_names:
+			components = case_components.get(case_name, {})
+			records[case_name] = self.get(benchmark, case_name, components)
+			if records[case_name] is None:
+				print("baseline of {}/{} is missing or stale, rerun".format(benchmark, case_name))
+				try:
+					records[case_name] = self.run(benchmark, case_name, components, timeout)
+				except Exception as e:
+					print(e)
+		return records
+
+	def export(self, records, filename):
+		"""
+		@brief write records as json lines, the format of abort_reference_file
+		"""
+		os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+		with open(filename, "w") as f:
+			for record in records.values():
+				if record is not None:
+					f.write(json.dumps(record) + "\n")
+		return filename
+
+
+def baseline_summary(records):
+	"""
+	@brief {case: {"cur_HPWL", "running-time"}}, the layout of ./prompt/*_baseline.json
+	"""
+	return {case_name: ({"cur_HPWL": record["cur_HPWL"], "running-time": str(record["running-time"])}
+	                    if record is not None else None)
+	        for case_name, record in records.items()}
+
+
+def load_baseline(benchmark, case_names, case_basic_place=None, timeout=None, root_path="./prompt/baseline_store"):
+	"""
+	@brief baseline of in-process evaluation, served from the store and rerun only where stale
+	@param case_basic_place {case: BasicPlace path} for cases with an evolved init
+	@return (baseline in the layout of ./prompt/*_baseline.json, reference record file for early abort)
+	"""
+	store = BaselineStore(root_path)
+	case_components = {case_name: {"basic_place": path} for case_name, path in (case_basic_place or {}).items()}
+	records = store.baseline(benchmark, case_names, case_components, timeout)
+	record_path = store.export(records, os.path.join(root_path, benchmark, "reference.jsonl"))
+	return baseline_summary(records), record_path
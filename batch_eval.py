@@ -0,0 +1,326 @@
+# coding: utf-8
+
+'''
+in-process evaluation of evolved candidates
+candidate BasicPlace/PlaceObj/CustomOptimizer files are loaded by path and
+injected into a private copy of NonLinearPlace, so nothing under ./dreamplace
+is overwritten and many cases run back to back in one warm interpreter
+'''
+
+import os
+import sys
+import gc
+import time
+import signal
+import hashlib
+import logging
+import contextlib
+import collections
+import importlib.util
+
+root_dir = os.path.dirname(os.path.abspath(__file__))
+dreamplace_dir = os.path.join(root_dir, "dreamplace")
+for path in (root_dir, dreamplace_dir):
+	if path not in sys.path:
+		sys.path.append(path)
+
+import torch
+import Params
+import Placer
+import PlacerSession
+import EarlyAbort
+
+# loaded candidate modules, keyed by (kind, path, mtime)
+_module_cache = {}
+# NonLinearPlace variants, keyed by the candidate modules they are built on
+_placer_cache = {}
+# warm PlacerSession of each case parameter file, least recently used first
+_session_cache = collections.OrderedDict()
+# sessions kept alive, each holds the data and ops of one design on the device
+max_sessions = 1
+
+
+class CaseTimeout(Exception):
+	"""
+	@brief raised when a case exceeds its time budget
+	"""
+	pass
+
+
+def _module_name(kind, path):
+	digest = hashlib.md5(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+	return "candidate_{}_{}".format(kind, digest)
+
+
+def load_module(path, kind, overrides=None):
+	"""
+	@brief load a python file as a private module without touching sys.modules entries of the install tree
+	@param path path to the python file
+	@param kind tag used to build a unique module name, e.g. BasicPlace
+	@param overrides {module name: module} visible to the import statements of the file while it executes
+	"""
+	overrides = overrides or {}
+	key = (kind, os.path.abspath(path), os.path.getmtime(path), tuple(sorted((k, id(v)) for k, v in overrides.items())))
+	if key in _module_cache:
+		return _module_cache[key]
+
+	name = _module_name(kind, path)
+	if overrides:
+		name += "_" + hashlib.md5(str(key[3]).encode("utf-8")).hexdigest()[:8]
+	spec = importlib.util.spec_from_file_location(name, path)
+	module = importlib.util.module_from_spec(spec)
+
+	# candidate files use sibling imports such as "import BasicPlace",
+	# temporarily redirect them to the injected modules
+	saved = {k: sys.modules.get(k) for k in overrides}
+	sys.modules.update(overrides)
+	sys.modules[name] = module
+	try:
+		spec.loader.exec_module(module)
+	except Exception:
+		del sys.modules[name]
+		raise
+	finally:
+		for k, v in saved.items():
+			if v is None:
+				sys.modules.pop(k, None)
+			else:
+				sys.modules[k] = v
+
+	_module_cache[key] = module
+	return module
+
+
+def build_placer(basic_place=None, place_obj=None, custom_optimizer=None):
+	"""
+	@brief build a NonLinearPlace module whose BasicPlace/PlaceObj/CustomOptimizer come from candidate files
+	@param basic_place path to a BasicPlace.py candidate (macro init), None for the installed one
+	@param place_obj path to a PlaceObj.py candidate (preconditioner), None for the installed one
+	@param custom_optimizer path to a CustomOptimizer.py candidate, None for the installed one
+	@return module exposing NonLinearPlace
+	"""
+	overrides = {}
+	if basic_place is not None:
+		overrides["BasicPlace"] = load_module(basic_place, "BasicPlace")
+	if place_obj is not None:
+		overrides["PlaceObj"] = load_module(place_obj, "PlaceObj")
+	if custom_optimizer is not None:
+		overrides["CustomOptimizer"] = load_module(custom_optimizer, "CustomOptimizer")
+	if not overrides:
+		import NonLinearPlace
+		return NonLinearPlace
+
+	key = tuple(sorted((k, id(v)) for k, v in overrides.items()))
+	if key not in _placer_cache:
+		_placer_cache[key] = load_module(os.path.join(dreamplace_dir, "NonLinearPlace.py"), "NonLinearPlace", overrides)
+	return _placer_cache[key]
+
+
+@contextlib.contextmanager
+def time_limit(seconds):
+	"""
+	@brief raise CaseTimeout in the main thread after seconds
+	The alarm is delivered once control returns to python, so a long C++ kernel finishes first.
+	"""
+	if not seconds or not hasattr(signal, "SIGALRM"):
+		yield
+		return
+
+	def handler(signum, frame):
+		raise CaseTimeout("timeout after {} seconds".format(seconds))
+
+	previous = signal.signal(signal.SIGALRM, handler)
+	signal.alarm(int(seconds))
+	try:
+		yield
+	finally:
+		signal.alarm(0)
+		signal.signal(signal.SIGALRM, previous)
+
+
+def final_hpwl(metrics):
+	"""
+	@brief wHPWL of the last evaluated metric, the same value extract_all_wHPWL_values takes from the log
+	@param metrics nested metric list returned by NonLinearPlace
+	"""
+	cur_metric = metrics
+	while isinstance(cur_metric, (list, tuple)):
+		cur_metric = cur_metric[-1]
+	return float(cur_metric.hpwl)
+
+
+def case_params_file(benchmark, case_name):
+	return os.path.join(root_dir, "test/{}_llm4placement/{}.json".format(benchmark, case_name))
+
+
+def release_memory():
+	gc.collect()
+	if torch.cuda.is_available():
+		torch.cuda.empty_cache()
+
+
+def run_case(params_file, placer_module=None, timeout=None, overrides=None):
+	"""
+	@brief run one placement in the current interpreter
+	@param params_file json parameter file, as passed to Placer.py
+	@param placer_module module returned by build_placer, None for the installed NonLinearPlace
+	@param timeout seconds allowed for the case
+	@param overrides {param: value} applied on top of params_file, e.g. gpu or num_threads of a worker
+	@return (wHPWL, running time in seconds)
+	"""
+	params = Params.Params()
+	params.load(params_file)
+	for key, value in (overrides or {}).items():
+		params.__dict__[key] = value
+	# OMP_NUM_THREADS is only read when the thread pools start, torch is running already
+	torch.set_num_threads(params.num_threads)
+	placer_cls = placer_module.NonLinearPlace if placer_module is not None else None
+
+	start_time = time.time()
+	try:
+		with time_limit(timeout):
+			metrics = Placer.place(params, placer_cls=placer_cls)
+		cur_HPWL = final_hpwl(metrics)
+	finally:
+		# release device memory before the next case
+		metrics = None
+		release_memory()
+	return cur_HPWL, time.time() - start_time
+
+
+def get_session(params_file):
+	"""
+	@brief warm session of the case, built on the installed modules
+	"""
+	key = os.path.abspath(params_file)
+	if key in _session_cache:
+		_session_cache.move_to_end(key)
+		return _session_cache[key]
+	while _session_cache and len(_session_cache) >= max_sessions:
+		_session_cache.popitem(last=False)
+		release_memory()
+	params = Params.Params()
+	params.load(params_file)
+	# OMP_NUM_THREADS is only read when the thread pools start, torch is running already
+	torch.set_num_threads(params.num_threads)
+	_session_cache[key] = PlacerSession.PlacerSession(params)
+	return _session_cache[key]
+
+
+def run_session_case(params_file, timeout=None, overrides=None, basic_place=None, place_obj=None, custom_optimizer=None):
+	"""
+	@brief run one placement on the warm session of the case, only the candidate components are swapped
+	@param basic_place/place_obj/custom_optimizer candidate file paths, see build_placer
+	@return (wHPWL, running time in seconds excluding the one-off session setup)
+	"""
+	session = get_session(params_file)
+	modules = {
+		"basic_place": load_module(basic_place, "BasicPlace") if basic_place is not None else None,
+		"place_obj": load_module(place_obj, "PlaceObj") if place_obj is not None else None,
+		"custom_optimizer": load_module(custom_optimizer, "CustomOptimizer") if custom_optimizer is not None else None,
+	}
+	start_time = time.time()
+	try:
+		with time_limit(timeout):
+			metrics = session.run(overrides=overrides, **modules)
+		cur_HPWL = final_hpwl(metrics)
+	finally:
+		metrics = None
+		gc.collect()
+	return cur_HPWL, time.time() - start_time
+
+
+def run_baseline(benchmark, case_names, timeout=None, case_basic_place=None, record_file=None):
+	"""
+	@brief run the installed flow on every case
+	@param case_basic_place {case: BasicPlace candidate path} for cases with an evolved init
+	@param record_file result records with trajectories, the reference of early abort
+	@return {case: {"cur_HPWL", "running-time"}} in the format of ./prompt/*_baseline.json
+	"""
+	case_basic_place = case_basic_place or {}
+	overrides = {"result_record_file": record_file} if record_file else None
+	total_HPWL = {}
+	for case_name in case_names:
+		try:
+			placer_module = build_placer(basic_place=case_basic_place.get(case_name))
+			cur_HPWL, running_time = run_case(case_params_file(benchmark, case_name), placer_module, timeout, overrides)
+			total_HPWL[case_name] = {"cur_HPWL": cur_HPWL, "running-time": str(running_time)}
+		except Exception as e:
+			logging.exception(e)
+			total_HPWL[case_name] = None
+		print("case", case_name, total_HPWL[case_name])
+	return total_HPWL
+
+
+def evaluate_candidate(benchmark, case_names, baseline, timeout=None,
+                       basic_place=None, place_obj=None, custom_optimizer=None, case_basic_place=None,
+                       abort_reference=None, reuse_session=False):
+	"""
+	@brief score one candidate on all cases
+	@param baseline {case: {"cur_HPWL", ...}} loaded from ./prompt/*_baseline.json
+	@param basic_place/place_obj/custom_optimizer candidate file paths, see build_placer
+	@param case_basic_place {case: BasicPlace path}, per-case evolved init used when basic_place is None
+	@param abort_reference baseline record file written by run_baseline, enables early abort
+	@param reuse_session run on warm per-case sessions, running-time then excludes the one-off setup
+	@return result dictionary with the same layout total_check.py writes
+	"""
+	case_basic_place = case_basic_place or {}
+	overrides = {"abort_reference_file": abort_reference} if abort_reference else None
+	total_HPWL = {}
+	total_improvement = []
+	for case_name in case_names:
+		cur_basic_place = basic_place if basic_place is not None else case_basic_place.get(case_name)
+		start_time = time.time()
+		status = "ok"
+		try:
+			if reuse_session:
+				cur_HPWL, running_time = run_session_case(case_params_file(benchmark, case_name), timeout, overrides,
+				                                          cur_basic_place, place_obj, custom_optimizer)
+			else:
+				placer_module = build_placer(cur_basic_place, place_obj, custom_optimizer)
+				cur_HPWL, running_time = run_case(case_params_file(benchmark, case_name), placer_module, timeout, overrides)
+		except EarlyAbort.PlacementAborted as e:
+			# censored score, the run is known to be worse than the baseline
+			cur_HPWL, running_time, status = e.censored_hpwl, time.time() - start_time, "aborted"
+		except Exception as e:
+			logging.exception(e)
+			cur_HPWL, running_time, status = 1E+16, timeout, "error"
+		total_HPWL[case_name] = {}
+		total_HPWL[case_name]["cur_HPWL"] = cur_HPWL
+		total_HPWL[case_name]["running-time"] = str(running_time)
+		total_HPWL[case_name]["status"] = status
+		baseline_HPWL = (baseline.get(case_name) or {}).get("cur_HPWL")
+		if baseline_HPWL:
+			total_HPWL[case_name]["improve_ratio"] = 1 - cur_HPWL / baseline_HPWL * 1.
+			total_improvement.append(total_HPWL[case_name]["improve_ratio"])
+		else:
+			# the baseline run failed or is missing, the case cannot be scored
+			logging.warning("no baseline HPWL of %s, excluded from the total improvement" % (case_name))
+			total_HPWL[case_name]["improve_ratio"] = None
+		print("case", case_name)
+		print("cur_HPWL", cur_HPWL)
+		print("running-time: {}".format(running_time))
+	total_HPWL["total_improvement_rato"] = sum(total_improvement) / len(total_improvement) * 1. if total_improvement else 0.
+	return total_HPWL
+
+
+if __name__ == "__main__":
+	import argparse
+
+	logging.root.name = 'DREAMPlace'
+	logging.basicConfig(level=logging.INFO,
+	                    format='[%(levelname)-7s] %(name)s - %(message)s',
+	                    stream=sys.stdout)
+	parser = argparse.ArgumentParser(description="evaluate candidates in one interpreter")
+	parser.add_argument('--benchmark', default="mms", type=str)
+	parser.add_argument('--cases', nargs='+', required=True, type=str)
+	parser.add_argument('--basic_place', default=None, type=str, help='BasicPlace.py candidate')
+	parser.add_argument('--place_obj', default=None, type=str, help='PlaceObj.py candidate')
+	parser.add_argument('--custom_optimizer', default=None, type=str, help='CustomOptimizer.py candidate')
+	parser.add_argument('--timeout', default=600, type=int)
+	args = parser.parse_args()
+
+	placer_module = build_placer(args.basic_place, args.place_obj, args.custom_optimizer)
+	for case_name in args.cases:
+		cur_HPWL, running_time = run_case(case_params_file(args.benchmark, case_name), placer_module, args.timeout)
+		print("case", case_name, "cur_HPWL", cur_HPWL, "running-time: {}".format(running_time))
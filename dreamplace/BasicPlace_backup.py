@@ -31,8 +31,8 @@ import dreamplace.ops.pin_pos.pin_pos as pin_pos
 import dreamplace.ops.global_swap.global_swap as global_swap
 import dreamplace.ops.k_reorder.k_reorder as k_reorder
 import dreamplace.ops.independent_set_matching.independent_set_matching as independent_set_matching
-import dreamplace.ops.pin_weight_sum.pin_weight_sum as pws
 import dreamplace.ops.timing.timing as timing
+import QuadraticInit
 import pdb
 
 
@@ -51,6 +51,12 @@ class PlaceDataCollection(object):
         """
         self.device = device
         torch.set_num_threads(params.num_threads)
+        self.num_nodes = placedb.num_nodes
+        # lazily built netlist structures, see netlist_cached
+        self.netlist_cache = {}
+        self.net_weights_key = None
+        # bumped by net_weights_updated for updates the version counter of net_weights misses
+        self.net_weights_epoch = 0
         # position should be parameter
         self.pos = pos
         
@@ -224,6 +230,134 @@ class PlaceDataCollection(object):
         return bin_center_y
 
 
+    def netlist_cached(self, name, build, weighted=False):
+        """
+        @brief build a netlist structure on first use and keep it on device
+        @param name cache entry
+        @param build function to build the entry
+        @param weighted whether the entry depends on net_weights;
+        such entries are rebuilt only after net_weights is modified, e.g., by timing-driven net weighting
+        """
+        if weighted:
+            # the version counter of a tensor increases with every in-place update
+            key = (self.net_weights.data_ptr(), self.net_weights._version)
+            if key != self.net_weights_key:
+                self.net_weights_key = key
+                for entry in [k for k in self.netlist_cache if k.startswith("weighted_")]:
+                    del self.netlist_cache[entry]
+            name = "weighted_" + name
+        entry = self.netlist_cache.get(name)
+        # rebuild if a caller modified a cached tensor in place
+        if entry is None or entry[1] != entry[0]._version:
+            with torch.no_grad():
+                value = build()
+            entry = (value, value._version)
+            self.netlist_cache[name] = entry
+        return entry[0]
+    
+    def net_weights_updated(self):
+        """
+        @brief drop entries depending on net_weights.
+        Needed when net_weights shares memory with placedb.net_weights on CPU and the array is updated through numpy,
+        which the version counter does not see.
+        """
+        self.net_weights_key = None
+        self.net_weights_epoch += 1
+    
+    def incidence(self, rows, cols, size):
+        ones = torch.ones(rows.numel(), dtype=self.net_weights.dtype, device=self.device)
+        # coalesced COO is sorted by rows, i.e., in CSR order
+        return torch.sparse_coo_tensor(torch.stack([rows.long(), cols.long()]), ones, size).coalesce()
+    
+    @property
+    def num_pins(self):
+        return self.pin2node_map.numel()
+    
+    @property
+    def num_nets(self):
+        return self.flat_net2pin_start_map.numel() - 1
+    
+    @property
+    def pin_node_incidence(self):
+        """
+        @brief sparse #pins x #nodes incidence matrix
+        """
+        return self.netlist_cached("pin_node_incidence", lambda: self.incidence(
+            torch.arange(self.num_pins, device=self.device), self.pin2node_map, (self.num_pins, self.num_nodes)))
+    
+    @property
+    def pin_net_incidence(self):
+        """
+        @brief sparse #pins x #nets incidence matrix
+        """
+        return self.netlist_cached("pin_net_incidence", lambda: self.incidence(
+            torch.arange(self.num_pins, device=self.device), self.pin2net_map, (self.num_pins, self.num_nets)))
+    
+    @property
+    def node_net_incidence(self):
+        """
+        @brief sparse #nodes x #nets matrix, number of pins of a node on a net, in CSR order
+        """
+        return self.netlist_cached("node_net_incidence", lambda: self.incidence(
+            self.pin2node_map, self.pin2net_map, (self.num_nodes, self.num_nets)))
+    
+    @property
+    def net_node_incidence(self):
+        """
+        @brief transpose of node_net_incidence in CSR order, i.e., node_net_incidence in CSC order
+        """
+        return self.netlist_cached("net_node_incidence", lambda: self.incidence(
+            self.pin2net_map, self.pin2node_map, (self.num_nets, self.num_nodes)))
+    
+    @property
+    def node_degrees(self):
+        """
+        @brief number of pins of each node, 0 for fillers
+        """
+        def build():
+            degrees = torch.zeros(self.num_nodes, dtype=self.net_weights.dtype, device=self.device)
+            num_physical_nodes = self.flat_node2pin_start_map.numel() - 1
+            degrees[:num_physical_nodes] = (self.flat_node2pin_start_map[1:] - self.flat_node2pin_start_map[:-1]).to(degrees.dtype)
+            return degrees
+        return self.netlist_cached("node_degrees", build)
+    
+    @property
+    def net_degrees(self):
+        """
+        @brief number of pins of each net
+        """
+        return self.netlist_cached("net_degrees", lambda: (
+            self.flat_net2pin_start_map[1:] - self.flat_net2pin_start_map[:-1]).to(self.net_weights.dtype))
+    
+    @property
+    def weighted_pin_counts(self):
+        """
+        @brief sum of the net weights of the pins in each node, 0 for fillers; the output of pws_op
+        """
+        return self.netlist_cached("pin_counts", lambda: self.segment_pin_weight_sum(self.net_weights), weighted=True)
+    
+    def segment_pin_weight_sum(self, net_weights):
+        """
+        @brief sum net weights over the pins of each node with a prefix sum, deterministic on GPU unlike atomics
+        """
+        slot_weights = net_weights[self.pin2net_map[self.flat_node2pin_map.long()].long()].double()
+        prefix = torch.cat([slot_weights.new_zeros(1), torch.cumsum(slot_weights, dim=0)])
+        start_map = self.flat_node2pin_start_map.long()
+        sums = torch.zeros(self.num_nodes, dtype=net_weights.dtype, device=self.device)
+        sums[:start_map.numel() - 1] = (prefix[start_map[1:]] - prefix[start_map[:-1]]).to(net_weights.dtype)
+        return sums
+    
+    def pin_weight_sum(self, net_weights):
+        """
+        @brief drop-in replacement of the pin weight sum op, cached for the net weights of this collection
+        @param net_weights weight of nets
+        """
+        if net_weights is self.net_weights:
+            return self.weighted_pin_counts
+        with torch.no_grad():
+            return self.segment_pin_weight_sum(net_weights)
+
+
 class PlaceOpCollection(object):
     """
     @brief A wrapper for all ops
@@ -270,17 +404,19 @@ class BasicPlace(nn.Module):
                 loc=(placedb.xl * 1.0 + placedb.xh * 1.0) / 2,
                 scale=(placedb.xh - placedb.xl) * 0.001,
                 size=placedb.num_movable_nodes)
-
+        
         # y position
         self.init_pos[placedb.num_nodes:placedb.num_nodes +
-                      placedb.num_physical_nodes] = placedb.node_y
+                                        placedb.num_physical_nodes] = placedb.node_y
         if params.global_place_flag and params.random_center_init_flag:  # move to center of layout
             self.init_pos[placedb.num_nodes:placedb.num_nodes +
-                          placedb.num_movable_nodes] = np.random.normal(
-                              loc=(placedb.yl * 1.0 + placedb.yh * 1.0) / 2,
-                              scale=(placedb.yh - placedb.yl) * 0.001,
-                              size=placedb.num_movable_nodes)
+                                            placedb.num_movable_nodes] = np.random.normal(
+                loc=(placedb.yl * 1.0 + placedb.yh * 1.0) / 2,
+                scale=(placedb.yh - placedb.yl) * 0.001,
+                size=placedb.num_movable_nodes)
         ###move-layout-end###
+        if params.global_place_flag and params.quadratic_init_flag:  # connectivity-aware start
+            self.init_pos = QuadraticInit.quadratic_init(params, placedb, self.init_pos)
         if placedb.num_filler_nodes:  # uniformly distribute filler cells in the layout
             if len(placedb.regions) > 0:
                 ### uniformly spread fillers in fence region
@@ -512,15 +648,9 @@ class BasicPlace(nn.Module):
         @param placedb placement database
         @param data_collections a collection of all data and variables required for constructing the ops
         """
-        # CPU version by default...
-        pws_op = pws.PinWeightSum(
-            flat_nodepin=data_collections.flat_node2pin_map,
-            nodepin_start=data_collections.flat_node2pin_start_map,
-            pin2net_map=data_collections.pin2net_map,
-            num_nodes=placedb.num_nodes,
-            algorithm='node-by-node')
-        
-        return pws_op
+        # the preconditioner calls this on every gradient evaluation,
+        # serve it from the netlist cache, which is refreshed only when net weights change
+        return data_collections.pin_weight_sum
     
     def build_rmst_wl(self, params, placedb, pin_pos_op, device):
         """
@@ -596,7 +726,11 @@ class BasicPlace(nn.Module):
         @param data_collections a collection of all data and variables required for constructing the ops
         @param device cpu or cuda
         """
-        return legality_check.LegalityCheck(
+        if params.legality_check_engine == "cpp":
+            legality_check_class = legality_check.LegalityCheck
+        else:
+            legality_check_class = legality_check.IncrementalLegalityCheck
+        return legality_check_class(
             node_size_x=data_collections.node_size_x,
             node_size_y=data_collections.node_size_y,
             flat_region_boxes=data_collections.flat_region_boxes,
@@ -691,32 +825,51 @@ class BasicPlace(nn.Module):
             yh=placedb.yh,
             site_width=placedb.site_width,
             row_height=placedb.row_height,
-            num_bins_x=1,
-            num_bins_y=64,
-            # num_bins_x=64, num_bins_y=64,
+            num_bins_x=params.legalize_num_bins_x,
+            num_bins_y=params.legalize_num_bins_y,
             num_movable_nodes=placedb.num_movable_nodes,
             num_terminal_NIs=placedb.num_terminal_NIs,
             num_filler_nodes=placedb.num_filler_nodes)
         # for standard cell legalization
-        al = abacus_legalize.AbacusLegalize(
-            node_size_x=data_collections.node_size_x,
-            node_size_y=data_collections.node_size_y,
-            node_weights=data_collections.num_pins_in_nodes,
-            flat_region_boxes=data_collections.flat_region_boxes,
-            flat_region_boxes_start=data_collections.flat_region_boxes_start,
-            node2fence_region_map=data_collections.node2fence_region_map,
-            xl=placedb.xl,
-            yl=placedb.yl,
-            xh=placedb.xh,
-            yh=placedb.yh,
-            site_width=placedb.site_width,
-            row_height=placedb.row_height,
-            num_bins_x=1,
-            num_bins_y=64,
-            # num_bins_x=64, num_bins_y=64,
-            num_movable_nodes=placedb.num_movable_nodes,
-            num_terminal_NIs=placedb.num_terminal_NIs,
-            num_filler_nodes=placedb.num_filler_nodes)
+        # the torch abacus keeps GPU runs on the device, it needs no fence regions
+        abacus_engine = params.abacus_legalize_engine
+        if abacus_engine == "auto":
+            abacus_engine = "torch" if params.gpu and len(placedb.regions) == 0 else "cpp"
+        if abacus_engine == "torch":
+            assert len(placedb.regions) == 0, "torch abacus legalization does not support fence regions"
+            al = abacus_legalize.RowAbacusLegalize(
+                node_size_x=data_collections.node_size_x,
+                node_size_y=data_collections.node_size_y,
+                node_weights=data_collections.num_pins_in_nodes,
+                xl=placedb.xl,
+                yl=placedb.yl,
+                xh=placedb.xh,
+                yh=placedb.yh,
+                site_width=placedb.site_width,
+                row_height=placedb.row_height,
+                num_movable_nodes=placedb.num_movable_nodes,
+                num_terminals=placedb.num_terminals,
+                num_terminal_NIs=placedb.num_terminal_NIs,
+                num_filler_nodes=placedb.num_filler_nodes)
+        else:
+            al = abacus_legalize.AbacusLegalize(
+                node_size_x=data_collections.node_size_x,
+                node_size_y=data_collections.node_size_y,
+                node_weights=data_collections.num_pins_in_nodes,
+                flat_region_boxes=data_collections.flat_region_boxes,
+                flat_region_boxes_start=data_collections.flat_region_boxes_start,
+                node2fence_region_map=data_collections.node2fence_region_map,
+                xl=placedb.xl,
+                yl=placedb.yl,
+                xh=placedb.xh,
+                yh=placedb.yh,
+                site_width=placedb.site_width,
+                row_height=placedb.row_height,
+                num_bins_x=params.legalize_num_bins_x,
+                num_bins_y=params.legalize_num_bins_y,
+                num_movable_nodes=placedb.num_movable_nodes,
+                num_terminal_NIs=placedb.num_terminal_NIs,
+                num_filler_nodes=placedb.num_filler_nodes)
         
         def build_legalization_op(pos):
             logging.info("Start legalization")
@@ -950,42 +1103,14 @@ class BasicPlace(nn.Module):
     def build_detailed_placement(self, params, placedb, data_collections,
                                  device):
         """
-        @brief detailed placement consisting of global swap and independent set matching
+        @brief detailed placement running the pass schedule in params.detailed_place_passes,
+        consisting of k-reorder, independent set matching and global swap
         @param params parameters
         @param placedb placement database
         @param data_collections a collection of all data and variables required for constructing the ops
         @param device cpu or cuda
         """
-        gs = global_swap.GlobalSwap(
-            node_size_x=data_collections.node_size_x,
-            node_size_y=data_collections.node_size_y,
-            flat_region_boxes=data_collections.flat_region_boxes,
-            flat_region_boxes_start=data_collections.flat_region_boxes_start,
-            node2fence_region_map=data_collections.node2fence_region_map,
-            flat_net2pin_map=data_collections.flat_net2pin_map,
-            flat_net2pin_start_map=data_collections.flat_net2pin_start_map,
-            pin2net_map=data_collections.pin2net_map,
-            flat_node2pin_map=data_collections.flat_node2pin_map,
-            flat_node2pin_start_map=data_collections.flat_node2pin_start_map,
-            pin2node_map=data_collections.pin2node_map,
-            pin_offset_x=data_collections.pin_offset_x,
-            pin_offset_y=data_collections.pin_offset_y,
-            net_mask=data_collections.net_mask_ignore_large_degrees,
-            xl=placedb.xl,
-            yl=placedb.yl,
-            xh=placedb.xh,
-            yh=placedb.yh,
-            site_width=placedb.site_width,
-            row_height=placedb.row_height,
-            num_bins_x=placedb.num_bins_x // 2,
-            num_bins_y=placedb.num_bins_y // 2,
-            num_movable_nodes=placedb.num_movable_nodes,
-            num_terminal_NIs=placedb.num_terminal_NIs,
-            num_filler_nodes=placedb.num_filler_nodes,
-            batch_size=256,
-            max_iters=2,
-            algorithm='concurrent')
-        kr = k_reorder.KReorder(
+        common_args = dict(
             node_size_x=data_collections.node_size_x,
             node_size_y=data_collections.node_size_y,
             flat_region_boxes=data_collections.flat_region_boxes,
@@ -1006,43 +1131,31 @@ class BasicPlace(nn.Module):
             yh=placedb.yh,
             site_width=placedb.site_width,
             row_height=placedb.row_height,
-            num_bins_x=placedb.num_bins_x,
-            num_bins_y=placedb.num_bins_y,
             num_movable_nodes=placedb.num_movable_nodes,
             num_terminal_NIs=placedb.num_terminal_NIs,
-            num_filler_nodes=placedb.num_filler_nodes,
-            K=4,
-            max_iters=2)
-        ism = independent_set_matching.IndependentSetMatching(
-            node_size_x=data_collections.node_size_x,
-            node_size_y=data_collections.node_size_y,
-            flat_region_boxes=data_collections.flat_region_boxes,
-            flat_region_boxes_start=data_collections.flat_region_boxes_start,
-            node2fence_region_map=data_collections.node2fence_region_map,
-            flat_net2pin_map=data_collections.flat_net2pin_map,
-            flat_net2pin_start_map=data_collections.flat_net2pin_start_map,
-            pin2net_map=data_collections.pin2net_map,
-            flat_node2pin_map=data_collections.flat_node2pin_map,
-            flat_node2pin_start_map=data_collections.flat_node2pin_start_map,
-            pin2node_map=data_collections.pin2node_map,
-            pin_offset_x=data_collections.pin_offset_x,
-            pin_offset_y=data_collections.pin_offset_y,
-            net_mask=data_collections.net_mask_ignore_large_degrees,
-            xl=placedb.xl,
-            yl=placedb.yl,
-            xh=placedb.xh,
-            yh=placedb.yh,
-            site_width=placedb.site_width,
-            row_height=placedb.row_height,
-            num_bins_x=placedb.num_bins_x,
-            num_bins_y=placedb.num_bins_y,
-            num_movable_nodes=placedb.num_movable_nodes,
-            num_terminal_NIs=placedb.num_terminal_NIs,
-            num_filler_nodes=placedb.num_filler_nodes,
-            batch_size=2048,
-            set_size=128,
-            max_iters=50,
-            algorithm='concurrent')
+            num_filler_nodes=placedb.num_filler_nodes)
+        pass_ops = {
+            "global_swap": (global_swap.GlobalSwap, "Global swap", 2),
+            "k_reorder": (k_reorder.KReorder, "K-Reorder", 1),
+            "independent_set_matching": (independent_set_matching.IndependentSetMatching,
+                                         "Independent set matching", 1),
+        }
+        # passes of the same op and arguments share one op
+        dp_ops = {}
+        dp_passes = []
+        for config in params.detailed_place_passes:
+            config = dict(config)
+            name = config.pop("op")
+            max_rounds = config.pop("max_rounds", 1)
+            op_class, title, bin_ratio = pass_ops[name]
+            config.setdefault("num_bins_x", placedb.num_bins_x // bin_ratio)
+            config.setdefault("num_bins_y", placedb.num_bins_y // bin_ratio)
+            key = (name, tuple(sorted(config.items())))
+            if key not in dp_ops:
+                args = dict(common_args)
+                args.update(config)
+                dp_ops[key] = op_class(**args)
+            dp_passes.append((dp_ops[key], title, max_rounds))
         
         # wirelength for position
         def build_detailed_placement_op(pos):
@@ -1086,28 +1199,25 @@ class BasicPlace(nn.Module):
                 logging.info(
                     "Use scale factor %g (1/%d) for detailed placement" % (scale_factor, target_inv_scale_factor))
             
-            for i in range(1):
-                pos1 = kr(pos1, scale_factor)
-                legal = self.op_collections.legality_check_op(pos1)
-                logging.info("K-Reorder legal flag = %d" % (legal))
-                if not legal:
-                    return pos1
-                pos1 = ism(pos1, scale_factor)
-                legal = self.op_collections.legality_check_op(pos1)
-                logging.info("Independent set matching legal flag = %d" %
-                             (legal))
-                if not legal:
-                    return pos1
-                pos1 = gs(pos1, scale_factor)
-                legal = self.op_collections.legality_check_op(pos1)
-                logging.info("Global swap legal flag = %d" % (legal))
-                if not legal:
-                    return pos1
-                pos1 = kr(pos1, scale_factor)
-                legal = self.op_collections.legality_check_op(pos1)
-                logging.info("K-Reorder legal flag = %d" % (legal))
-                if not legal:
-                    return pos1
+            # each pass repeats its op for up to max_rounds rounds,
+            # and optionally stops once the relative HPWL gain per second drops below the threshold
+            hpwl = float(self.op_collections.hpwl_op(pos1))
+            for op, title, max_rounds in dp_passes:
+                for i in range(max_rounds):
+                    tt = time.time()
+                    pos1 = op(pos1, scale_factor)
+                    legal = self.op_collections.legality_check_op(pos1)
+                    logging.info("%s legal flag = %d" % (title, legal))
+                    if not legal:
+                        return pos1
+                    new_hpwl = float(self.op_collections.hpwl_op(pos1))
+                    elapsed = max(time.time() - tt, 1e-6)
+                    gain = (hpwl - new_hpwl) / hpwl if hpwl > 0 else 0.0
+                    logging.info("%s round %d, HPWL %.6E, gain %.3f%% in %.3f seconds" %
+                                 (title, i, new_hpwl, gain * 100, elapsed))
+                    hpwl = new_hpwl
+                    if params.detailed_place_min_gain_rate > 0 and gain / elapsed < params.detailed_place_min_gain_rate:
+                        break
             return pos1
         
         return build_detailed_placement_op
@@ -0,0 +1,297 @@
+##
+# @file   BatchPlace.py
+# @brief  Global placement of several placements of one design as a batch.
+# Sweeps over seeds or scalar settings place the same netlist many times.
+# Stacking the positions into one [#placements, 2 * #nodes] tensor shares the netlist,
+# the fixed density map and the spectral transforms, and runs pin locations, wirelength
+# and the field solve for all placements in the same kernels,
+# while density weights, gammas and optimizer states stay per placement.
+#
+
+import time
+import logging
+import numpy as np
+import torch
+import dreamplace.ops.weighted_average_wirelength.weighted_average_wirelength as weighted_average_wirelength
+
+
+class BatchNesterovOptimizer(object):
+    """
+    @brief Nesterov's accelerated gradient with Barzilai-Borwein step sizes, as CusOptimizer,
+    with one state per row of the positions.
+    Rows marked done keep their positions.
+    """
+    def __init__(self, pos, lr, obj_and_grad_fn, constraint_fn):
+        """
+        @param pos positions of shape [#placements, 2 * #nodes]
+        @param lr initial step of each placement, of shape [#placements, 1]
+        @param obj_and_grad_fn function returning objective and preconditioned gradient of all rows
+        @param constraint_fn function moving all rows back into the layout
+        """
+        self.pos = pos
+        self.obj_and_grad_fn = obj_and_grad_fn
+        self.constraint_fn = constraint_fn
+        self.u_k = pos.data.clone()
+        self.v_k = pos
+        self.a_k = torch.ones([pos.size(0), 1], dtype=pos.dtype, device=pos.device)
+        obj_k, g_k = obj_and_grad_fn(self.v_k)
+        self.v_k_1 = torch.autograd.Variable(pos.data - lr * g_k, requires_grad=True)
+        self.alpha_k = None
+        self.obj_eval_count = 0
+
+    @staticmethod
+    def row_dot(a, b):
+        return (a * b).sum(dim=1, keepdim=True)
+
+    def step(self, done=None):
+        """
+        @brief one step of all placements
+        @param done rows to keep, of shape [#placements]
+        """
+        obj_k, g_k = self.obj_and_grad_fn(self.v_k)
+        obj_k_1, g_k_1 = self.obj_and_grad_fn(self.v_k_1)
+        with torch.no_grad():
+            s_k = self.v_k - self.v_k_1
+            y_k = g_k - g_k_1
+            lip_step_size = self.row_dot(s_k, s_k).sqrt_() / self.row_dot(y_k, y_k).sqrt_()
+            if self.alpha_k is None:
+                self.alpha_k = lip_step_size
+            bb_short_step_size = self.row_dot(s_k, y_k) / self.row_dot(y_k, y_k)
+            step_size = torch.where(bb_short_step_size > 0, bb_short_step_size,
+                                    torch.min(lip_step_size, self.alpha_k))
+
+            a_kp1 = (1 + (4 * self.a_k.pow(2) + 1).sqrt()) / 2
+            coef = (self.a_k - 1) / a_kp1
+            u_kp1 = self.v_k - step_size * g_k
+            v_kp1 = u_kp1 + coef * (u_kp1 - self.u_k)
+            self.constraint_fn(v_kp1)
+
+            if done is not None:
+                keep = done.view([-1, 1])
+                u_kp1 = torch.where(keep, self.u_k, u_kp1)
+                v_kp1 = torch.where(keep, self.v_k.data, v_kp1)
+                step_size = torch.where(keep, self.alpha_k, step_size)
+                a_kp1 = torch.where(keep, self.a_k, a_kp1)
+                self.v_k_1.data.copy_(torch.where(keep, self.v_k_1.data, self.v_k.data))
+            else:
+                self.v_k_1.data.copy_(self.v_k.data)
+            self.obj_eval_count += 2
+            self.alpha_k = step_size
+            self.u_k.copy_(u_kp1)
+            self.v_k.data.copy_(v_kp1)
+            self.a_k = a_kp1
+        return obj_k
+
+
+class BatchPlaceObj(object):
+    """
+    @brief placement objective of several placements built on the ops of a single-placement PlaceObj.
+    Wirelength uses the lean weighted-average kernel with the x and y arrays of all placements stacked,
+    density uses the batched electric potential.
+    """
+    def __init__(self, params, placedb, data_collections, model, batch_size):
+        """
+        @param params parameters
+        @param placedb placement database
+        @param data_collections data collections of the placer
+        @param model PlaceObj of the stage, providing the density op, bin grid and base gamma
+        @param batch_size number of placements
+        """
+        self.params = params
+        self.placedb = placedb
+        self.data_collections = data_collections
+        self.model = model
+        self.batch_size = batch_size
+        self.density_op = model.op_collections.density_op
+        pos = data_collections.pos[0]
+        self.density_weight = torch.zeros([batch_size, 1], dtype=pos.dtype, device=pos.device)
+        self.gamma = torch.full([batch_size, 1], 10 * model.base_gamma(params, placedb),
+                                dtype=pos.dtype, device=pos.device)
+        self.pin2node_map = data_collections.pin2node_map.long()
+        self.net_mask_all = data_collections.net_mask_all.to(pos.dtype)
+        if data_collections.net_weights.numel():
+            self.net_mask_all = self.net_mask_all * data_collections.net_weights
+
+    def pin_pos(self, pos):
+        """
+        @param pos positions of shape [#placements, 2 * #nodes]
+        @return pin locations of shape [#placements, 2, #pins]
+        """
+        num_nodes = self.placedb.num_nodes
+        pin_x = pos[:, :num_nodes][:, self.pin2node_map] + self.data_collections.pin_offset_x
+        pin_y = pos[:, num_nodes:][:, self.pin2node_map] + self.data_collections.pin_offset_y
+        return torch.stack([pin_x, pin_y], dim=1)
+
+    def wirelength(self, pos):
+        """
+        @return weighted-average wirelength summed over the placements
+        """
+        data_collections = self.data_collections
+        inv_gamma = (1.0 / self.gamma).repeat_interleave(2, dim=0)
+        return weighted_average_wirelength.WeightedAverageWirelengthLeanFunction.apply(
+            self.pin_pos(pos).reshape([-1]),
+            data_collections.flat_net2pin_map, data_collections.flat_net2pin_start_map,
+            data_collections.pin2net_map, data_collections.net_weights,
+            data_collections.net_mask_ignore_large_degrees,
+            data_collections.pin_mask_ignore_fixed_macros, inv_gamma)
+
+    def obj_and_grad_fn(self, pos):
+        """
+        @brief objective summed over the placements and the preconditioned gradient of each of them
+        """
+        if pos.grad is not None:
+            pos.grad.zero_()
+        obj = self.wirelength(pos) + (self.density_weight.view([-1]) * self.density_op.forward_batch(pos)).sum()
+        obj.backward()
+        with torch.no_grad():
+            num_nodes = self.placedb.num_nodes
+            precond = (self.data_collections.weighted_pin_counts
+                       + self.density_weight * self.data_collections.node_areas).clamp_(min=1.0)
+            grad = pos.grad.view([self.batch_size, 2, num_nodes]).div_(precond.unsqueeze(1))
+        return obj, grad.view([self.batch_size, -1])
+
+    def initialize_density_weight(self, pos, scale):
+        """
+        @brief density weight of each placement from the ratio of wirelength and density gradient norms
+        @param scale params.density_weight of each placement, of shape [#placements, 1]
+        """
+        if pos.grad is not None:
+            pos.grad.zero_()
+        self.wirelength(pos).backward()
+        wirelength_grad_norm = pos.grad.norm(p=1, dim=1, keepdim=True)
+        pos.grad.zero_()
+        self.density_op.forward_batch(pos).sum().backward()
+        density_grad_norm = pos.grad.norm(p=1, dim=1, keepdim=True)
+        pos.grad.zero_()
+        self.density_weight.copy_(scale * wirelength_grad_norm / density_grad_norm)
+
+    def move_boundary(self, pos):
+        """
+        @brief keep movable cells and fillers inside the layout, in place
+        """
+        placedb = self.placedb
+        num_nodes = placedb.num_nodes
+        pos = pos.view([self.batch_size, 2, num_nodes])
+        for nodes in [slice(0, placedb.num_movable_nodes), slice(num_nodes - placedb.num_filler_nodes, num_nodes)]:
+            for i, (low, high, size) in enumerate([(placedb.xl, placedb.xh, self.data_collections.node_size_x),
+                                                   (placedb.yl, placedb.yh, self.data_collections.node_size_y)]):
+                pos[:, i, nodes] = torch.min(pos[:, i, nodes].clamp(min=low), high - size[nodes])
+        return pos
+
+    def metrics(self, pos):
+        """
+        @brief HPWL, overflow and max density of each placement at pos
+        """
+        with torch.no_grad():
+            data_collections = self.data_collections
+            pin_pos = self.pin_pos(pos).reshape([2 * self.batch_size, -1])
+            net_max, net_min = weighted_average_wirelength.net_extremes(
+                pin_pos, data_collections.flat_net2pin_map,
+                data_collections.flat_net2pin_start_map, data_collections.pin2net_map)
+            hpwl = (net_max - net_min).view([self.batch_size, 2, -1]).sum(dim=1).mul_(self.net_mask_all).sum(dim=1)
+            self.density_op.forward_batch(pos)
+            overflow = self.density_op.batch_overflow / self.placedb.total_movable_node_area
+            return hpwl, overflow, self.density_op.batch_max_density
+
+    def update_density_weight(self, hpwl, prev_hpwl, iteration):
+        """
+        @brief RePlAce density weight update of each placement from its HPWL change
+        """
+        params = self.params
+        with torch.no_grad():
+            delta_hpwl = hpwl - prev_hpwl
+            mu = params.RePlAce_UPPER_PCOF * torch.pow(
+                params.RePlAce_UPPER_PCOF, -delta_hpwl / params.RePlAce_ref_hpwl).clamp(
+                    min=params.RePlAce_LOWER_PCOF, max=params.RePlAce_UPPER_PCOF)
+            mu.masked_fill_(delta_hpwl < 0, params.RePlAce_UPPER_PCOF * np.maximum(
+                np.power(0.9999, float(iteration)), 0.98))
+            self.density_weight.mul_(mu.view([-1, 1]))
+
+    def update_gamma(self, overflow, base_gamma):
+        """
+        @brief gamma of each placement from its overflow, as PlaceObj.update_gamma
+        @param base_gamma base gamma of each placement, of shape [#placements, 1]
+        """
+        with torch.no_grad():
+            coef = torch.pow(10, (overflow.view([-1, 1]) - 0.1) * 20 / 9 - 1)
+            self.gamma.copy_(base_gamma * coef)
+
+
+class BatchPlace(object):
+    """
+    @brief run the first global placement stage of a built placer for several placements at once.
+    Fence regions, routability and timing optimization are not supported;
+    legalization and detailed placement of a selected result go through the regular flow.
+    """
+    def __init__(self, placer):
+        """
+        @param placer NonLinearPlace whose data and op collections are shared
+        """
+        self.placer = placer
+
+    def __call__(self, params, placedb, init_pos, configs=None):
+        """
+        @param params parameters
+        @param placedb placement database
+        @param init_pos initial positions of shape [#placements, 2 * #nodes]
+        @param configs per placement {"density_weight", "gamma", "learning_rate"} overriding
+        params.density_weight, params.gamma and the learning rate of the stage
+        @return per placement {"pos", "hpwl", "overflow", "max_density", "iteration"}
+        """
+        assert len(placedb.regions) == 0 and not params.routability_opt_flag and not params.timing_opt_flag, \
+                "batched global placement does not support fence regions, routability or timing optimization"
+        tt = time.time()
+        placer = self.placer
+        data_collections = placer.data_collections
+        device = data_collections.pos[0].device
+        dtype = data_collections.pos[0].dtype
+        batch_size = len(init_pos)
+        configs = configs if configs is not None else [{}] * batch_size
+        global_place_params = params.global_place_stages[0]
+
+        model = placer.place_obj_module.PlaceObj(
+            0.0, params, placedb, data_collections, placer.op_collections,
+            global_place_params).to(device)
+        obj = BatchPlaceObj(params, placedb, data_collections, model, batch_size)
+
+        def config_column(key, default):
+            return torch.tensor([[config.get(key, default)] for config in configs], dtype=dtype, device=device)
+
+        base_gamma = model.base_gamma(params, placedb) / params.gamma * config_column("gamma", params.gamma)
+        obj.gamma.copy_(10 * base_gamma)
+        pos = torch.autograd.Variable(torch.as_tensor(np.asarray(init_pos), dtype=dtype).to(device), requires_grad=True)
+        obj.initialize_density_weight(pos, config_column("density_weight", params.density_weight))
+
+        optimizer = BatchNesterovOptimizer(
+            pos, config_column("learning_rate", global_place_params["learning_rate"]),
+            obj.obj_and_grad_fn, obj.move_boundary)
+        logging.info("batched global placement of %d placements, initialization takes %g seconds" % (batch_size, time.time() - tt))
+
+        done = torch.zeros(batch_size, dtype=torch.bool, device=device)
+        iterations = torch.zeros(batch_size, dtype=torch.int64, device=device)
+        hpwl, overflow, max_density = obj.metrics(pos)
+        for iteration in range(global_place_params["iteration"]):
+            optimizer.step(done)
+            iterations += (~done).long()
+            prev_hpwl = hpwl
+            hpwl, overflow, max_density = obj.metrics(pos)
+            obj.update_density_weight(hpwl, prev_hpwl, iteration)
+            obj.update_gamma(overflow, base_gamma)
+            if iteration > 100:
+                done |= ((overflow < params.stop_overflow) & (hpwl > prev_hpwl)) | (max_density < params.target_density)
+            if iteration % 10 == 0:
+                logging.info("batch iteration %4d, HPWL %s, overflow %s, %d done" % (
+                    iteration, np.array2string(hpwl.cpu().numpy(), precision=3),
+                    np.array2string(overflow.cpu().numpy(), precision=3), done.sum().item()))
+                if done.all():
+                    break
+        logging.info("batched global placement takes %g seconds" % (time.time() - tt))
+
+        pos = pos.data.cpu().numpy()
+        hpwl = hpwl.cpu().numpy()
+        overflow = overflow.cpu().numpy()
+        max_density = max_density.cpu().numpy()
+        iterations = iterations.cpu().numpy()
+        return [{"pos": pos[b], "hpwl": float(hpwl[b]), "overflow": float(overflow[b]),
+                 "max_density": float(max_density[b]), "iteration": int(iterations[b])}
+                for b in range(batch_size)]
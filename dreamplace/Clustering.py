@@ -0,0 +1,261 @@
+##
+# @file   Clustering.py
+# @brief  Netlist clustering for multilevel global placement.
+# Movable standard cells are merged by best-choice matching on the clique model of small nets,
+# the clustered netlist is exposed as a PlaceDB view, and its placement is
+# declustered into the initial positions of the flat netlist.
+#
+
+import time
+import logging
+import numpy as np
+import PlaceDB
+
+# parameters of the placement of the clustered netlist, it only provides the start of the flat one
+coarse_place_overrides = {
+        "cluster_flag": 0,
+        "legalize_flag": 0,
+        "detailed_place_flag": 0,
+        "routability_opt_flag": 0,
+        "timing_opt_flag": 0,
+        "macro_place_flag": 0,
+        "plot_flag": 0,
+        "dump_global_place_solution_flag": 0,
+        "dump_legalize_solution_flag": 0,
+        "result_record_file": "",
+        "abort_reference_file": "",
+        }
+
+
+def clique_connections(params, placedb):
+    """
+    @brief pairs of movable standard cells connected by nets up to params.cluster_max_net_degree pins
+    Each pair of pins of a d-pin net contributes w/(d-1).
+    Pairs crossing fence regions, touching macros or fixed cells are dropped.
+    @return (nodes of one end, nodes of the other end, weights)
+    """
+    num_movable_nodes = placedb.num_movable_nodes
+    start_map = placedb.flat_net2pin_start_map.astype(np.int64)
+    degrees = start_map[1:] - start_map[:-1]
+    nets = np.nonzero((degrees >= 2) & (degrees <= params.cluster_max_net_degree))[0]
+
+    # pair every pin with the later pins of the same net
+    net_degrees = degrees[nets]
+    slot_nets = np.repeat(nets, net_degrees)
+    slots = start_map[slot_nets] + np.arange(slot_nets.size) - np.repeat(np.cumsum(net_degrees) - net_degrees, net_degrees)
+    slot_degrees = degrees[slot_nets]
+    pair_slots = np.repeat(slots, slot_degrees)
+    pair_nets = np.repeat(slot_nets, slot_degrees)
+    other_slots = start_map[pair_nets] + np.arange(pair_slots.size) - np.repeat(np.cumsum(slot_degrees) - slot_degrees, slot_degrees)
+    keep = pair_slots < other_slots
+    pair_slots, other_slots, pair_nets = pair_slots[keep], other_slots[keep], pair_nets[keep]
+
+    pin2node_map = placedb.pin2node_map.astype(np.int64)
+    nodes_a = pin2node_map[placedb.flat_net2pin_map[pair_slots]]
+    nodes_b = pin2node_map[placedb.flat_net2pin_map[other_slots]]
+    weights = placedb.net_weights[pair_nets].astype(np.float64) / (degrees[pair_nets] - 1)
+
+    clusterable = np.zeros(placedb.num_physical_nodes, dtype=bool)
+    clusterable[:num_movable_nodes] = True
+    if placedb.movable_macro_mask is not None:
+        clusterable[:num_movable_nodes] &= ~placedb.movable_macro_mask
+    keep = clusterable[nodes_a] & clusterable[nodes_b] & (nodes_a != nodes_b)
+    if len(placedb.regions) > 0:
+        keep &= placedb.node2fence_region_map[np.where(keep, nodes_a, 0)] == placedb.node2fence_region_map[np.where(keep, nodes_b, 0)]
+    return nodes_a[keep], nodes_b[keep], weights[keep]
+
+
+def best_choice_clustering(params, placedb):
+    """
+    @brief cluster movable nodes until params.cluster_ratio times fewer remain.
+    In each round, clusters whose best neighbor by w/(area_u+area_v) is mutual are merged,
+    as long as the merged area stays within params.cluster_max_area average standard cells.
+    Macros and cells without small nets stay single.
+    @param params parameters
+    @param placedb placement database
+    @return (cluster of each movable node, number of clusters)
+    """
+    tt = time.time()
+    num_movable_nodes = placedb.num_movable_nodes
+    node_areas = placedb.node_size_x[:num_movable_nodes].astype(np.float64) * placedb.node_size_y[:num_movable_nodes]
+    cell_mask = np.ones(num_movable_nodes, dtype=bool) if placedb.movable_macro_mask is None else ~placedb.movable_macro_mask
+    max_area = params.cluster_max_area * node_areas[cell_mask].mean() if cell_mask.any() else 0
+    target = int(np.ceil(num_movable_nodes / max(params.cluster_ratio, 1)))
+
+    nodes_a, nodes_b, weights = clique_connections(params, placedb)
+    nodes_src = np.concatenate([nodes_a, nodes_b])
+    nodes_dst = np.concatenate([nodes_b, nodes_a])
+    weights = np.concatenate([weights, weights])
+
+    clusters = np.arange(num_movable_nodes)
+    areas = node_areas
+    num_clusters = num_movable_nodes
+    num_rounds = 0
+    while num_clusters > target:
+        src = clusters[nodes_src]
+        dst = clusters[nodes_dst]
+        valid = (src != dst) & (areas[src] + areas[dst] <= max_area)
+        keys, inverse = np.unique(src[valid] * num_clusters + dst[valid], return_inverse=True)
+        if keys.size == 0:
+            break
+        scores = np.bincount(inverse, weights=weights[valid])
+        src = keys // num_clusters
+        dst = keys % num_clusters
+        scores /= areas[src] + areas[dst]
+
+        # best neighbor of each cluster, ties go to the smaller id
+        order = np.lexsort((dst, -scores, src))
+        src, dst = src[order], dst[order]
+        first = np.concatenate([[True], src[1:] != src[:-1]])
+        best = np.full(num_clusters, -1, dtype=np.int64)
+        best[src[first]] = dst[first]
+        ids = np.arange(num_clusters)
+        mutual = (best > ids) & (best[np.maximum(best, 0)] == ids)
+        pairs = np.nonzero(mutual)[0][:num_clusters - target]
+        # matching stalls on the long tail of a netlist, stop when a round barely merges
+        if pairs.size == 0 or (num_rounds > 0 and pairs.size < 0.01 * num_clusters):
+            break
+
+        merged_into = ids.copy()
+        merged_into[best[pairs]] = pairs
+        roots = merged_into == ids
+        new_ids = np.cumsum(roots) - 1
+        mapping = new_ids[merged_into]
+        num_clusters = int(new_ids[-1]) + 1
+        areas = np.bincount(mapping, weights=areas, minlength=num_clusters)
+        clusters = mapping[clusters]
+        num_rounds += 1
+
+    logging.info("cluster %d movable nodes into %d clusters in %d rounds, takes %.2f seconds"
+            % (num_movable_nodes, num_clusters, num_rounds, time.time() - tt))
+    return clusters, num_clusters
+
+
+class ClusteredPlaceDB(PlaceDB.PlaceDB):
+    """
+    @brief PlaceDB view of a clustered netlist.
+    Clusters replace the movable nodes, fixed nodes and fillers are kept,
+    and only nets spanning more than one node remain.
+    It is not backed by a raw database, so applying a solution only updates node positions.
+    """
+    def apply(self, params, node_x, node_y):
+        """
+        @brief apply placement solution
+        """
+        self.node_x[:self.num_movable_nodes] = node_x[:self.num_movable_nodes]
+        self.node_y[:self.num_movable_nodes] = node_y[:self.num_movable_nodes]
+
+
+def coarsen_placedb(placedb, clusters, num_clusters):
+    """
+    @brief build the placement database of a clustered netlist
+    @param placedb placement database of the flat netlist
+    @param clusters cluster of each movable node
+    @param num_clusters number of clusters
+    @return ClusteredPlaceDB, members not listed here are shared with placedb
+    """
+    num_movable_nodes = placedb.num_movable_nodes
+    num_physical_nodes = placedb.num_physical_nodes
+    num_fixed_nodes = num_physical_nodes - num_movable_nodes
+    db = ClusteredPlaceDB.__new__(ClusteredPlaceDB)
+    db.__dict__.update(placedb.__dict__)
+    db.rawdb = None
+    db._rawdb_params = None
+    db.pydb = None
+
+    # nodes, clusters of several cells become near-square blocks of whole rows with the same area
+    counts = np.bincount(clusters, minlength=num_clusters)
+    areas = np.bincount(clusters, weights=placedb.node_size_x[:num_movable_nodes].astype(np.float64) * placedb.node_size_y[:num_movable_nodes], minlength=num_clusters)
+    size_y = np.maximum(np.round(np.sqrt(areas) / placedb.row_height), 1) * placedb.row_height
+    size_x = areas / size_y
+    singles = counts == 1
+    size_x[clusters[singles[clusters]]] = placedb.node_size_x[:num_movable_nodes][singles[clusters]]
+    size_y[clusters[singles[clusters]]] = placedb.node_size_y[:num_movable_nodes][singles[clusters]]
+    center_x = np.bincount(clusters, weights=placedb.node_x[:num_movable_nodes] + placedb.node_size_x[:num_movable_nodes] / 2, minlength=num_clusters) / counts
+    center_y = np.bincount(clusters, weights=placedb.node_y[:num_movable_nodes] + placedb.node_size_y[:num_movable_nodes] / 2, minlength=num_clusters) / counts
+
+    dtype = placedb.node_size_x.dtype
+    db.num_physical_nodes = num_clusters + num_fixed_nodes
+    db.node_size_x = np.concatenate([size_x.astype(dtype), placedb.node_size_x[num_movable_nodes:]])
+    db.node_size_y = np.concatenate([size_y.astype(dtype), placedb.node_size_y[num_movable_nodes:]])
+    db.node_x = np.concatenate([(center_x - size_x / 2).astype(dtype), placedb.node_x[num_movable_nodes:]])
+    db.node_y = np.concatenate([(center_y - size_y / 2).astype(dtype), placedb.node_y[num_movable_nodes:]])
+    db.node_names = np.concatenate([np.array(["cluster%d" % (i) for i in range(num_clusters)], dtype=np.string_), placedb.node_names[num_movable_nodes:]])
+    db.node_name2id_map = {}
+    db.node_orient = np.concatenate([np.full(num_clusters, b"N", dtype=placedb.node_orient.dtype), placedb.node_orient[num_movable_nodes:]])
+    db.node2orig_node_map = None
+    if placedb.movable_macro_mask is not None:
+        db.movable_macro_mask = np.zeros(num_clusters, dtype=bool)
+        db.movable_macro_mask[clusters[placedb.movable_macro_mask]] = True
+    cluster_regions = np.zeros(num_clusters, dtype=placedb.node2fence_region_map.dtype)
+    cluster_regions[clusters] = placedb.node2fence_region_map[:num_movable_nodes]
+    db.node2fence_region_map = np.concatenate([cluster_regions, placedb.node2fence_region_map[num_movable_nodes:]])
+    if len(placedb.regions) > 0:
+        db.num_movable_nodes_fence_region = np.bincount(np.minimum(cluster_regions, len(placedb.regions)), minlength=len(placedb.regions) + 1)
+
+    # pins of the nets spanning more than one node, in net order
+    node_map = np.concatenate([clusters, np.arange(num_clusters, num_clusters + num_fixed_nodes)])
+    pin_nodes = node_map[placedb.pin2node_map]
+    start_map = placedb.flat_net2pin_start_map.astype(np.int64)
+    degrees = start_map[1:] - start_map[:-1]
+    nonempty = np.nonzero(degrees > 0)[0]
+    slot_nodes = pin_nodes[placedb.flat_net2pin_map]
+    nets = np.zeros(len(degrees), dtype=bool)
+    if nonempty.size:
+        nets[nonempty] = np.minimum.reduceat(slot_nodes, start_map[nonempty]) != np.maximum.reduceat(slot_nodes, start_map[nonempty])
+    slot_nets = np.repeat(np.arange(len(degrees)), degrees)
+    pins = placedb.flat_net2pin_map[nets[slot_nets]]
+    net_degrees = degrees[nets]
+
+    index_dtype = placedb.pin2node_map.dtype
+    db.pin2node_map = pin_nodes[pins].astype(index_dtype)
+    db.pin2net_map = np.repeat(np.arange(net_degrees.size), net_degrees).astype(placedb.pin2net_map.dtype)
+    db.flat_net2pin_map = np.arange(pins.size).astype(placedb.flat_net2pin_map.dtype)
+    db.flat_net2pin_start_map = np.concatenate([[0], np.cumsum(net_degrees)]).astype(placedb.flat_net2pin_start_map.dtype)
+    db.net2pin_map = np.split(db.flat_net2pin_map, db.flat_net2pin_start_map[1:-1])
+    db.flat_node2pin_map = np.argsort(db.pin2node_map, kind="stable").astype(placedb.flat_node2pin_map.dtype)
+    db.flat_node2pin_start_map = np.concatenate([[0], np.cumsum(np.bincount(db.pin2node_map, minlength=db.num_physical_nodes))]).astype(placedb.flat_node2pin_start_map.dtype)
+    db.node2pin_map = np.split(db.flat_node2pin_map, db.flat_node2pin_start_map[1:-1])
+    db.num_movable_pins = int(np.count_nonzero(db.pin2node_map < num_clusters))
+    db.movable_macro_pins = np.isin(db.pin2node_map, np.nonzero(db.movable_macro_mask)[0]) if db.movable_macro_mask is not None else None
+
+    # pins of clusters sit at the center, pins of single nodes keep their offsets
+    pin_clustered = (db.pin2node_map < num_clusters) & ~singles[np.minimum(db.pin2node_map, num_clusters - 1)]
+    db.pin_offset_x = np.where(pin_clustered, db.node_size_x[db.pin2node_map] / 2, placedb.pin_offset_x[pins]).astype(placedb.pin_offset_x.dtype)
+    db.pin_offset_y = np.where(pin_clustered, db.node_size_y[db.pin2node_map] / 2, placedb.pin_offset_y[pins]).astype(placedb.pin_offset_y.dtype)
+    for name in ["pin_direct", "pin_names"]:
+        if getattr(placedb, name, None) is not None:
+            setattr(db, name, getattr(placedb, name)[pins])
+    for name in ["net_names", "net_weights", "net_weight_deltas", "net_criticality", "net_criticality_deltas"]:
+        if getattr(placedb, name, None) is not None:
+            setattr(db, name, getattr(placedb, name)[nets])
+    db.net_name2id_map = {}
+    db.pin_name2id_map = {}
+
+    logging.info("clustered netlist: %d movable nodes, %d nets, %d pins" % (num_clusters, db.num_nets, db.num_pins))
+    return db
+
+
+def decluster(placedb, coarse_db, clusters, coarse_pos, pos):
+    """
+    @brief initial positions of the flat netlist from the placement of the clustered netlist.
+    Cells are scattered uniformly inside the footprint of their cluster, fillers take the positions of the coarse fillers.
+    @param placedb placement database of the flat netlist
+    @param coarse_db placement database of the clustered netlist
+    @param clusters cluster of each movable node
+    @param coarse_pos positions of the clustered netlist, x followed by y
+    @param pos positions of the flat netlist to update
+    @return pos
+    """
+    num_movable_nodes = placedb.num_movable_nodes
+    num_clusters = coarse_db.num_movable_nodes
+    for offset, coarse_offset, xl, xh, size, coarse_size in [
+            (0, 0, placedb.xl, placedb.xh, placedb.node_size_x, coarse_db.node_size_x),
+            (placedb.num_nodes, coarse_db.num_nodes, placedb.yl, placedb.yh, placedb.node_size_y, coarse_db.node_size_y)]:
+        slack = np.maximum(coarse_size[:num_clusters][clusters] - size[:num_movable_nodes], 0)
+        loc = coarse_pos[coarse_offset:coarse_offset + num_clusters][clusters] + np.random.uniform(0, 1, num_movable_nodes) * slack
+        pos[offset:offset + num_movable_nodes] = np.clip(loc, xl, xh - size[:num_movable_nodes])
+        # the same fillers are placed in both netlists
+        pos[offset + placedb.num_physical_nodes:offset + placedb.num_nodes] = \
+                coarse_pos[coarse_offset + coarse_db.num_physical_nodes:coarse_offset + coarse_db.num_nodes]
+    return pos
@@ -1,7 +1,12 @@
 import math
+import itertools
 import torch
 from torch.optim.optimizer import Optimizer, required
 
+# ids tagged on the iterates whenever they are written, unique across optimizers;
+# PlaceObj memoizes objective terms by them
+iterate_ids = itertools.count()
+
 class CusOptimizer(Optimizer):
     """
     @brief Dreamplace Custom Optimizer
@@ -44,6 +49,8 @@ class CusOptimizer(Optimizer):
         # Ensure only a single tensor is passed in the parameter group
         if len(self.param_groups) != 1:
             raise ValueError("Only parameters with a single tensor are supported")
+        for p in self.param_groups[0]['params']:
+            p.iterate_id = next(iterate_ids)  # p becomes v_k in the first step
 
     def step(self, closure=None):
         """
@@ -80,6 +87,7 @@ class CusOptimizer(Optimizer):
                     group['a_k'].append(torch.ones(1, dtype=g_k.dtype, device=g_k.device))  # Initialize a_k
                     group['v_k_1'].append(torch.autograd.Variable(torch.zeros_like(v_k), requires_grad=True))
                     group['v_k_1'][i].data.copy_(group['v_k'][i] - group['lr'] * g_k)      # Initialize v_k_1
+                    group['v_k_1'][i].iterate_id = next(iterate_ids)
 
                 a_k = group['a_k'][i]  # Optimization parameter a_k for acceleration
                 v_k_1 = group['v_k_1'][i]  # Previous reference solution v_k^(k-1)
@@ -119,7 +127,8 @@ class CusOptimizer(Optimizer):
                     lip_step_size = (s_k.norm(p=2) / y_k.norm(p=2)).data
 
                     # Choose the step size: prefer BB short step size, fallback to other estimates
-                    step_size = bb_short_step_size if bb_short_step_size > 0 else min(lip_step_size, alpha_k)
+                    # (selected on the device to avoid a host synchronization)
+                    step_size = torch.where(bb_short_step_size > 0, bb_short_step_size, torch.min(lip_step_size, alpha_k))
 
                 # Perform one optimization step (Nesterov update)
                 u_kp1 = v_k - step_size * g_k  # Gradient descent update for u_k
@@ -131,9 +140,11 @@ class CusOptimizer(Optimizer):
                 # Update internal states for the next iteration
                 group['obj_eval_count'] += 1
                 v_k_1.data.copy_(v_k.data)  # Update previous reference solution
+                v_k_1.iterate_id = v_k.iterate_id
                 alpha_k.data.copy_(step_size.data)  # Update step size
                 u_k.data.copy_(u_kp1.data)  # Update major solution
                 v_k.data.copy_(v_kp1.data)  # Update reference solution
+                v_k.iterate_id = next(iterate_ids)
                 a_k.data.copy_(a_kp1.data)  # Update acceleration parameter
 
         return loss
\ No newline at end of file
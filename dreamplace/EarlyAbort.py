@@ -0,0 +1,95 @@
+##
+# @file   EarlyAbort.py
+# @brief  Stop hopeless global placement runs against a baseline trajectory envelope
+#
+
+import os
+import json
+import bisect
+import logging
+
+
+class PlacementAborted(Exception):
+    """
+    @brief raised when the global placement trajectory leaves the envelope.
+    The run is censored: its true final HPWL is unknown and assumed to be at least censored_hpwl.
+    """
+    def __init__(self, reason, iteration, hpwl, overflow, censored_hpwl):
+        super(PlacementAborted, self).__init__(reason)
+        self.reason = reason
+        self.iteration = iteration
+        self.hpwl = hpwl
+        self.overflow = overflow
+        self.censored_hpwl = censored_hpwl
+
+
+class TrajectoryEnvelope(object):
+    """
+    @brief envelope around a baseline global placement trajectory.
+    A run is aborted once its overflow is above the baseline overflow at the same iteration by overflow_margin,
+    or its HPWL is above hpwl_ratio times the baseline HPWL.
+    """
+    def __init__(self, trajectory, final_hpwl, min_iteration, overflow_margin, hpwl_ratio, censor_ratio):
+        """
+        @param trajectory list of [iteration, hpwl, overflow, density_weight] of the baseline, sorted by iteration
+        @param final_hpwl final HPWL of the baseline
+        @param min_iteration no check before this iteration
+        @param overflow_margin allowed absolute overflow above the baseline, non-positive to disable
+        @param hpwl_ratio allowed HPWL ratio to the baseline, non-positive to disable
+        @param censor_ratio censored HPWL of an aborted run is censor_ratio * final_hpwl
+        """
+        self.iterations = [int(i[0]) for i in trajectory]
+        self.trajectory = trajectory
+        self.final_hpwl = final_hpwl
+        self.min_iteration = min_iteration
+        self.overflow_margin = overflow_margin
+        self.hpwl_ratio = hpwl_ratio
+        self.censor_ratio = censor_ratio
+
+    @staticmethod
+    def load(params, design_name):
+        """
+        @brief build the envelope from the last record of the design in params.abort_reference_file
+        @return None if early abort is disabled or no reference trajectory exists
+        """
+        if not params.abort_reference_file or not os.path.exists(params.abort_reference_file):
+            return None
+        reference = None
+        with open(params.abort_reference_file, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    if record.get("design") == design_name and record.get("trajectory"):
+                        reference = record
+        if reference is None:
+            logging.warning("no reference trajectory of %s in %s, early abort disabled" % (design_name, params.abort_reference_file))
+            return None
+        logging.info("early abort against %d-iteration reference trajectory, overflow margin %g, HPWL ratio %g"
+                % (len(reference["trajectory"]), params.abort_overflow_margin, params.abort_hpwl_ratio))
+        return TrajectoryEnvelope(reference["trajectory"], reference["hpwl"],
+                params.abort_min_iteration, params.abort_overflow_margin,
+                params.abort_hpwl_ratio, params.abort_censor_ratio)
+
+    def reference(self, iteration):
+        """
+        @brief baseline (hpwl, overflow) at the iteration, the last point once the baseline has stopped
+        """
+        index = max(bisect.bisect_right(self.iterations, iteration) - 1, 0)
+        return self.trajectory[index][1], self.trajectory[index][2]
+
+    def check(self, iteration, hpwl, overflow):
+        """
+        @brief raise PlacementAborted if the point is outside the envelope
+        """
+        if iteration < self.min_iteration:
+            return
+        ref_hpwl, ref_overflow = self.reference(iteration)
+        reason = None
+        if self.overflow_margin > 0 and overflow > ref_overflow + self.overflow_margin:
+            reason = "overflow %g > baseline %g + %g" % (overflow, ref_overflow, self.overflow_margin)
+        elif self.hpwl_ratio > 0 and hpwl > ref_hpwl * self.hpwl_ratio:
+            reason = "HPWL %g > baseline %g * %g" % (hpwl, ref_hpwl, self.hpwl_ratio)
+        if reason is not None:
+            logging.warning("early abort at iteration %d: %s" % (iteration, reason))
+            raise PlacementAborted(reason, iteration, hpwl, overflow, self.final_hpwl * self.censor_ratio)
@@ -97,6 +97,31 @@ class EvalMetrics (object):
         """
         return self.__str__()
 
+    def toDict(self):
+        """
+        @brief convert to a json-serializable dictionary of python floats;
+        multi-region values are kept as lists
+        """
+        def convert(value):
+            if value is None:
+                return None
+            if torch.is_tensor(value):
+                value = value.detach().cpu()
+                return value.item() if value.numel() == 1 else value.tolist()
+            return float(value)
+
+        return {
+                "iteration" : self.iteration,
+                "objective" : convert(self.objective),
+                "hpwl" : convert(self.hpwl),
+                "overflow" : convert(self.overflow),
+                "max_density" : convert(self.max_density),
+                "density_weight" : convert(self.density_weight),
+                "gamma" : convert(self.gamma),
+                "tns" : convert(self.tns),
+                "wns" : convert(self.wns)
+                }
+
     def evaluate(self, placedb, ops, var, data_collections=None):
         """
         @brief evaluate metrics
@@ -139,3 +164,43 @@ class EvalMetrics (object):
                 pin_utilization_map_sum = pin_utilization_map.sum()
                 self.pin_utilization = pin_utilization_map.sub_(1).clamp_(min=0).sum() / pin_utilization_map_sum
         self.eval_time = time.time() - tt
+
+
+class MetricRing (object):
+    """
+    @brief per-iteration HPWL, overflow and density weight kept on the device
+    and read back to the host in one transfer every capacity iterations
+    """
+    def __init__(self, capacity, dtype, device):
+        """
+        @param capacity number of iterations between two read-backs
+        @param dtype data type of the metrics
+        @param device device of the metrics
+        """
+        self.values = torch.zeros(capacity, 3, dtype=dtype, device=device)
+        self.metrics = []
+
+    def push(self, metric, density_weight):
+        """
+        @brief record the metric of one iteration without synchronization
+        @param metric EvalMetrics with hpwl and overflow on the device
+        @param density_weight density weight of the iteration
+        """
+        row = self.values[len(self.metrics)]
+        row[0].copy_(metric.hpwl.reshape([]))
+        row[1].copy_(metric.overflow.reshape(-1)[-1])
+        row[2].copy_(density_weight.reshape([]))
+        self.metrics.append(metric)
+
+    def full(self):
+        return len(self.metrics) == self.values.size(0)
+
+    def flush(self):
+        """
+        @brief read back the recorded iterations and empty the ring
+        @return list of (metric, [hpwl, overflow, density weight]) on the host
+        """
+        values = self.values[:len(self.metrics)].cpu().tolist()
+        rows = list(zip(self.metrics, values))
+        self.metrics = []
+        return rows
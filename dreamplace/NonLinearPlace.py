@@ -26,6 +26,9 @@ import PlaceObj
 import NesterovAcceleratedGradientOptimizer
 import CustomOptimizer
 import EvalMetrics
+import EarlyAbort
+import StepGraph
+import Clustering
 import pdb
 import dreamplace.ops.fence_region.fence_region as fence_region
 
@@ -44,6 +47,101 @@ class NonLinearPlace(BasicPlace.BasicPlace):
         @param timer the timing analysis engine
         """
         super(NonLinearPlace, self).__init__(params, placedb, timer)
+        # modules the model and the custom optimizer are built from in each stage,
+        # PlacerSession swaps them between runs without rebuilding the ops
+        self.place_obj_module = PlaceObj
+        self.custom_optimizer_module = CustomOptimizer
+
+    def cluster_init(self, params, placedb):
+        """
+        @brief start global placement from the placement of a clustered netlist.
+        The clustered netlist is placed by a placer of the same class on a coarse PlaceDB view,
+        then its clusters are declustered into the current positions.
+        @param params parameters
+        @param placedb placement database
+        """
+        tt = time.time()
+        clusters, num_clusters = Clustering.best_choice_clustering(params, placedb)
+        coarse_db = Clustering.coarsen_placedb(placedb, clusters, num_clusters)
+        coarse_params = copy.deepcopy(params)
+        for key, value in Clustering.coarse_place_overrides.items():
+            coarse_params.__dict__[key] = value
+        coarse_params.stop_overflow = max(params.stop_overflow, params.cluster_stop_overflow)
+        coarse_placer = type(self)(coarse_params, coarse_db, None)
+        coarse_placer.place_obj_module = self.place_obj_module
+        coarse_placer.custom_optimizer_module = self.custom_optimizer_module
+        coarse_placer(coarse_params, coarse_db)
+
+        pos = Clustering.decluster(placedb, coarse_db, clusters,
+                coarse_placer.pos[0].data.cpu().numpy(), self.pos[0].data.cpu().numpy())
+        with torch.no_grad():
+            self.pos[0].data.copy_(torch.from_numpy(pos).to(self.pos[0].device))
+        self.result_record["cluster_place"] = {"num_clusters": num_clusters, "iteration": coarse_placer.result_record["iteration"],
+                "time": time.time() - tt}
+        logging.info("placement of %d clusters takes %d iterations, %.2f seconds"
+                % (num_clusters, coarse_placer.result_record["iteration"], time.time() - tt))
+
+    def bin_levels(self, params, placedb, global_place_params):
+        """
+        @brief coarse-to-fine bin grids of a global placement stage.
+        Grids are halved from the grid of the stage down to params.bin_schedule_min_bins.
+        @param params parameters
+        @param placedb placement database
+        @param global_place_params global placement parameters of the stage
+        @return stage parameters of each grid from the coarsest one, the last is global_place_params
+        """
+        levels = [global_place_params]
+        # fence regions and routability area adjustment are bound to the grid they start with
+        if not params.bin_schedule_flag or len(placedb.regions) > 0 or params.routability_opt_flag:
+            return levels
+        num_bins_x = global_place_params["num_bins_x"] if "num_bins_x" in global_place_params and global_place_params["num_bins_x"] > 1 else placedb.num_bins_x
+        num_bins_y = global_place_params["num_bins_y"] if "num_bins_y" in global_place_params and global_place_params["num_bins_y"] > 1 else placedb.num_bins_y
+        while num_bins_x % 2 == 0 and num_bins_y % 2 == 0 and min(num_bins_x, num_bins_y) // 2 >= params.bin_schedule_min_bins:
+            num_bins_x //= 2
+            num_bins_y //= 2
+            levels.insert(0, dict(global_place_params, num_bins_x=num_bins_x, num_bins_y=num_bins_y))
+        return levels
+
+    def promote_bin_level(self, params, placedb, model, optimizer, global_place_params):
+        """
+        @brief continue global placement on a finer bin grid.
+        The optimizer keeps its state, and the density weight is rescaled
+        so that the density gradient at the current position keeps its magnitude.
+        @param params parameters
+        @param placedb placement database
+        @param model placement model of the coarser grid
+        @param optimizer optimizer of the stage
+        @param global_place_params stage parameters of the finer grid
+        @return placement model of the finer grid
+        """
+        pos = self.pos[0]
+
+        def density_grad_norm(density_op):
+            if pos.grad is not None:
+                pos.grad.zero_()
+            density_op(pos).backward()
+            grad_norm = pos.grad.norm(p=1)
+            pos.grad.zero_()
+            return grad_norm
+
+        coarse_grad_norm = density_grad_norm(model.op_collections.density_op)
+        fine_model = self.place_obj_module.PlaceObj(
+            model.density_weight.mean().item(),
+            params,
+            placedb,
+            self.data_collections,
+            self.op_collections,
+            global_place_params,
+        ).to(pos.device)
+        fine_model.density_weight.mul_(coarse_grad_norm / density_grad_norm(fine_model.op_collections.density_op))
+        fine_model.quad_penalty = model.quad_penalty
+        fine_model.density_factor = model.density_factor
+        fine_model.fix_nodes_mask = model.fix_nodes_mask
+        fine_model.train()
+        optimizer.obj_and_grad_fn = fine_model.obj_and_grad_fn
+        logging.info("promote global placement to %dx%d bins, density_weight = %.6E"
+                % (fine_model.num_bins_x, fine_model.num_bins_y, fine_model.density_weight.mean()))
+        return fine_model
 
     def __call__(self, params, placedb):
         """
@@ -53,6 +151,12 @@ class NonLinearPlace(BasicPlace.BasicPlace):
         """
         iteration = 0
         all_metrics = []
+        # machine-readable summary of this run, see Placer.place
+        self.result_record = {"global_place": [], "legalize": None, "detailed_place": None, "trajectory": []}
+        # stop early if the trajectory falls out of a baseline envelope
+        envelope = EarlyAbort.TrajectoryEnvelope.load(params, params.design_name())
+        # per-iteration messages are demoted to DEBUG for quiet runs
+        log_iteration = logging.info if params.log_iteration_flag else logging.debug
         if params.timing_opt_flag:
             timing_op = self.op_collections.timing_op
             time_unit = timing_op.timer.time_unit()
@@ -60,6 +164,9 @@ class NonLinearPlace(BasicPlace.BasicPlace):
         # global placement
         if params.global_place_flag:
 
+            if params.cluster_flag:
+                self.cluster_init(params, placedb)
+
             global_place_stages  = params.global_place_stages
             # macro place use external 1 stage to place macros
             if params.macro_place_flag:
@@ -94,6 +201,9 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                 # As global placement may easily diverge, we record the position of best overflow
                 best_metric = [None]
                 best_pos = [None]
+                # overflow of best_pos on the device and of best_metric on the host, for asynchronous metrics
+                best_overflow = [None]
+                best_host_overflow = [None]
 
                 if params.gpu:
                     torch.cuda.synchronize()
@@ -104,14 +214,17 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                     density_weight = all_metrics[-1][-1][-1].density_weight.item() / params.two_stage_density_scaler
                     # at the 2nd stage, total_movable_node_area should exclude movable macro area to enable more aggresive spreading of cells
                     placedb.total_movable_node_area = placedb.total_movable_cell_area
+                # coarse-to-fine bin grids, the stage starts on the coarsest one
+                bin_levels = self.bin_levels(params, placedb, global_place_params)
+                bin_level = 0
                 # construct placement model
-                model = PlaceObj.PlaceObj(
+                model = self.place_obj_module.PlaceObj(
                     density_weight,
                     params,
                     placedb,
                     self.data_collections,
                     self.op_collections,
-                    global_place_params,
+                    bin_levels[bin_level],
                 ).to(self.data_collections.pos[0].device)
 
                 if params.macro_place_flag and macro_placed:
@@ -143,7 +256,7 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                     )
                     
                 elif optimizer_name.lower() == "custom":
-                    optimizer = CustomOptimizer.CusOptimizer(
+                    optimizer = self.custom_optimizer_module.CusOptimizer(
                         self.parameters(),
                         lr=0,
                         obj_and_grad_fn=model.obj_and_grad_fn,
@@ -154,29 +267,56 @@ class NonLinearPlace(BasicPlace.BasicPlace):
 
                 logging.info("use %s optimizer" % (optimizer_name))
                 model.train()
-                # defining evaluation ops
-                eval_ops = {
-                    # "wirelength" : self.op_collections.wirelength_op,
-                    # "density" : self.op_collections.density_op,
-                    # "objective" : model.obj_fn,
-                    "hpwl": self.op_collections.hpwl_op,
-                    "overflow": self.op_collections.density_overflow_op,
-                }
-                if params.routability_opt_flag:
-                    eval_ops.update(
-                        {
-                            "route_utilization": self.op_collections.route_utilization_map_op,
-                            "pin_utilization": self.op_collections.pin_utilization_map_op,
-                        }
-                    )
-                if len(placedb.regions) > 0:
-                    eval_ops.update(
-                        {
-                            "density": self.op_collections.fence_region_density_merged_op,
-                            "overflow": self.op_collections.fence_region_density_overflow_merged_op,
-                            "goverflow": self.op_collections.density_overflow_op,
-                        }
-                    )
+                # replay the step as a CUDA graph, the line search of nesterov needs eager control flow
+                step_graph = None
+                if params.step_graph_flag and params.gpu and optimizer_name.lower() == "custom" \
+                        and hasattr(model, "graph_mode"):
+                    step_graph = StepGraph.StepGraph(optimizer, model)
+                # defining evaluation ops, rebuilt with the model on a finer bin grid
+                def build_eval_ops():
+                    eval_ops = {
+                        # "wirelength" : self.op_collections.wirelength_op,
+                        # "density" : self.op_collections.density_op,
+                        # "objective" : model.obj_fn,
+                        "hpwl": self.op_collections.hpwl_op,
+                        "overflow": self.op_collections.density_overflow_op,
+                    }
+                    if params.routability_opt_flag:
+                        eval_ops.update(
+                            {
+                                "route_utilization": self.op_collections.route_utilization_map_op,
+                                "pin_utilization": self.op_collections.pin_utilization_map_op,
+                            }
+                        )
+                    # HPWL and overflow come from the objective evaluated at the same position
+                    # a captured step does not go through the memo, so its position would be evaluated twice
+                    fused_metrics = getattr(model, "fused_metrics", False) and step_graph is None
+                    if fused_metrics:
+                        eval_ops.update(
+                            {
+                                "hpwl": model.fused_hpwl_op,
+                                "overflow": model.fused_overflow_op,
+                            }
+                        )
+                    if len(placedb.regions) > 0:
+                        eval_ops.update(
+                            {
+                                "density": self.op_collections.fence_region_density_merged_op,
+                                "overflow": self.op_collections.fence_region_density_overflow_merged_op,
+                                "goverflow": self.op_collections.density_overflow_op,
+                            }
+                        )
+                    return eval_ops, fused_metrics
+
+                eval_ops, fused_metrics = build_eval_ops()
+
+                # without fence regions, per-iteration metrics stay on the device and are
+                # read back every metric_sync_interval iterations, stopping and divergence checks run then
+                async_metrics = params.metric_sync_interval > 1 and len(placedb.regions) == 0
+                metric_ring = EvalMetrics.MetricRing(
+                    max(params.metric_sync_interval, 1), self.pos[0].dtype, self.pos[0].device
+                )
+                density_weight_ready = [False]
 
                 # a function to initialize learning rate
                 def initialize_learning_rate(pos):
@@ -315,15 +455,18 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                     self.op_collections.move_boundary_op(pos)
 
                     # handle multiple density weights for multi-electric field
-                    if torch.eq(model.density_weight.mean(), 0.0):
-                        model.initialize_density_weight(params, placedb)
-                        if model.density_weight.size(0) == 1:
-                            logging.info("density_weight = %.6E" % (model.density_weight.data))
-                        else:
-                            logging.info(
-                                "density_weight = [%s]"
-                                % ", ".join(["%.3E" % i for i in model.density_weight.cpu().numpy().tolist()])
-                            )
+                    # it never returns to zero once initialized, so only check until then
+                    if not density_weight_ready[0]:
+                        if torch.eq(model.density_weight.mean(), 0.0):
+                            model.initialize_density_weight(params, placedb)
+                            if model.density_weight.size(0) == 1:
+                                logging.info("density_weight = %.6E" % (model.density_weight.data))
+                            else:
+                                logging.info(
+                                    "density_weight = [%s]"
+                                    % ", ".join(["%.3E" % i for i in model.density_weight.cpu().numpy().tolist()])
+                                )
+                        density_weight_ready[0] = True
 
                     # For backward compatibility
                     # PyTorch 1.7 introduced zero_grad(set_to_none=False)
@@ -334,6 +477,9 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                         optimizer.zero_grad()
 
                     # t1 = time.time()
+                    if fused_metrics:
+                        # memoized, the optimizer step evaluates the same position again
+                        model.obj_and_grad_fn(pos)
                     cur_metric.evaluate(placedb, eval_ops, pos, model.data_collections)
                     model.overflow = cur_metric.overflow.data.clone()
                     # logging.debug("evaluation %.3f ms" % ((time.time()-t1)*1000))
@@ -362,10 +508,12 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                                 ### don't update cell location in that region
                                 mask = self.op_collections.fence_region_density_ops[region_id].pos_mask
                                 pos.data.masked_scatter_(mask, pos_bk[mask])
+                    elif step_graph is not None:
+                        step_graph.step()
                     else:
                         optimizer.step()
 
-                    logging.info("optimizer step %.3f ms" % ((time.time() - t3) * 1000))
+                    log_iteration("optimizer step %.3f ms" % ((time.time() - t3) * 1000))
 
                     # Perform timing-opt.
                     if params.global_place_flag and params.timing_opt_flag and \
@@ -389,6 +537,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                             # Copy weights from placedb.net_weights to device.
                             self.data_collections.net_weights.copy_(
                                 torch.from_numpy(placedb.net_weights))
+                        if hasattr(self.data_collections, "net_weights_updated"):
+                            self.data_collections.net_weights_updated()
                         logging.info("net-weight update step %.3f ms" % \
                             ((time.time() - beg) * 1000))
 
@@ -404,8 +554,21 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                     elif optimizer_name.lower() == "custom":
                         cur_metric.objective = optimizer.param_groups[0]["obj_k_1"][0].data.clone()
 
+                    if async_metrics:
+                        # the metric is reported when the ring is read back,
+                        # best_metric follows then, best_pos is selected on the device
+                        if best_pos[0] is None:
+                            best_pos[0] = self.pos[0].data.clone()
+                            best_overflow[0] = cur_metric.overflow[-1].clone()
+                        else:
+                            better = cur_metric.overflow[-1] < best_overflow[0]
+                            best_overflow[0] = torch.where(better, cur_metric.overflow[-1], best_overflow[0])
+                            best_pos[0].data.copy_(torch.where(better, self.pos[0].data, best_pos[0].data))
+                        log_iteration("full step %.3f ms" % ((time.time() - t0) * 1000))
+                        return
+
                     # actually reports the metric before step
-                    logging.info(cur_metric)
+                    log_iteration(cur_metric)
                     # record the best outer cell overflow
                     if best_metric[0] is None or best_metric[0].overflow[-1] > cur_metric.overflow[-1]:
                         best_metric[0] = cur_metric
@@ -414,7 +577,23 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                         else:
                             best_pos[0].data.copy_(self.pos[0].data)
 
-                    logging.info("full step %.3f ms" % ((time.time() - t0) * 1000))
+                    log_iteration("full step %.3f ms" % ((time.time() - t0) * 1000))
+
+                def sync_metrics():
+                    """
+                    read back the metrics recorded in the ring to the host lists and check the envelope
+                    """
+                    for metric, (hpwl, overflow, density_weight) in metric_ring.flush():
+                        overflow_list.append(overflow)
+                        divergence_list.append([hpwl, overflow])
+                        self.result_record["trajectory"].append([metric.iteration, hpwl, overflow, density_weight])
+                        if async_metrics:
+                            log_iteration(metric)
+                            if best_metric[0] is None or best_host_overflow[0] > overflow:
+                                best_metric[0] = metric
+                                best_host_overflow[0] = overflow
+                        if envelope is not None:
+                            envelope.check(metric.iteration, hpwl, overflow)
 
                 def check_plateau(x, window=10, threshold=0.001):
                     if len(x) < window:
@@ -512,6 +691,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                 stop_placement = 0
                 last_perturb_iter = -min_perturb_interval
                 perturb_counter = 0
+                # whether the host lists are up to date with the last iteration
+                metrics_synced = True
 
                 for Lgamma_step in range(model.Lgamma_iteration):
                     Lgamma_metrics.append([])
@@ -523,7 +704,7 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                         # for Lsub_step in range(50):  # magic number
                             ## divergence threshold should decrease as overflow decreases
                             ## only detect divergence when overflow is relatively low but not too low
-                            div_flag = check_divergence(
+                            div_flag = metrics_synced and check_divergence(
                                 # sometimes maybe too aggressive...
                                 divergence_list, window=50, threshold=overflow_list[-1])
                             if params.timing_opt_flag:
@@ -536,6 +717,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                                 and div_flag
                             ):
                                 self.pos[0].data.copy_(best_pos[0].data)
+                                if getattr(model, "obj_memo", None) is not None:
+                                    model.obj_memo.clear()
                                 stop_placement = 1
 
                                 logging.error(
@@ -547,17 +730,15 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                             )
 
                             if len(placedb.regions) == 0:
-                                overflow_list.append(Llambda_metrics[-1][-1].overflow.data.item())
-                                divergence_list.append(
-                                    [
-                                        Llambda_metrics[-1][-1].hpwl.data.item(),
-                                        Llambda_metrics[-1][-1].overflow.data.item(),
-                                    ]
-                                )
+                                metric_ring.push(Llambda_metrics[-1][-1], model.density_weight.data.mean())
+                                metrics_synced = metric_ring.full()
+                                if metrics_synced:
+                                    sync_metrics()
 
                             ## quadratic penalty and entropy injection
                             if (
                                 len(placedb.regions) == 0
+                                and metrics_synced
                                 and iteration - last_perturb_iter > min_perturb_interval
                                 and check_plateau(overflow_list, window=15, threshold=0.001)
                             ):
@@ -578,6 +759,9 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                                             noise_intensity=noise_intensity,
                                             mode="random",
                                         )
+                                        # the memo is keyed on optimizer iterates, the position moved under it
+                                        if getattr(model, "obj_memo", None) is not None:
+                                            model.obj_memo.clear()
                                         logging.info(
                                             f"Stuck at very early stage. Turn on entropy injection with noise intensity = {noise_intensity} to help convergence"
                                         )
@@ -657,6 +841,9 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                                 adjust_pin_area_flag,
                             )
                             logging.info(content)
+                            # node sizes may have changed, memoized density terms are stale
+                            if getattr(model, "obj_memo", None) is not None:
+                                model.obj_memo.clear()
                             if adjust_area_flag:
                                 num_area_adjust += 1
                                 # restart Llambda
@@ -668,12 +855,16 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                                 logging.info("density_weight = %.6E" % (model.density_weight.data))
                                 # load state to restart the optimizer
                                 optimizer.load_state_dict(initial_state)
+                                # the captured step refers to the replaced op buffers and optimizer states
+                                if step_graph is not None:
+                                    step_graph.reset()
                                 # must after loading the state
                                 initialize_learning_rate(pos)
                                 # increase iterations of the sub problem to slow down the search
                                 model.Lsub_iteration = model.routability_Lsub_iteration
 
-                                # reset best metric
+                                # reset best metric, the recorded iterations belong to the previous best
+                                sync_metrics()
                                 best_metric[0] = None
                                 best_pos[0] = None
 
@@ -686,7 +877,27 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                         model.op_collections.update_gamma_op(Lgamma_step, Llambda_metrics[-1][-1].overflow)
                     else:
                         model.op_collections.precondition_op.set_overflow(Llambda_metrics[-1][-1].overflow)
-                    if Lgamma_stop_criterion(Lgamma_step, Lgamma_metrics) or stop_placement == 1:
+                    stop_flag = metrics_synced and Lgamma_stop_criterion(Lgamma_step, Lgamma_metrics)
+                    # move to the next bin grid once the overflow on this one is low enough, never stop on a coarse grid
+                    if (
+                        bin_level + 1 < len(bin_levels)
+                        and stop_placement == 0
+                        and metrics_synced
+                        and (stop_flag or overflow_list[-1] < params.bin_schedule_overflow[min(bin_level, len(params.bin_schedule_overflow) - 1)])
+                    ):
+                        bin_level += 1
+                        model = self.promote_bin_level(params, placedb, model, optimizer, bin_levels[bin_level])
+                        model.op_collections.update_gamma_op(Lgamma_step, Llambda_metrics[-1][-1].overflow)
+                        if step_graph is not None:
+                            step_graph = StepGraph.StepGraph(optimizer, model)
+                        eval_ops, fused_metrics = build_eval_ops()
+                        # overflow on the finer grid is not comparable with the history
+                        best_metric[0] = None
+                        best_pos[0] = None
+                        overflow_list[:] = [1]
+                        del divergence_list[:]
+                        stop_flag = False
+                    if stop_flag or stop_placement == 1:
                         break
 
                     # update learning rate
@@ -695,6 +906,9 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                             for param_group in optimizer.param_groups:
                                 param_group["lr"] *= global_place_params["learning_rate_decay"]
 
+                # iterations since the last read-back
+                sync_metrics()
+
                 # in case of divergence, use the best metric
                 # last_metric = all_metrics[-1][-1][-1]
                 # if (
@@ -729,6 +943,15 @@ class NonLinearPlace(BasicPlace.BasicPlace):
 
 
                 logging.info("optimizer %s takes %.3f seconds" % (optimizer_name, time.time() - tt))
+                # evolved PlaceObj files may predate the memo
+                if getattr(model, "obj_memo", None) is not None:
+                    logging.info("objective memo hits %d, misses %d" % (model.obj_memo.hits, model.obj_memo.misses))
+                if step_graph is not None:
+                    logging.info("optimizer step graph captures %d, replays %d%s"
+                            % (step_graph.num_captures, step_graph.num_replays, ", failed" if step_graph.failed else ""))
+                stage_record = all_metrics[-1][-1][-1].toDict()
+                stage_record.update({"stage" : cur_stage, "optimizer" : optimizer_name, "time" : time.time() - tt})
+                self.result_record["global_place"].append(stage_record)
 
             # recover node size and pin offset for legalization, since node size is adjusted in global placement
             if params.routability_opt_flag:
@@ -770,7 +993,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
         if params.legalize_flag:
             tt = time.time()
             self.pos[0].data.copy_(self.op_collections.legalize_op(self.pos[0]))
-            logging.info("legalization takes %.3f seconds" % (time.time() - tt))
+            lg_time = time.time() - tt
+            logging.info("legalization takes %.3f seconds" % (lg_time))
             cur_metric = EvalMetrics.EvalMetrics(iteration)
             all_metrics.append(cur_metric)
             cur_metric.evaluate(placedb, {"hpwl": self.op_collections.hpwl_op}, self.pos[0])
@@ -793,6 +1017,8 @@ class NonLinearPlace(BasicPlace.BasicPlace):
                 cur_metric.wns = timing_op.timer.report_wns(split=1) / (time_unit * 1e15)
 
             logging.info(cur_metric)
+            self.result_record["legalize"] = cur_metric.toDict()
+            self.result_record["legalize"]["time"] = lg_time
             iteration += 1
 
         # plot placement
@@ -807,12 +1033,16 @@ class NonLinearPlace(BasicPlace.BasicPlace):
         if params.detailed_place_flag:
             tt = time.time()
             self.pos[0].data.copy_(self.op_collections.detailed_place_op(self.pos[0]))
-            logging.info("detailed placement takes %.3f seconds" % (time.time() - tt))
+            dp_time = time.time() - tt
+            logging.info("detailed placement takes %.3f seconds" % (dp_time))
             cur_metric = EvalMetrics.EvalMetrics(iteration)
             all_metrics.append(cur_metric)
             cur_metric.evaluate(placedb, {"hpwl": self.op_collections.hpwl_op}, self.pos[0])
             logging.info(cur_metric)
+            self.result_record["detailed_place"] = cur_metric.toDict()
+            self.result_record["detailed_place"]["time"] = dp_time
             iteration += 1
+        self.result_record["iteration"] = iteration
 
         # save results
         cur_pos = self.pos[0].data.clone().cpu().numpy()
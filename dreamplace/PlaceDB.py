@@ -10,6 +10,10 @@ import os
 import re
 import math
 import time
+import itertools
+import shutil
+import pickle
+import hashlib
 import numpy as np
 import torch
 import logging
@@ -24,6 +28,22 @@ datatypes = {
         'float64' : np.float64
         }
 
+# parameters that PlaceDB.read and PlaceDB.initialize depend on, part of the cache key
+cache_key_params = [
+        'dtype', 'sort_nets_by_degree', 'global_place_flag',
+        'scale_factor', 'shift_factor', 'num_bins_x', 'num_bins_y',
+        'target_density', 'enable_fillers', 'macro_place_flag',
+        'route_num_bins_x', 'route_num_bins_y',
+        'unit_horizontal_capacity', 'unit_vertical_capacity', 'max_net_weight'
+        ]
+# parameters updated by PlaceDB.initialize, replayed on a cache hit
+cache_updated_params = [
+        'shift_factor', 'scale_factor', 'num_bins_x', 'num_bins_y',
+        'target_density', 'macro_place_flag'
+        ]
+# members that are never cached
+cache_skipped_members = ['_rawdb', '_rawdb_params', 'pydb', 'device']
+
 class PlaceDB (object):
     """
     @brief placement database
@@ -33,6 +53,7 @@ class PlaceDB (object):
         initialization
         To avoid the usage of list, I flatten everything.
         """
+        self._rawdb_params = None # parameters to re-read raw database on demand after loading from cache
         self.rawdb = None # raw placement database, a C++ object
         self.pydb = None # python placement database interface
 
@@ -44,6 +65,7 @@ class PlaceDB (object):
         self.node_x = None # 1D array, cell position x
         self.node_y = None # 1D array, cell position y
         self.node_orient = None # 1D array, cell orientation
+        self.fixed_pl_content = None # .pl lines of the original fixed cells, which never move
         self.node_size_x = None # 1D array, cell width
         self.node_size_y = None # 1D array, cell height
 
@@ -121,6 +143,23 @@ class PlaceDB (object):
         self.max_net_weight = None # maximum net weight in timing opt
         self.dtype = None
 
+    @property
+    def rawdb(self):
+        """
+        @brief raw placement database.
+        When PlaceDB is restored from cache, the benchmark is only parsed
+        on the first access, e.g., when writing the solution.
+        """
+        if self._rawdb is None and self._rawdb_params is not None:
+            tt = time.time()
+            self._rawdb = place_io.PlaceIOFunction.read(self._rawdb_params)
+            logging.info("reading raw database takes %.3f seconds" % (time.time()-tt))
+        return self._rawdb
+
+    @rawdb.setter
+    def rawdb(self, rawdb):
+        self._rawdb = rawdb
+
     def scale_pl(self, shift_factor, scale_factor):
         """
         @brief scale placement solution only
@@ -368,14 +407,25 @@ class PlaceDB (object):
 
     def hpwl(self, x, y):
         """
-        @brief compute total HPWL
+        @brief compute total HPWL with segment reductions over flat_net2pin_map
         @param x horizontal cell locations
         @param y vertical cell locations
         @return hpwl of all nets
         """
-        wl = 0
-        for net_id in range(len(self.net2pin_map)):
-            wl += self.net_hpwl(x, y, net_id)
+        net_degrees = np.diff(self.flat_net2pin_start_map)
+        # np.maximum.reduceat cannot take empty segments, nets without pins have no wirelength
+        nonempty = net_degrees > 0
+        if not nonempty.any():
+            return 0.0
+        net_starts = self.flat_net2pin_start_map[:-1][nonempty]
+        pins = self.flat_net2pin_map
+        nodes = self.pin2node_map[pins]
+        net_weights = self.net_weights[nonempty]
+        wl = 0.0
+        for pos, pin_offset in ((x, self.pin_offset_x), (y, self.pin_offset_y)):
+            pin_pos = pos[nodes] + pin_offset[pins]
+            span = np.maximum.reduceat(pin_pos, net_starts) - np.minimum.reduceat(pin_pos, net_starts)
+            wl += np.dot(span.astype(np.float64), net_weights)
         return wl
 
     def sum_pin_weights(self, weights=None):
@@ -401,29 +451,47 @@ class PlaceDB (object):
 
     def density_map(self, x, y):
         """
-        @brief this density map evaluates the overlap between cell and bins
+        @brief this density map evaluates the overlap between cell and bins.
+        Every (cell, overlapped bin) pair is expanded and splatted with one bincount.
         @param x horizontal cell locations
         @param y vertical cell locations
         @return density map
         """
-        bin_index_xl = np.maximum(np.floor(x/self.bin_size_x).astype(np.int32), 0)
-        bin_index_xh = np.minimum(np.ceil((x+self.node_size_x)/self.bin_size_x).astype(np.int32), self.num_bins_x-1)
-        bin_index_yl = np.maximum(np.floor(y/self.bin_size_y).astype(np.int32), 0)
-        bin_index_yh = np.minimum(np.ceil((y+self.node_size_y)/self.bin_size_y).astype(np.int32), self.num_bins_y-1)
-
-        density_map = np.zeros([self.num_bins_x, self.num_bins_y])
-
-        for node_id in range(self.num_physical_nodes):
-            for ix in range(bin_index_xl[node_id], bin_index_xh[node_id]+1):
-                for iy in range(bin_index_yl[node_id], bin_index_yh[node_id]+1):
-                    density_map[ix, iy] += self.overlap(
-                            self.bin_xl(ix), self.bin_yl(iy), self.bin_xh(ix), self.bin_yh(iy),
-                            x[node_id], y[node_id], x[node_id]+self.node_size_x[node_id], y[node_id]+self.node_size_y[node_id]
-                            )
-
-        for ix in range(self.num_bins_x):
-            for iy in range(self.num_bins_y):
-                density_map[ix, iy] /= (self.bin_xh(ix)-self.bin_xl(ix))*(self.bin_yh(iy)-self.bin_yl(iy))
+        num_nodes = self.num_physical_nodes
+        node_xl = np.asarray(x[:num_nodes], dtype=np.float64)
+        node_yl = np.asarray(y[:num_nodes], dtype=np.float64)
+        node_xh = node_xl + self.node_size_x[:num_nodes]
+        node_yh = node_yl + self.node_size_y[:num_nodes]
+
+        bin_index_xl = np.clip(np.floor((node_xl - self.xl) / self.bin_size_x), 0, self.num_bins_x - 1).astype(np.int64)
+        bin_index_xh = np.clip(np.floor((node_xh - self.xl) / self.bin_size_x), 0, self.num_bins_x - 1).astype(np.int64)
+        bin_index_yl = np.clip(np.floor((node_yl - self.yl) / self.bin_size_y), 0, self.num_bins_y - 1).astype(np.int64)
+        bin_index_yh = np.clip(np.floor((node_yh - self.yl) / self.bin_size_y), 0, self.num_bins_y - 1).astype(np.int64)
+        span_x = np.maximum(bin_index_xh - bin_index_xl + 1, 0)
+        span_y = np.maximum(bin_index_yh - bin_index_yl + 1, 0)
+
+        # expand cells to (cell, bin) pairs
+        num_pairs = span_x * span_y
+        pair_nodes = np.repeat(np.arange(num_nodes), num_pairs)
+        pair_offsets = np.arange(pair_nodes.size) - np.repeat(np.cumsum(num_pairs) - num_pairs, num_pairs)
+        ix = bin_index_xl[pair_nodes] + pair_offsets // span_y[pair_nodes]
+        iy = bin_index_yl[pair_nodes] + pair_offsets % span_y[pair_nodes]
+
+        bin_xl = self.xl + ix * self.bin_size_x
+        bin_yl = self.yl + iy * self.bin_size_y
+        overlap_x = np.minimum(node_xh[pair_nodes], np.minimum(bin_xl + self.bin_size_x, self.xh)) - np.maximum(node_xl[pair_nodes], bin_xl)
+        overlap_y = np.minimum(node_yh[pair_nodes], np.minimum(bin_yl + self.bin_size_y, self.yh)) - np.maximum(node_yl[pair_nodes], bin_yl)
+        overlap = np.maximum(overlap_x, 0.0) * np.maximum(overlap_y, 0.0)
+
+        density_map = np.bincount(ix * self.num_bins_y + iy, weights=overlap,
+                minlength=self.num_bins_x * self.num_bins_y).reshape(self.num_bins_x, self.num_bins_y)
+
+        # bins at the right and top boundary may be clipped by the layout
+        bin_xl = self.xl + np.arange(self.num_bins_x) * self.bin_size_x
+        bin_yl = self.yl + np.arange(self.num_bins_y) * self.bin_size_y
+        bin_width = np.minimum(bin_xl + self.bin_size_x, self.xh) - bin_xl
+        bin_height = np.minimum(bin_yl + self.bin_size_y, self.yh) - bin_yl
+        density_map /= np.outer(bin_width, bin_height)
 
         return density_map
 
@@ -660,11 +728,117 @@ class PlaceDB (object):
         """
         tt = time.time()
 
-        self.read(params)
-        self.initialize(params)
+        cache_path = None
+        if params.placedb_cache_dir:
+            cache_path = os.path.join(params.placedb_cache_dir, "%s.%s" % (params.design_name(), self.cache_key(params)))
+        if cache_path is None or not self.load_cache(params, cache_path):
+            self.read(params)
+            self.initialize(params)
+            if cache_path is not None:
+                self.save_cache(params, cache_path)
 
         logging.info("reading benchmark takes %g seconds" % (time.time()-tt))
 
+    def input_files(self, params):
+        """
+        @brief benchmark files read by place_io
+        @param params parameters
+        """
+        filenames = []
+        if params.aux_input:
+            filenames.append(params.aux_input)
+            # Bookshelf files listed in .aux
+            benchmark_dir = os.path.dirname(params.aux_input)
+            with open(params.aux_input, "r") as f:
+                for line in f:
+                    for token in line.split():
+                        filename = os.path.join(benchmark_dir, token)
+                        if token != ":" and os.path.isfile(filename):
+                            filenames.append(filename)
+        if params.lef_input:
+            filenames.extend(params.lef_input if isinstance(params.lef_input, list) else [params.lef_input])
+        if params.def_input:
+            filenames.append(params.def_input)
+        if params.verilog_input:
+            filenames.append(params.verilog_input)
+        return filenames
+
+    def cache_key(self, params):
+        """
+        @brief content hash of the benchmark files and the parameters read and initialize depend on
+        @param params parameters
+        """
+        sha = hashlib.sha1()
+        for filename in self.input_files(params):
+            sha.update(os.path.basename(filename).encode())
+            with open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 24), b""):
+                    sha.update(chunk)
+        for key in cache_key_params:
+            sha.update(("%s=%s;" % (key, params.__dict__.get(key))).encode())
+        # any change to the database code invalidates the cache
+        with open(__file__, "rb") as f:
+            sha.update(f.read())
+        return sha.hexdigest()
+
+    def save_cache(self, params, cache_path):
+        """
+        @brief dump numpy arrays to .npy files and the other members to a pickle
+        @param params parameters after initialize
+        @param cache_path cache directory of this design
+        """
+        tt = time.time()
+        tmp_path = "%s.tmp%d" % (cache_path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        members = {}
+        array_names = []
+        for key, value in self.__dict__.items():
+            if key in cache_skipped_members:
+                continue
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                np.save(os.path.join(tmp_path, "%s.npy" % (key)), value)
+                array_names.append(key)
+            else:
+                members[key] = value
+        meta = {
+                'members' : members,
+                'array_names' : array_names,
+                'params' : {key : params.__dict__[key] for key in cache_updated_params}
+                }
+        with open(os.path.join(tmp_path, "meta.pkl"), "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # concurrent workers may race on the same design, the first rename wins
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        logging.info("write placedb cache %s takes %.3f seconds" % (cache_path, time.time()-tt))
+
+    def load_cache(self, params, cache_path):
+        """
+        @brief restore members saved by save_cache
+        @param params parameters, updated the same way initialize does
+        @param cache_path cache directory of this design
+        @return whether the cache is hit
+        """
+        meta_file = os.path.join(cache_path, "meta.pkl")
+        if not os.path.exists(meta_file):
+            return False
+        tt = time.time()
+        with open(meta_file, "rb") as f:
+            meta = pickle.load(f)
+        self.__dict__.update(meta['members'])
+        for key in meta['array_names']:
+            # copy-on-write mapping, in-place updates such as scale_pl stay in memory
+            self.__dict__[key] = np.load(os.path.join(cache_path, "%s.npy" % (key)), mmap_mode='c')
+        for key, value in meta['params'].items():
+            params.__dict__[key] = value
+        self.device = torch.device("cuda" if params.gpu else "cpu")
+        self.rawdb = None
+        self._rawdb_params = params
+        logging.info("load placedb cache %s takes %.3f seconds" % (cache_path, time.time()-tt))
+        return True
+
 
     def calc_num_filler_for_fence_region(self, region_id, node2fence_region_map, target_density):
         """
@@ -1011,89 +1185,122 @@ row height = %g, site width = %g
             place_io.PlaceIOFunction.write(self.rawdb, filename, sol_file_format, node_x, node_y)
         logging.info("write %s takes %.3f seconds" % (str(sol_file_format), time.time()-tt))
 
-    def read_pl(self, params, pl_file):
+    def read_pl(self, params, pl_file, chunk_size=65536):
         """
         @brief read .pl file
         @param pl_file .pl file
+        @param chunk_size number of lines tokenized and applied at a time
         """
         tt = time.time()
         logging.info("reading %s" % (pl_file))
-        count = 0
         with open(pl_file, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("UCLA"):
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                if not lines:
+                    break
+                # placement lines read "name x y : orient [/FIXED]"
+                rows = [tokens for tokens in map(str.split, lines)
+                        if len(tokens) >= 5 and tokens[3] == ":" and not tokens[0].startswith("#")]
+                if not rows:
                     continue
-                # node positions
-                pos = re.search(r"(\w+)\s+([+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?)\s+([+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?)\s*:\s*(\w+)", line)
-                if pos:
-                    node_id = self.node_name2id_map[pos.group(1)]
-                    self.node_x[node_id] = float(pos.group(2))
-                    self.node_y[node_id] = float(pos.group(6))
-                    self.node_orient[node_id] = pos.group(10)
-                    orient = pos.group(4)
+                names, xs, ys, _, orients = list(zip(*[tokens[:5] for tokens in rows]))
+                node_ids = np.fromiter((self.node_name2id_map[name] for name in names),
+                        dtype=np.int64, count=len(names))
+                self.node_x[node_ids] = np.array(xs, dtype=self.dtype)
+                self.node_y[node_ids] = np.array(ys, dtype=self.dtype)
+                self.node_orient[node_ids] = np.array(orients, dtype=np.string_)
         if params.shift_factor[0] != 0 or params.shift_factor[1] != 0 or params.scale_factor != 1.0:
             self.scale_pl(params.shift_factor, params.scale_factor)
         logging.info("read_pl takes %.3f seconds" % (time.time()-tt))
 
-    def write_pl(self, params, pl_file, node_x, node_y):
+    def format_pl_lines(self, names, x, y, orients, suffix=""):
+        """
+        @brief format .pl lines column by column
+        @param names node names
+        @param x node locations in x
+        @param y node locations in y
+        @param orients node orientations
+        @param suffix appended to each line, e.g., /FIXED
+        @return one string with a leading newline per node
+        """
+        if len(names) == 0:
+            return ""
+        content = np.char.add("\n", np.asarray(names).astype(np.str_))
+        content = np.char.add(content, np.char.mod(" %g", x))
+        content = np.char.add(content, np.char.mod(" %g : ", y))
+        content = np.char.add(content, np.asarray(orients).astype(np.str_))
+        if suffix:
+            content = np.char.add(content, suffix)
+        return "".join(content.tolist())
+
+    def write_pl(self, params, pl_file, node_x, node_y, chunk_size=65536):
         """
         @brief write .pl file
         @param pl_file .pl file
+        @param chunk_size number of lines formatted and written at a time
         """
         tt = time.time()
         logging.info("writing to %s" % (pl_file))
-        content = "UCLA pl 1.0\n"
-        str_node_names = np.array(self.node_names).astype(np.str_)
-        str_node_orient = np.array(self.node_orient).astype(np.str_)
-        for i in range(self.num_movable_nodes):
-            content += "\n%s %g %g : %s" % (
-                    str_node_names[i],
-                    node_x[i],
-                    node_y[i],
-                    str_node_orient[i]
-                    )
         # use the original fixed cells, because they are expanded if they contain shapes
-        fixed_node_indices = list(self.rawdb.fixedNodeIndices())
-        for i, node_id in enumerate(fixed_node_indices):
-            content += "\n%s %g %g : %s /FIXED" % (
-                    str(self.rawdb.nodeName(node_id)),
-                    float(self.rawdb.node(node_id).xl()),
-                    float(self.rawdb.node(node_id).yl()),
-                    "N" # still hard-coded
-                    )
-        for i in range(self.num_movable_nodes + self.num_terminals, self.num_movable_nodes + self.num_terminals + self.num_terminal_NIs):
-            content += "\n%s %g %g : %s /FIXED_NI" % (
-                    str_node_names[i],
-                    node_x[i],
-                    node_y[i],
-                    str_node_orient[i]
-                    )
+        if self.fixed_pl_content is None:
+            fixed_node_indices = list(self.rawdb.fixedNodeIndices())
+            self.fixed_pl_content = self.format_pl_lines(
+                    [str(self.rawdb.nodeName(node_id)) for node_id in fixed_node_indices],
+                    np.array([float(self.rawdb.node(node_id).xl()) for node_id in fixed_node_indices]),
+                    np.array([float(self.rawdb.node(node_id).yl()) for node_id in fixed_node_indices]),
+                    np.full(len(fixed_node_indices), "N"), # still hard-coded
+                    " /FIXED")
+        terminal_NI_begin = self.num_movable_nodes + self.num_terminals
+        terminal_NI_end = terminal_NI_begin + self.num_terminal_NIs
         with open(pl_file, "w") as f:
-            f.write(content)
+            f.write("UCLA pl 1.0\n")
+            for begin in range(0, self.num_movable_nodes, chunk_size):
+                end = min(begin + chunk_size, self.num_movable_nodes)
+                f.write(self.format_pl_lines(self.node_names[begin:end], node_x[begin:end],
+                    node_y[begin:end], self.node_orient[begin:end]))
+            f.write(self.fixed_pl_content)
+            f.write(self.format_pl_lines(self.node_names[terminal_NI_begin:terminal_NI_end],
+                node_x[terminal_NI_begin:terminal_NI_end], node_y[terminal_NI_begin:terminal_NI_end],
+                self.node_orient[terminal_NI_begin:terminal_NI_end], " /FIXED_NI"))
         logging.info("write_pl takes %.3f seconds" % (time.time()-tt))
 
-    def write_nets(self, params, net_file):
+    def write_nets(self, params, net_file, chunk_size=65536):
         """
         @brief write .net file
         @param params parameters
         @param net_file .net file
+        @param chunk_size number of nets formatted and written at a time
         """
         tt = time.time()
         logging.info("writing to %s" % (net_file))
-        content = "UCLA nets 1.0\n"
-        content += "\nNumNets : %d" % (len(self.net2pin_map))
-        content += "\nNumPins : %d" % (len(self.pin2net_map))
-        content += "\n"
-
-        for net_id in range(len(self.net2pin_map)):
-            pins = self.net2pin_map[net_id]
-            content += "\nNetDegree : %d %s" % (len(pins), self.net_names[net_id].decode())
-            for pin_id in pins:
-                content += "\n\t%s %s : %d %d" % (self.node_names[self.pin2node_map[pin_id]].decode(), self.pin_direct[pin_id].decode(), self.pin_offset_x[pin_id]/params.scale_factor, self.pin_offset_y[pin_id]/params.scale_factor)
-
+        num_nets = len(self.net2pin_map)
+        net_degrees = np.array([len(pins) for pins in self.net2pin_map], dtype=np.int64)
+        net_starts = np.concatenate([[0], np.cumsum(net_degrees)])
+        pins = np.concatenate(list(self.net2pin_map)) if num_nets else np.zeros(0, dtype=np.int64)
+        node_names = self.node_names.astype(np.str_)
         with open(net_file, "w") as f:
-            f.write(content)
+            f.write("UCLA nets 1.0\n")
+            f.write("\nNumNets : %d" % (num_nets))
+            f.write("\nNumPins : %d" % (len(self.pin2net_map)))
+            f.write("\n")
+            for begin in range(0, num_nets, chunk_size):
+                end = min(begin + chunk_size, num_nets)
+                chunk_pins = pins[net_starts[begin]:net_starts[end]]
+                # %d truncates offsets toward zero
+                pin_lines = np.char.add("\n\t", node_names[self.pin2node_map[chunk_pins]])
+                pin_lines = np.char.add(pin_lines, np.char.add(" ", self.pin_direct[chunk_pins].astype(np.str_)))
+                pin_lines = np.char.add(pin_lines, np.char.mod(" : %d", (self.pin_offset_x[chunk_pins]/params.scale_factor).astype(np.int64)))
+                pin_lines = np.char.add(pin_lines, np.char.mod(" %d", (self.pin_offset_y[chunk_pins]/params.scale_factor).astype(np.int64)))
+                net_lines = np.char.add(np.char.mod("\nNetDegree : %d ", net_degrees[begin:end]),
+                        self.net_names[begin:end].astype(np.str_))
+                # each net line goes in front of its pins
+                lines = np.empty(len(net_lines) + len(pin_lines), dtype=object)
+                net_positions = net_starts[begin:end] - net_starts[begin] + np.arange(end - begin)
+                pin_mask = np.ones(len(lines), dtype=bool)
+                pin_mask[net_positions] = False
+                lines[net_positions] = net_lines
+                lines[pin_mask] = pin_lines
+                f.write("".join(lines.tolist()))
         logging.info("write_nets takes %.3f seconds" % (time.time()-tt))
 
     def apply(self, params, node_x, node_y):
@@ -23,6 +23,7 @@ else:
     import _pickle as pickle
 import dreamplace.ops.weighted_average_wirelength.weighted_average_wirelength as weighted_average_wirelength
 import dreamplace.ops.logsumexp_wirelength.logsumexp_wirelength as logsumexp_wirelength
+import dreamplace.ops.hpwl.hpwl as hpwl
 import dreamplace.ops.density_overflow.density_overflow as density_overflow
 import dreamplace.ops.electric_potential.electric_overflow as electric_overflow
 import dreamplace.ops.electric_potential.electric_potential as electric_potential
@@ -70,9 +71,11 @@ class PreconditionOp:
         It is tricky for this parameter to increase.
         """
         with torch.no_grad():
-            # The preconditioning step in python is time-consuming, as in each gradient
-            # pass, the total net weight should be re-calculated.
-            sum_pin_weights_in_nodes = self.op_collections.pws_op(self.data_collections.net_weights)
+            # cached in the data collection, recomputed only when net weights change;
+            # data collections of evolved BasicPlace copies have no cache
+            sum_pin_weights_in_nodes = getattr(self.data_collections, "weighted_pin_counts", None)
+            if sum_pin_weights_in_nodes is None:
+                sum_pin_weights_in_nodes = self.op_collections.pws_op(self.data_collections.net_weights)
             ###pre-condition-start###
             if density_weight.size(0) == 1:
                 precond = (sum_pin_weights_in_nodes
@@ -133,6 +136,57 @@ class PreconditionOp:
         return grad
 
 
+class ObjectiveMemo(object):
+    """
+    @brief wirelength and density terms with their gradients at recently evaluated positions.
+    Positions are matched by the iterate id CusOptimizer tags them with whenever it writes an iterate,
+    so a lookup neither compares positions nor synchronizes with the device.
+    Writes to the position outside the optimizer must clear the memo.
+    The density weight is applied when an entry is combined, so entries survive density weight updates;
+    the wirelength term is reused only under the same gamma and net weights.
+    """
+    def __init__(self, size):
+        """
+        @param size number of positions kept
+        """
+        self.size = size
+        self.entries = []
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries = []
+
+    def entry(self, key):
+        """
+        @brief entry of the iterate id, a new empty one if it is not memoized.
+        Ids grow with the iterates, so the oldest one is evicted;
+        the new entry takes over its gradient buffers.
+        """
+        for entry in self.entries:
+            if entry["key"] == key:
+                return entry
+        entry = {"key": key}
+        if len(self.entries) >= self.size:
+            oldest = min(range(len(self.entries)), key=lambda i: self.entries[i]["key"])
+            evicted = self.entries.pop(oldest)
+            for name in ("wirelength_grad", "density_grad"):
+                if name in evicted:
+                    entry[name] = evicted[name]
+        self.entries.append(entry)
+        return entry
+
+    @staticmethod
+    def store(entry, name, value):
+        """
+        @brief copy value into the buffer of the entry, allocating it on first use
+        """
+        if name in entry:
+            entry[name].copy_(value)
+        else:
+            entry[name] = value.clone()
+
+
 class PlaceObj(nn.Module):
     """
     @brief Define placement objective:
@@ -157,6 +211,15 @@ class PlaceObj(nn.Module):
         self.init_density = None
         ### increase density penalty if slow convergence
         self.density_factor = 1
+        ### HPWL and overflow from the side outputs of the objective, set up after the memo
+        self.fused_metrics = False
+        ### set while an optimizer step is captured into a CUDA graph
+        self.graph_mode = False
+        ### density spectral transforms and wirelength kernels in float32 while positions stay in float64,
+        ### the compiled kernels only support float32 and float64
+        self.mixed_dtype = torch.float32 if params.mixed_precision_flag and params.dtype == "float64" else None
+        if params.mixed_precision_flag and self.mixed_dtype is None:
+            logging.warning("mixed_precision_flag is ignored with dtype %s, it only reduces float64 runs to float32" % (params.dtype))
 
         if(len(placedb.regions) > 0):
             ### fence region will enable quadratic penalty by default
@@ -207,6 +270,8 @@ class PlaceObj(nn.Module):
         self.gamma = torch.tensor(10 * self.base_gamma(params, placedb),
                                   dtype=self.data_collections.pos[0].dtype,
                                   device=self.data_collections.pos[0].device)
+        # bumped by update_gamma, memoized wirelength terms of older gammas are stale
+        self.gamma_epoch = 0
 
         # compute weighted average wirelength from position
 
@@ -276,30 +341,58 @@ class PlaceObj(nn.Module):
         else:
             self.routability_Lsub_iteration = self.Lsub_iteration
         self.start_fence_region_density = False
-
-
-    def obj_fn(self, pos):
+        # the multi-electric field objective weights each region separately and is not memoized
+        if params.obj_memo_size > 0 and len(placedb.regions) == 0:
+            self.obj_memo = ObjectiveMemo(params.obj_memo_size)
+        else:
+            self.obj_memo = None
+        # metrics are read from the memo entry of the objective evaluated at the same position;
+        # without the memo, that evaluation would be a second full objective evaluation per iteration
+        if params.fused_metrics_flag and self.obj_memo is None:
+            logging.warning("fused_metrics_flag is ignored, it requires obj_memo_size > 0 and no fence regions")
+        if params.fused_metrics_flag and self.obj_memo is not None:
+            self.fused_metrics = True
+            self.op_collections.hpwl_for_pin_op = hpwl.HPWL(
+                flat_netpin=self.data_collections.flat_net2pin_map,
+                netpin_start=self.data_collections.flat_net2pin_start_map,
+                pin2net_map=self.data_collections.pin2net_map,
+                net_weights=self.data_collections.net_weights,
+                net_mask=self.data_collections.net_mask_all,
+                algorithm='net-by-net')
+            self.op_collections.density_op.record_overflow = True
+        self.memo_entry = None
+
+    def density_fn(self, pos):
         """
-        @brief Compute objective.
-            wirelength + density_weight * density penalty
+        @brief Compute density penalty, including the quadratic penalty if enabled.
         @param pos locations of cells
-        @return objective value
+        @return density penalty
         """
-        self.wirelength = self.op_collections.wirelength_op(pos)
         if len(self.placedb.regions) > 0:
-            self.density = self.op_collections.fence_region_density_merged_op(pos)
+            density = self.op_collections.fence_region_density_merged_op(pos)
         else:
-            self.density = self.op_collections.density_op(pos)
+            density = self.op_collections.density_op(pos)
 
         if self.init_density is None:
             ### record initial density
-            self.init_density = self.density.data.clone()
+            self.init_density = density.data.clone()
             ### density weight subgradient preconditioner
             self.density_weight_grad_precond = self.init_density.masked_scatter(self.init_density > 0, 1 /self.init_density[self.init_density > 0])
             self.quad_penalty_coeff = self.density_quad_coeff / 2 * self.density_weight_grad_precond
         if self.quad_penalty:
             ### quadratic density penalty
-            self.density = self.density * (1 + self.quad_penalty_coeff * self.density)
+            density = density * (1 + self.quad_penalty_coeff * density)
+        return density
+
+    def obj_fn(self, pos):
+        """
+        @brief Compute objective.
+            wirelength + density_weight * density penalty
+        @param pos locations of cells
+        @return objective value
+        """
+        self.wirelength = self.op_collections.wirelength_op(pos)
+        self.density = self.density_fn(pos)
         if len(self.placedb.regions) > 0:
             result = self.wirelength + self.density_weight.dot(self.density)
         else:
@@ -387,9 +480,37 @@ class PlaceObj(nn.Module):
         @return objective value
         """
         #self.check_gradient(pos)
+        if self.graph_mode:
+            return self.graph_obj_and_grad_fn(pos)
+        # positions not written by CusOptimizer carry no iterate id and are not memoized
+        if self.obj_memo is not None and getattr(pos, "iterate_id", None) is not None:
+            return self.memo_obj_and_grad_fn(pos)
         if pos.grad is not None:
             pos.grad.zero_()
         obj = self.obj_fn(pos)
+        if self.fused_metrics:
+            # side outputs of positions not tagged by CusOptimizer
+            self.memo_entry = {"pin_pos": self.wirelength_pin_pos,
+                    "overflow": self.op_collections.density_op.overflow_output}
+
+        obj.backward()
+
+        self.op_collections.precondition_op(pos.grad, self.density_weight, self.update_mask, self.fix_nodes_mask)
+
+        return obj, pos.grad
+
+    def graph_obj_and_grad_fn(self, pos):
+        """
+        @brief obj_and_grad_fn without host synchronization, so that it can be captured into a CUDA graph.
+        The density weight is applied as a device tensor and the memo is bypassed.
+        @param pos locations of cells
+        @return objective value
+        """
+        if pos.grad is not None:
+            pos.grad.zero_()
+        self.wirelength = self.op_collections.wirelength_op(pos)
+        self.density = self.density_fn(pos)
+        obj = self.wirelength + self.density_factor * self.density_weight * self.density
 
         obj.backward()
 
@@ -397,6 +518,80 @@ class PlaceObj(nn.Module):
 
         return obj, pos.grad
 
+    def memo_obj_and_grad_fn(self, pos):
+        """
+        @brief obj_and_grad_fn reusing the terms memoized for the same position.
+        CusOptimizer evaluates the previous iterate again in every step,
+        which then only costs combining the terms with the current density weight.
+        @param pos locations of cells
+        @return objective value
+        """
+        entry = self.obj_memo.entry(pos.iterate_id)
+        if pos.grad is None:
+            pos.grad = torch.zeros_like(pos.data)
+        # data collections of evolved BasicPlace copies have no epoch counter
+        wirelength_key = (self.data_collections.net_weights._version,
+                getattr(self.data_collections, "net_weights_epoch", 0), self.gamma_epoch)
+        hit = True
+        if "wirelength" not in entry or entry["wirelength_key"] != wirelength_key:
+            pos.grad.zero_()
+            wirelength = self.op_collections.wirelength_op(pos)
+            wirelength.backward()
+            self.obj_memo.store(entry, "wirelength_grad", pos.grad.data)
+            entry.update(wirelength=wirelength.data.clone(), wirelength_key=wirelength_key)
+            if self.fused_metrics:
+                entry["pin_pos"] = self.wirelength_pin_pos
+                entry.pop("hpwl", None)
+            hit = False
+        if "density" not in entry or entry["quad_penalty"] != self.quad_penalty:
+            pos.grad.zero_()
+            density = self.density_fn(pos)
+            density.backward()
+            self.obj_memo.store(entry, "density_grad", pos.grad.data)
+            entry.update(density=density.data.clone(), quad_penalty=self.quad_penalty)
+            if self.fused_metrics:
+                entry["overflow"] = self.op_collections.density_op.overflow_output
+            hit = False
+        if hit:
+            self.obj_memo.hits += 1
+        else:
+            self.obj_memo.misses += 1
+
+        self.wirelength = entry["wirelength"]
+        self.density = entry["density"]
+        self.memo_entry = entry
+        # the density weight stays on the device
+        weight = self.density_factor * self.density_weight
+        obj = entry["wirelength"] + weight * entry["density"]
+        torch.mul(entry["density_grad"], weight, out=pos.grad.data)
+        pos.grad.data.add_(entry["wirelength_grad"])
+
+        self.op_collections.precondition_op(pos.grad, self.density_weight, self.update_mask, self.fix_nodes_mask)
+
+        return obj, pos.grad
+
+    def fused_hpwl_op(self, pos):
+        """
+        @brief HPWL from the pin locations the wirelength op computed,
+        pos must be the position of the last objective evaluation.
+        The net reduction only runs when the metric is requested.
+        @param pos locations of cells
+        """
+        entry = self.memo_entry
+        if "hpwl" not in entry:
+            entry["hpwl"] = self.op_collections.hpwl_for_pin_op(entry["pin_pos"])
+        return entry["hpwl"]
+
+    def fused_overflow_op(self, pos):
+        """
+        @brief density overflow and max density recorded by the density op,
+        pos must be the position of the last objective evaluation.
+        @param pos locations of cells
+        @return the same as density_overflow_op
+        """
+        overflow_output = self.memo_entry["overflow"]
+        return overflow_output["overflow"], overflow_output["max_density"]
+
     def forward(self):
         """
         @brief Compute objective with current locations of cells.
@@ -450,7 +645,7 @@ class PlaceObj(nn.Module):
         @param pin_pos_op the op to compute pin locations according to cell locations
         """
 
-        # use WeightedAverageWirelength atomic
+        # use WeightedAverageWirelength merged, or lean to save memory
         wirelength_for_pin_op = weighted_average_wirelength.WeightedAverageWirelength(
             flat_netpin=data_collections.flat_net2pin_map,
             netpin_start=data_collections.flat_net2pin_start_map,
@@ -459,11 +654,17 @@ class PlaceObj(nn.Module):
             net_mask=data_collections.net_mask_ignore_large_degrees,
             pin_mask=data_collections.pin_mask_ignore_fixed_macros,
             gamma=self.gamma,
-            algorithm='merged')
+            algorithm=params.wirelength_algorithm,
+            precision=self.mixed_dtype,
+            check_interval=params.mixed_precision_check_interval)
 
         # wirelength for position
         def build_wirelength_op(pos):
-            return wirelength_for_pin_op(pin_pos_op(pos))
+            pin_pos = pin_pos_op(pos)
+            if self.fused_metrics:
+                # kept for the HPWL of fused metrics
+                self.wirelength_pin_pos = pin_pos.data
+            return wirelength_for_pin_op(pin_pos)
 
         # update gamma
         base_gamma = self.base_gamma(params, placedb)
@@ -496,7 +697,11 @@ class PlaceObj(nn.Module):
 
         # wirelength for position
         def build_wirelength_op(pos):
-            return wirelength_for_pin_op(pin_pos_op(pos))
+            pin_pos = pin_pos_op(pos)
+            if self.fused_metrics:
+                # kept for the HPWL of fused metrics
+                self.wirelength_pin_pos = pin_pos.data
+            return wirelength_for_pin_op(pin_pos)
 
         # update gamma
         base_gamma = self.base_gamma(params, placedb)
@@ -749,7 +954,10 @@ class PlaceObj(nn.Module):
             region_id=region_id,
             fence_regions=fence_regions,
             node2fence_region_map=data_collections.node2fence_region_map,
-            placedb=placedb)
+            placedb=placedb,
+            spectral_dtype=self.mixed_dtype,
+            incremental_interval=params.density_incremental_interval,
+            incremental_tolerance=params.density_incremental_tolerance)
 
     def initialize_density_weight(self, params, placedb):
         """
@@ -828,13 +1036,12 @@ class PlaceObj(nn.Module):
             ### based on hpwl
             with torch.no_grad():
                 delta_hpwl = cur_metric.hpwl - prev_metric.hpwl
-                if delta_hpwl < 0:
-                    mu = UPPER_PCOF * np.maximum(
-                        np.power(0.9999, float(iteration)), 0.98)
-                else:
-                    mu = UPPER_PCOF * torch.pow(
-                        UPPER_PCOF, -delta_hpwl / ref_hpwl).clamp(
-                            min=LOWER_PCOF, max=UPPER_PCOF)
+                # select on the device, branching on delta_hpwl would synchronize every iteration
+                mu = UPPER_PCOF * torch.pow(
+                    UPPER_PCOF, -delta_hpwl / ref_hpwl).clamp(
+                        min=LOWER_PCOF, max=UPPER_PCOF)
+                mu.masked_fill_(delta_hpwl < 0, UPPER_PCOF * np.maximum(
+                    np.power(0.9999, float(iteration)), 0.98))
                 self.density_weight *= mu
 
         def update_density_weight_op_overflow(cur_metric, prev_metric, iteration):
@@ -898,7 +1105,8 @@ class PlaceObj(nn.Module):
         else:
             overflow_avg = overflow
         coef = torch.pow(10, (overflow_avg - 0.1) * 20 / 9 - 1)
-        self.gamma.data.fill_((base_gamma * coef).item())
+        self.gamma.data.copy_((base_gamma * coef).reshape(self.gamma.shape))
+        self.gamma_epoch += 1
         return True
 
     def build_noise(self, params, placedb, data_collections):
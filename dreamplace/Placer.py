@@ -10,6 +10,7 @@ matplotlib.use('Agg')
 import os
 import sys
 import time
+import json
 import numpy as np
 import logging
 # for consistency between python2 and python3
@@ -24,21 +25,48 @@ import NonLinearPlace
 import pdb
 
 
-def place(params):
+def write_result_record(params, placer, read_time, place_time, total_time):
+    """
+    @brief append the result record of a finished run to params.result_record_file
+    @param placer placement engine after the run
+    """
+    record = {
+        "design": params.design_name(),
+        "read_time": read_time,
+        "place_time": place_time,
+        "total_time": total_time,
+    }
+    record.update(placer.result_record)
+    # final quality, the value extract_all_wHPWL_values scrapes from the log
+    for key in ["detailed_place", "legalize"]:
+        if record[key] is not None:
+            record["hpwl"] = record[key]["hpwl"]
+            break
+    else:
+        record["hpwl"] = record["global_place"][-1]["hpwl"] if record["global_place"] else None
+    with open(params.result_record_file, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def place(params, placer_cls=None):
     """
     @brief Top API to run the entire placement flow.
     @param params parameters
+    @param placer_cls placement engine class, NonLinearPlace.NonLinearPlace by default;
+    batch evaluation passes variants built on candidate modules
     """
 
     assert (not params.gpu) or configure.compile_configurations["CUDA_FOUND"] == 'TRUE', \
             "CANNOT enable GPU without CUDA compiled"
 
     np.random.seed(params.random_seed)
+    tp = time.time()
     # read database
     tt = time.time()
     placedb = PlaceDB.PlaceDB()
     placedb(params)
-    logging.info("reading database takes %.2f seconds" % (time.time() - tt))
+    read_time = time.time() - tt
+    logging.info("reading database takes %.2f seconds" % (read_time))
 
     # Read timing constraints provided in the benchmarks into out timing analysis
     # engine and then pass the timer into the placement core.
@@ -59,12 +87,17 @@ def place(params):
 
     # solve placement
     tt = time.time()
-    placer = NonLinearPlace.NonLinearPlace(params, placedb, timer)
+    if placer_cls is None:
+        placer_cls = NonLinearPlace.NonLinearPlace
+    placer = placer_cls(params, placedb, timer)
     logging.info("non-linear placement initialization takes %.2f seconds" %
                  (time.time() - tt))
     metrics = placer(params, placedb)
-    logging.info("non-linear placement takes %.2f seconds" %
-                 (time.time() - tt))
+    place_time = time.time() - tt
+    logging.info("non-linear placement takes %.2f seconds" % (place_time))
+
+    if params.result_record_file:
+        write_result_record(params, placer, read_time, place_time, time.time() - tp)
 
     # write placement solution
     path = "%s/%s" % (params.result_dir, params.design_name())
@@ -0,0 +1,178 @@
+##
+# @file   PlacerSession.py
+# @brief  Warm placement session of one design.
+# The placement database, data collections and op collections are built once,
+# and the init position routine, PlaceObj and CustomOptimizer are swapped per run.
+#
+
+import copy
+import time
+import inspect
+import textwrap
+import logging
+import numpy as np
+import torch
+import dreamplace.configure as configure
+import PlaceDB
+import Timer
+import NonLinearPlace
+import Placer
+import BatchPlace
+
+# data tensors a run modifies in place, e.g. macro halo, routability area adjustment, timing net weights
+mutable_data_names = ["node_size_x", "node_size_y", "pin_offset_x", "pin_offset_y", "net_weights"]
+# placement database members a run modifies
+mutable_placedb_names = ["node_x", "node_y", "net_weights", "total_movable_node_area"]
+
+# compiled init position routines, keyed by BasicPlace class
+_init_routines = {}
+
+
+def init_position_routine(basic_place_cls):
+    """
+    @brief compile the init position part of BasicPlace.__init__, i.e., the code before the device is set up.
+    Evolved BasicPlace files only differ in this part, so it can be replayed without building the ops.
+    @param basic_place_cls BasicPlace class of the installed or a candidate file
+    @return function (params, placedb, timer) -> init_pos
+    """
+    if basic_place_cls in _init_routines:
+        return _init_routines[basic_place_cls]
+    init = basic_place_cls.__init__
+    lines, first_lineno = inspect.getsourcelines(init)
+    lines = textwrap.dedent("".join(lines)).splitlines()
+    end = [i for i, line in enumerate(lines) if line.strip().startswith("self.device = ")]
+    if not end:
+        raise ValueError("cannot locate the init position routine in %s" % (inspect.getsourcefile(init)))
+    indent = lines[end[0]][:len(lines[end[0]]) - len(lines[end[0]].lstrip())]
+    lines = lines[:end[0]] + [indent + "return self.init_pos"]
+    # keep line numbers of the file for tracebacks
+    code = compile("\n" * (first_lineno - 1) + "\n".join(lines), inspect.getsourcefile(init), "exec")
+    namespace = dict(init.__globals__)
+    exec(code, namespace)
+    routine = namespace["__init__"]
+
+    def init_positions(params, placedb, timer):
+        return routine(basic_place_cls.__new__(basic_place_cls), params, placedb, timer)
+
+    _init_routines[basic_place_cls] = init_positions
+    return init_positions
+
+
+class PlacerSession(object):
+    """
+    @brief hold the built placer of one design and re-run it from a fresh init
+    """
+    def __init__(self, params, placer_cls=None):
+        """
+        @param params parameters, a private copy is kept
+        @param placer_cls placement engine class, NonLinearPlace.NonLinearPlace by default
+        """
+        assert (not params.gpu) or configure.compile_configurations["CUDA_FOUND"] == 'TRUE', \
+                "CANNOT enable GPU without CUDA compiled"
+        params = copy.deepcopy(params)
+        np.random.seed(params.random_seed)
+
+        tt = time.time()
+        self.placedb = PlaceDB.PlaceDB()
+        self.placedb(params)
+        self.read_time = time.time() - tt
+        logging.info("reading database takes %.2f seconds" % (self.read_time))
+
+        self.timer = None
+        if params.timing_opt_flag:
+            tt = time.time()
+            self.timer = Timer.Timer()
+            self.timer(params, self.placedb)
+            self.timer.update_timing()
+            logging.info("reading timer takes %.2f seconds" % (time.time() - tt))
+
+        tt = time.time()
+        if placer_cls is None:
+            placer_cls = NonLinearPlace.NonLinearPlace
+        self.placer = placer_cls(params, self.placedb, self.timer)
+        self.build_time = time.time() - tt
+        logging.info("non-linear placement initialization takes %.2f seconds" % (self.build_time))
+
+        # parameters as they are before the first run, runs modify their copy, e.g., global_place_stages
+        self.params = copy.deepcopy(params)
+        self.default_basic_place_cls = [i for i in type(self.placer).__mro__ if i.__name__ == "BasicPlace"][0]
+        self.default_place_obj = self.placer.place_obj_module
+        self.default_custom_optimizer = self.placer.custom_optimizer_module
+        data_collections = self.placer.data_collections
+        with torch.no_grad():
+            self.data_snapshot = {name: getattr(data_collections, name).clone() for name in mutable_data_names}
+        self.placedb_snapshot = {name: copy.deepcopy(getattr(self.placedb, name)) for name in mutable_placedb_names}
+        self.num_runs = 0
+
+    def reset(self):
+        """
+        @brief restore the state a previous, possibly interrupted, run modified
+        """
+        data_collections = self.placer.data_collections
+        with torch.no_grad():
+            for name, value in self.data_snapshot.items():
+                getattr(data_collections, name).copy_(value)
+        for name, value in self.placedb_snapshot.items():
+            if isinstance(value, np.ndarray):
+                # ops may hold references to the arrays
+                np.copyto(getattr(self.placedb, name), value)
+            else:
+                setattr(self.placedb, name, value)
+
+    def init_positions(self, params, basic_place=None):
+        """
+        @brief fresh init positions, seeded as a new run
+        @param basic_place module of a BasicPlace candidate, None for the one the placer is built on
+        """
+        np.random.seed(params.random_seed)
+        basic_place_cls = basic_place.BasicPlace if basic_place is not None else self.default_basic_place_cls
+        return init_position_routine(basic_place_cls)(params, self.placedb, self.timer)
+
+    def run(self, basic_place=None, place_obj=None, custom_optimizer=None, overrides=None):
+        """
+        @brief run placement from a fresh init
+        @param basic_place module whose BasicPlace provides the init position routine
+        @param place_obj module providing PlaceObj, e.g., a preconditioner candidate
+        @param custom_optimizer module providing CusOptimizer
+        @param overrides {param: value} applied for this run only, e.g., abort_reference_file
+        @return metrics as returned by NonLinearPlace
+        """
+        params = copy.deepcopy(self.params)
+        for key, value in (overrides or {}).items():
+            params.__dict__[key] = value
+        self.reset()
+
+        tt = time.time()
+        init_pos = self.init_positions(params, basic_place)
+        self.placer.init_pos = init_pos
+        with torch.no_grad():
+            self.placer.pos[0].data.copy_(torch.from_numpy(init_pos).to(self.placer.pos[0].device))
+        self.placer.place_obj_module = place_obj if place_obj is not None else self.default_place_obj
+        self.placer.custom_optimizer_module = custom_optimizer if custom_optimizer is not None else self.default_custom_optimizer
+        self.num_runs += 1
+
+        metrics = self.placer(params, self.placedb)
+        place_time = time.time() - tt
+        logging.info("session run %d takes %.2f seconds" % (self.num_runs, place_time))
+        if params.result_record_file:
+            Placer.write_result_record(params, self.placer, 0.0, place_time, place_time)
+        return metrics
+
+    def run_batch(self, seeds, configs=None, basic_place=None):
+        """
+        @brief global placement from the fresh inits of several seeds as one batch, see BatchPlace
+        @param seeds random seed of the init positions of each placement
+        @param configs per placement {"density_weight", "gamma", "learning_rate"}, None for the parameters
+        @param basic_place module whose BasicPlace provides the init position routine
+        @return per placement {"pos", "hpwl", "overflow", "max_density", "iteration"}
+        """
+        params = copy.deepcopy(self.params)
+        self.reset()
+        init_pos = []
+        for seed in seeds:
+            params.random_seed = seed
+            init_pos.append(self.init_positions(params, basic_place))
+        self.placer.place_obj_module = self.default_place_obj
+        results = BatchPlace.BatchPlace(self.placer)(params, self.placedb, np.stack(init_pos), configs)
+        self.num_runs += len(seeds)
+        return results
@@ -0,0 +1,182 @@
+##
+# @file   QuadraticInit.py
+# @brief  Quadratic initial placement.
+# Minimize the weighted squared pin-to-pin distance of a clique/star net model
+# with fixed cells as anchors, solved by Jacobi preconditioned conjugate gradient
+# on a sparse Laplacian for x and y at the same time.
+#
+
+import time
+import logging
+import numpy as np
+import torch
+
+
+def net_slots(flat_net2pin_start_map, nets):
+    """
+    @brief positions in flat_net2pin_map of all pins of the nets
+    @return (net of each slot, slot)
+    """
+    degrees = flat_net2pin_start_map[nets + 1] - flat_net2pin_start_map[nets]
+    slot_nets = np.repeat(nets, degrees)
+    offsets = np.arange(slot_nets.size) - np.repeat(np.cumsum(degrees) - degrees, degrees)
+    return slot_nets, flat_net2pin_start_map[slot_nets] + offsets
+
+
+def build_net_model(params, placedb):
+    """
+    @brief two-pin connections of the net model
+    Nets up to params.quadratic_init_clique_degree pins become cliques with weight w/(d-1),
+    larger nets up to params.ignore_net_degree connect their pins to a star node with weight w*d/(d-1).
+    @return (pins of one end, pins or star node ids of the other end, weights, number of star nodes),
+    star nodes are numbered after the physical nodes
+    """
+    start_map = placedb.flat_net2pin_start_map.astype(np.int64)
+    flat_net2pin_map = placedb.flat_net2pin_map.astype(np.int64)
+    degrees = start_map[1:] - start_map[:-1]
+    clique_degree = max(params.quadratic_init_clique_degree, 2)
+
+    # clique nets, pair every pin with the later pins of the same net
+    clique_nets = np.nonzero((degrees >= 2) & (degrees <= clique_degree))[0]
+    slot_nets, slots = net_slots(start_map, clique_nets)
+    slot_degrees = degrees[slot_nets]
+    pair_slots = np.repeat(slots, slot_degrees)
+    pair_nets = np.repeat(slot_nets, slot_degrees)
+    offsets = np.arange(pair_slots.size) - np.repeat(np.cumsum(slot_degrees) - slot_degrees, slot_degrees)
+    other_slots = start_map[pair_nets] + offsets
+    keep = pair_slots < other_slots
+    pair_slots, other_slots, pair_nets = pair_slots[keep], other_slots[keep], pair_nets[keep]
+    clique_pins = flat_net2pin_map[pair_slots]
+    clique_others = flat_net2pin_map[other_slots]
+    clique_weights = placedb.net_weights[pair_nets] / (degrees[pair_nets] - 1)
+
+    # star nets
+    star_nets = np.nonzero((degrees > clique_degree) & (degrees < params.ignore_net_degree))[0]
+    slot_nets, slots = net_slots(start_map, star_nets)
+    star_ids = np.zeros(len(degrees), dtype=np.int64)
+    star_ids[star_nets] = np.arange(len(star_nets))
+    star_pins = flat_net2pin_map[slots]
+    star_others = -1 - star_ids[slot_nets]  # negative marks star nodes until offsets are known
+    star_weights = placedb.net_weights[slot_nets] * degrees[slot_nets] / (degrees[slot_nets] - 1)
+
+    return (np.concatenate([clique_pins, star_pins]),
+            np.concatenate([clique_others, star_others]),
+            np.concatenate([clique_weights, star_weights]),
+            len(star_nets))
+
+
+def conjugate_gradient(diag, off_diag, B, X, max_iterations, tolerance, check_interval=10):
+    """
+    @brief Jacobi preconditioned conjugate gradient on every column of B
+    @param diag diagonal of the matrix
+    @param off_diag sparse off-diagonal part of the matrix
+    @return (solution, iterations, relative residual)
+    """
+    def matvec(P):
+        return diag.unsqueeze(1) * P + torch.sparse.mm(off_diag, P)
+
+    norm_B = B.norm(dim=0).clamp(min=1e-30)
+    R = B - matvec(X)
+    Z = R / diag.unsqueeze(1)
+    P = Z.clone()
+    rz = (R * Z).sum(dim=0)
+    iteration = 0
+    residual = (R.norm(dim=0) / norm_B).max().item()
+    while iteration < max_iterations and residual > tolerance:
+        LP = matvec(P)
+        alpha = rz / (P * LP).sum(dim=0).clamp(min=1e-30)
+        X += alpha * P
+        R -= alpha * LP
+        Z = R / diag.unsqueeze(1)
+        rz_new = (R * Z).sum(dim=0)
+        P = Z + (rz_new / rz.clamp(min=1e-30)) * P
+        rz = rz_new
+        iteration += 1
+        # avoid a device synchronization every iteration
+        if iteration % check_interval == 0 or iteration == max_iterations:
+            residual = (R.norm(dim=0) / norm_B).max().item()
+    return X, iteration, residual
+
+
+def quadratic_init(params, placedb, init_pos):
+    """
+    @brief quadratic placement of the movable cells, used as the initial positions of global placement
+    @param params parameters
+    @param placedb placement database
+    @param init_pos initial positions of all nodes, x followed by y; movable cells are the starting point of CG
+    @return init_pos with movable cells replaced
+    """
+    tt = time.time()
+    num_movable_nodes = placedb.num_movable_nodes
+    num_physical_nodes = placedb.num_physical_nodes
+    if num_movable_nodes == 0:
+        return init_pos
+    if len(placedb.regions) > 0:
+        # cells would be pulled out of their fence regions
+        logging.warning("quadratic initial placement does not support fence regions, skipped")
+        return init_pos
+    device = torch.device("cuda" if params.gpu else "cpu")
+
+    pins, others, weights, num_stars = build_net_model(params, placedb)
+    ends_a = placedb.pin2node_map[pins].astype(np.int64)
+    is_star = others < 0
+    ends_b = np.where(is_star, num_physical_nodes - 1 - others, placedb.pin2node_map[np.where(is_star, 0, others)])
+    offset_a = np.stack([placedb.pin_offset_x[pins], placedb.pin_offset_y[pins]], axis=1)
+    offset_b = np.where(is_star[:, None], 0.0,
+            np.stack([placedb.pin_offset_x[np.where(is_star, 0, others)], placedb.pin_offset_y[np.where(is_star, 0, others)]], axis=1))
+
+    # variables are movable nodes followed by star nodes, fixed nodes are -1
+    variables = np.full(num_physical_nodes + num_stars, -1, dtype=np.int64)
+    variables[:num_movable_nodes] = np.arange(num_movable_nodes)
+    variables[num_physical_nodes:] = num_movable_nodes + np.arange(num_stars)
+    num_variables = num_movable_nodes + num_stars
+    fixed_pos = np.zeros([num_physical_nodes + num_stars, 2])
+    fixed_pos[:num_physical_nodes, 0] = placedb.node_x[:num_physical_nodes]
+    fixed_pos[:num_physical_nodes, 1] = placedb.node_y[:num_physical_nodes]
+
+    var_a = torch.from_numpy(variables[ends_a]).to(device)
+    var_b = torch.from_numpy(variables[ends_b]).to(device)
+    weights = torch.from_numpy(weights.astype(np.float64)).to(device)
+    offset_a = torch.from_numpy(offset_a.astype(np.float64)).to(device)
+    offset_b = torch.from_numpy(offset_b.astype(np.float64)).to(device)
+    fixed_pos = torch.from_numpy(fixed_pos).to(device)
+
+    # w * (pos_a + offset_a - pos_b - offset_b)^2 for each connection
+    both = (var_a >= 0) & (var_b >= 0)
+    only_a = (var_a >= 0) & (var_b < 0)
+    only_b = (var_a < 0) & (var_b >= 0)
+    diag = torch.zeros(num_variables, dtype=torch.float64, device=device)
+    B = torch.zeros(num_variables, 2, dtype=torch.float64, device=device)
+    w = weights.unsqueeze(1)
+    diag.index_add_(0, var_a[both | only_a], weights[both | only_a])
+    diag.index_add_(0, var_b[both | only_b], weights[both | only_b])
+    B.index_add_(0, var_a[both], (w * (offset_b - offset_a))[both])
+    B.index_add_(0, var_b[both], (w * (offset_a - offset_b))[both])
+    B.index_add_(0, var_a[only_a], (w * (fixed_pos[torch.from_numpy(ends_b).to(device)] + offset_b - offset_a))[only_a])
+    B.index_add_(0, var_b[only_b], (w * (fixed_pos[torch.from_numpy(ends_a).to(device)] + offset_a - offset_b))[only_b])
+    off_diag = torch.sparse_coo_tensor(
+            torch.stack([torch.cat([var_a[both], var_b[both]]), torch.cat([var_b[both], var_a[both]])]),
+            torch.cat([-weights[both], -weights[both]]),
+            (num_variables, num_variables)).coalesce()
+
+    # weak pull to the layout center keeps components without fixed cells and isolated cells well posed
+    center = torch.tensor([(placedb.xl + placedb.xh) / 2, (placedb.yl + placedb.yh) / 2], dtype=torch.float64, device=device)
+    regularization = 1e-3 * diag[diag > 0].mean() if (diag > 0).any() else diag.new_ones([])
+    diag += regularization
+    B += regularization * center
+
+    X = center.repeat(num_variables, 1)
+    X[:num_movable_nodes, 0] = torch.from_numpy(init_pos[:num_movable_nodes].astype(np.float64)).to(device)
+    X[:num_movable_nodes, 1] = torch.from_numpy(
+            init_pos[placedb.num_nodes:placedb.num_nodes + num_movable_nodes].astype(np.float64)).to(device)
+    X, iteration, residual = conjugate_gradient(diag, off_diag, B, X,
+            params.quadratic_init_iterations, params.quadratic_init_tolerance)
+
+    X = X[:num_movable_nodes].cpu().numpy()
+    init_pos[:num_movable_nodes] = np.clip(X[:, 0], placedb.xl,
+            placedb.xh - placedb.node_size_x[:num_movable_nodes])
+    init_pos[placedb.num_nodes:placedb.num_nodes + num_movable_nodes] = np.clip(X[:, 1], placedb.yl,
+            placedb.yh - placedb.node_size_y[:num_movable_nodes])
+    logging.info("quadratic initial placement with %d connections and %d star nodes, %d CG iterations, residual %.3E, takes %.2f seconds"
+            % (len(pins), num_stars, iteration, residual, time.time() - tt))
+    return init_pos
@@ -0,0 +1,101 @@
+##
+# @file   StepGraph.py
+# @brief  Replay one global placement optimizer step as a CUDA graph.
+# The step (objective, gradient, preconditioning, Nesterov update and boundary move)
+# has the same shapes in every iteration, so after a few eager warm-up steps it is
+# captured once and replayed, which removes the python dispatch and kernel launch overhead.
+#
+
+import logging
+import torch
+
+
+class StepGraph(object):
+    """
+    @brief capture optimizer.step() into a CUDA graph and replay it.
+    Scalars the step reads, e.g., density weight and gamma, must live in device tensors updated in place.
+    Host-side state that changes the control flow or replaces tensors is part of the key, a new key is captured again.
+    Any capture failure, e.g., a host synchronization in an evolved optimizer, falls back to eager steps for good.
+    """
+    def __init__(self, optimizer, model, warmup_steps=3):
+        """
+        @param optimizer optimizer without line search, i.e., CusOptimizer
+        @param model PlaceObj whose obj_and_grad_fn the optimizer calls
+        @param warmup_steps eager steps before a capture
+        """
+        self.optimizer = optimizer
+        self.model = model
+        self.warmup_steps = warmup_steps
+        self.failed = False
+        self.num_captures = 0
+        self.num_replays = 0
+        self.reset()
+
+    def reset(self):
+        """
+        @brief drop the graph, e.g., after op buffers or optimizer states are replaced
+        """
+        self.graph = None
+        self.key = None
+        self.num_warmup = 0
+
+    def capture_key(self):
+        """
+        @brief host-side state the captured step depends on
+        """
+        model = self.model
+        data_collections = model.data_collections
+        return (model.density_factor, model.quad_penalty,
+                model.density_weight.data_ptr(),
+                data_collections.net_weights._version,
+                getattr(data_collections, "net_weights_epoch", 0))
+
+    def eager_step(self):
+        return self.optimizer.step()
+
+    def step(self):
+        """
+        @brief one optimizer step, replayed if the captured graph is still valid
+        """
+        if self.failed or self.model.update_mask is not None:
+            return self.eager_step()
+        key = self.capture_key()
+        if self.graph is not None and key == self.key:
+            self.graph.replay()
+            self.num_replays += 1
+            return None
+        if self.key != key:
+            self.reset()
+            self.key = key
+
+        # warm up on a side stream as required by graph capture
+        self.model.graph_mode = True
+        try:
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                if self.num_warmup < self.warmup_steps:
+                    self.eager_step()
+                    self.num_warmup += 1
+                else:
+                    graph = torch.cuda.CUDAGraph()
+                    try:
+                        with torch.cuda.graph(graph):
+                            self.optimizer.step()
+                    except Exception as e:
+                        logging.warning("CUDA graph capture of the optimizer step failed, fall back to eager steps: %s" % (e))
+                        self.failed = True
+                    else:
+                        self.graph = graph
+                        self.num_captures += 1
+            torch.cuda.current_stream().wait_stream(stream)
+        finally:
+            self.model.graph_mode = False
+
+        if self.failed:
+            return self.eager_step()
+        if self.graph is not None:
+            # capture only records the kernels, this iteration still needs its step
+            self.graph.replay()
+            self.num_replays += 1
+        return None
@@ -5,6 +5,8 @@
 #
 
 import math
+import logging
+import numpy as np
 import torch
 from torch import nn
 from torch.autograd import Function
@@ -136,3 +138,160 @@ class AbacusLegalize(object):
             num_terminal_NIs=self.num_terminal_NIs,
             num_filler_nodes=self.num_filler_nodes,
         )
+
+
+def row_segments(obstacle_xl, obstacle_yl, obstacle_xh, obstacle_yh, xl, yl, xh, yh, site_width, row_height):
+    """
+    @brief free segments of all placement rows, aligned to sites.
+    Each row is blocked by the obstacles overlapping it; gaps between the running maximum
+    of obstacle right edges and the next left edge are free.
+    @param obstacle_xl, obstacle_yl, obstacle_xh, obstacle_yh numpy arrays of obstacle boxes
+    @return (row, xl, xh) of the segments as numpy arrays, ordered by row and then xl
+    """
+    num_rows = int(round((yh - yl) / row_height))
+    eps = 1e-6
+    row_begin = np.clip(np.floor((obstacle_yl - yl) / row_height + eps), 0, num_rows).astype(np.int64)
+    row_end = np.clip(np.ceil((obstacle_yh - yl) / row_height - eps), 0, num_rows).astype(np.int64)
+    counts = np.maximum(row_end - row_begin, 0)
+    counts[obstacle_xh <= obstacle_xl] = 0
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = np.arange(num_rows)
+    # a zero-width box at both ends of every row keeps empty rows and the die boundary
+    entry_row = np.concatenate([np.repeat(row_begin, counts) + offsets, rows, rows])
+    entry_xl = np.concatenate([np.repeat(np.clip(obstacle_xl, xl, xh), counts), np.full(num_rows, xl), np.full(num_rows, xh)])
+    entry_xh = np.concatenate([np.repeat(np.clip(obstacle_xh, xl, xh), counts), np.full(num_rows, xl), np.full(num_rows, xh)])
+    order = np.lexsort((entry_xl, entry_row))
+    entry_row, entry_xl, entry_xh = entry_row[order], entry_xl[order], entry_xh[order]
+
+    # rows are lifted into disjoint ranges, so one running maximum restarts at each row
+    span = xh - xl + 1
+    covered = np.maximum.accumulate(entry_xh - xl + entry_row * span) - entry_row * span + xl
+    seg_xl = xl + np.ceil((covered[:-1] - xl) / site_width - eps) * site_width
+    seg_xh = xl + np.floor((entry_xl[1:] - xl) / site_width + eps) * site_width
+    keep = (entry_row[:-1] == entry_row[1:]) & (seg_xh - seg_xl >= site_width)
+    return entry_row[:-1][keep], seg_xl[keep], seg_xh[keep]
+
+
+class RowAbacusLegalize(object):
+    """ Abacus on the rows of a legal placement, in torch.
+    Standard cells keep the rows and the left-to-right order greedy legalization gave them.
+    Every free row segment between fixed cells and legalized macros is an independent window,
+    and the cluster merging of Abacus runs on all windows at once, one cell position per window a step.
+    So it runs on GPU without copying the placement to the host.
+    Fence regions are not supported.
+    """
+    def __init__(self, node_size_x, node_size_y, node_weights,
+                 xl, yl, xh, yh, site_width, row_height, num_movable_nodes, num_terminals, num_terminal_NIs, num_filler_nodes):
+        self.node_size_x = node_size_x
+        self.node_size_y = node_size_y
+        self.node_weights = node_weights
+        self.xl = xl
+        self.yl = yl
+        self.xh = xh
+        self.yh = yh
+        self.site_width = site_width
+        self.row_height = row_height
+        self.num_movable_nodes = num_movable_nodes
+        self.num_terminals = num_terminals
+        self.num_terminal_NIs = num_terminal_NIs
+        self.num_filler_nodes = num_filler_nodes
+
+    def __call__(self, init_pos, pos):
+        """
+        @param init_pos the reference position for displacement minization
+        @param pos legal position from greedy legalization
+        """
+        num_nodes = pos.numel() // 2
+        num_movable_nodes = self.num_movable_nodes
+        x = pos[:num_nodes]
+        y = pos[num_nodes:]
+        size_x = self.node_size_x[:num_movable_nodes]
+        size_y = self.node_size_y[:num_movable_nodes]
+        std_cell_mask = size_y <= self.row_height * (1 + 1e-6)
+
+        # fixed cells and movable cells taller than a row block the rows
+        fixed = slice(num_movable_nodes, num_movable_nodes + self.num_terminals)
+        macros = (~std_cell_mask).nonzero().view(-1)
+        obstacle_xl = torch.cat([x[fixed], x[macros]])
+        obstacle_yl = torch.cat([y[fixed], y[macros]])
+        obstacle_xh = obstacle_xl + torch.cat([self.node_size_x[fixed], size_x[macros]])
+        obstacle_yh = obstacle_yl + torch.cat([self.node_size_y[fixed], size_y[macros]])
+        seg_row, seg_xl, seg_xh = [torch.from_numpy(a).to(pos.device) for a in row_segments(
+            obstacle_xl.cpu().numpy(), obstacle_yl.cpu().numpy(), obstacle_xh.cpu().numpy(), obstacle_yh.cpu().numpy(),
+            self.xl, self.yl, self.xh, self.yh, self.site_width, self.row_height)]
+        seg_xl = seg_xl.to(pos.dtype)
+        seg_xh = seg_xh.to(pos.dtype)
+        num_segments = seg_row.numel()
+
+        # window of each cell, then cells ordered by window and x
+        cells = std_cell_mask.nonzero().view(-1)
+        span = self.xh - self.xl + 1
+        cell_row = ((y[cells] - self.yl) / self.row_height).round().long()
+        seg_key = seg_row.double() * span + (seg_xl.double() - self.xl)
+        cell_key = cell_row.double() * span + (x[cells].double() - self.xl)
+        window = (torch.searchsorted(seg_key, cell_key, right=True) - 1).clamp(min=0)
+        width = size_x[cells]
+        if not bool(((seg_row[window] == cell_row) & (x[cells] >= seg_xl[window])
+                     & (x[cells] + width <= seg_xh[window] + 1e-6)).all()):
+            logging.warning("cells outside free row segments, skip row abacus legalization")
+            return pos
+        order = torch.argsort(window.double() * span + (x[cells].double() - self.xl))
+        cells, window, width = cells[order], window[order], width[order]
+        weight = self.node_weights[cells].to(pos.dtype).clamp(min=1.0)
+        target = torch.max(torch.min(init_pos[cells], seg_xh[window] - width), seg_xl[window])
+
+        counts = torch.bincount(window, minlength=num_segments)
+        starts = counts.cumsum(0) - counts
+        slot = torch.arange(cells.numel(), device=pos.device) - starts[window]
+        max_count = int(counts.max().item()) if num_segments else 0
+        index = torch.full([num_segments, max(max_count, 1)], -1, dtype=torch.long, device=pos.device)
+        index[window, slot] = torch.arange(cells.numel(), device=pos.device)
+
+        # clusters of each window: total weight, weighted target, width, position and first slot
+        cluster_e = pos.new_zeros([num_segments, max(max_count, 1)])
+        cluster_q = torch.zeros_like(cluster_e)
+        cluster_w = torch.zeros_like(cluster_e)
+        cluster_x = torch.zeros_like(cluster_e)
+        cluster_first = torch.zeros_like(index)
+        top = torch.zeros(num_segments, dtype=torch.long, device=pos.device)
+        for i in range(max_count):
+            lanes = (counts > i).nonzero().view(-1)
+            k = index[lanes, i]
+            e, w, t = weight[k], width[k], target[k]
+            last = (top[lanes] - 1).clamp(min=0)
+            new = (top[lanes] == 0) | (cluster_x[lanes, last] + cluster_w[lanes, last] <= t)
+            c = torch.where(new, top[lanes], last)
+            cluster_q[lanes, c] = torch.where(new, e * t, cluster_q[lanes, c] + e * (t - cluster_w[lanes, c]))
+            cluster_e[lanes, c] = torch.where(new, e, cluster_e[lanes, c] + e)
+            cluster_w[lanes, c] = torch.where(new, w, cluster_w[lanes, c] + w)
+            cluster_first[lanes, c] = torch.where(new, torch.full_like(c, i), cluster_first[lanes, c])
+            top[lanes] += new.long()
+            # collapse the last cluster, merging it into its predecessor while they overlap
+            while lanes.numel():
+                c = top[lanes] - 1
+                p = (c - 1).clamp(min=0)
+                xc = torch.max(torch.min(cluster_q[lanes, c] / cluster_e[lanes, c], seg_xh[lanes] - cluster_w[lanes, c]), seg_xl[lanes])
+                cluster_x[lanes, c] = xc
+                merge = (c > 0) & (cluster_x[lanes, p] + cluster_w[lanes, p] > xc)
+                lanes, c, p = lanes[merge], c[merge], p[merge]
+                cluster_q[lanes, p] += cluster_q[lanes, c] - cluster_e[lanes, c] * cluster_w[lanes, p]
+                cluster_e[lanes, p] += cluster_e[lanes, c]
+                cluster_w[lanes, p] += cluster_w[lanes, c]
+                top[lanes] -= 1
+
+        # snap clusters to sites; rounding is monotone and widths are whole sites, so clusters stay apart
+        cluster_x = torch.round((cluster_x - self.xl) / self.site_width) * self.site_width + self.xl
+        cluster_x = torch.max(torch.min(cluster_x, seg_xh.view([-1, 1]) - cluster_w), seg_xl.view([-1, 1]))
+
+        # cells follow their cluster in order
+        valid = torch.arange(cluster_first.size(1), device=pos.device).view([1, -1]) < top.view([-1, 1])
+        first_flags = torch.zeros_like(index)
+        first_flags[valid.nonzero()[:, 0], cluster_first[valid]] = 1
+        cluster_id = first_flags.cumsum(dim=1) - 1
+        offset = width.cumsum(0) - width
+        offset = offset - offset[starts[window]]
+        cid = cluster_id[window, slot]
+        first = starts[window] + cluster_first[window, cid]
+        output = pos.clone()
+        output[cells] = cluster_x[window, cid] + offset - offset[first]
+        return output
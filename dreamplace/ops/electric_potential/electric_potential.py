@@ -88,19 +88,48 @@ class ElectricPotentialFunction(Function):
         idct2=None,
         idct_idxst=None,
         idxst_idct=None,
-        fast_mode=True  # fast mode will discard some computation
+        fast_mode=True,  # fast mode will discard some computation
+        overflow_output=None,  # dictionary to receive overflow and max density as side outputs
+        density_map=None  # density map of all cells maintained by the caller, computed from pos if None
     ):
 
         tt = time.time()
 
-        density_map = ElectricDensityMapFunction.forward(
-            pos, node_size_x_clamped, node_size_y_clamped, offset_x, offset_y,
-            ratio, bin_center_x, bin_center_y, initial_density_map,
-            target_density, xl, yl, xh, yh, bin_size_x, bin_size_y,
-            num_movable_nodes, num_filler_nodes, padding, padding_mask,
-            num_bins_x, num_bins_y, num_movable_impacted_bins_x,
-            num_movable_impacted_bins_y, num_filler_impacted_bins_x,
-            num_filler_impacted_bins_y, deterministic_flag, sorted_node_map)
+        if density_map is not None:
+            # the caller hands over a fresh map, it is scaled in place below
+            pass
+        elif overflow_output is None:
+            density_map = ElectricDensityMapFunction.forward(
+                pos, node_size_x_clamped, node_size_y_clamped, offset_x, offset_y,
+                ratio, bin_center_x, bin_center_y, initial_density_map,
+                target_density, xl, yl, xh, yh, bin_size_x, bin_size_y,
+                num_movable_nodes, num_filler_nodes, padding, padding_mask,
+                num_bins_x, num_bins_y, num_movable_impacted_bins_x,
+                num_movable_impacted_bins_y, num_filler_impacted_bins_x,
+                num_filler_impacted_bins_y, deterministic_flag, sorted_node_map)
+        else:
+            # the map without fillers is the one ElectricOverflow evaluates,
+            # fillers are added on top of it afterwards
+            density_map = ElectricDensityMapFunction.forward(
+                pos, node_size_x_clamped, node_size_y_clamped, offset_x, offset_y,
+                ratio, bin_center_x, bin_center_y, initial_density_map,
+                target_density, xl, yl, xh, yh, bin_size_x, bin_size_y,
+                num_movable_nodes, 0, padding, padding_mask,
+                num_bins_x, num_bins_y, num_movable_impacted_bins_x,
+                num_movable_impacted_bins_y, num_filler_impacted_bins_x,
+                num_filler_impacted_bins_y, deterministic_flag, sorted_node_map)
+            bin_area = bin_size_x * bin_size_y
+            overflow_output["overflow"] = (density_map - target_density * bin_area).clamp_(min=0.0).sum().unsqueeze(0)
+            overflow_output["max_density"] = density_map.max().unsqueeze(0) / bin_area
+            if num_filler_nodes:
+                density_map = ElectricDensityMapFunction.forward(
+                    pos, node_size_x_clamped, node_size_y_clamped, offset_x, offset_y,
+                    ratio, bin_center_x, bin_center_y, density_map,
+                    target_density, xl, yl, xh, yh, bin_size_x, bin_size_y,
+                    0, num_filler_nodes, padding, padding_mask,
+                    num_bins_x, num_bins_y, num_movable_impacted_bins_x,
+                    num_movable_impacted_bins_y, num_filler_impacted_bins_x,
+                    num_filler_impacted_bins_y, deterministic_flag, sorted_node_map)
 
         # output consists of (density_cost, density_map, max_density)
         ctx.node_size_x_clamped = node_size_x_clamped
@@ -159,8 +188,10 @@ class ElectricPotentialFunction(Function):
         # compute auv
         density_map.mul_(1.0 / (ctx.bin_size_x * ctx.bin_size_y))
 
+        # the spectral transforms and field maps run in the dtype of the precomputed frequencies,
+        # which may be lower than the dtype of the positions
         #auv = discrete_spectral_transform.dct2_2N(density_map, expk0=exact_expkM, expk1=exact_expkN)
-        auv = dct2.forward(density_map)
+        auv = dct2.forward(density_map.to(inv_wu2_plus_wv2.dtype))
 
         # compute field xi
         auv_by_wu2_plus_wv2_wu = auv.mul(wu_by_wu2_plus_wv2_half)
@@ -183,7 +214,7 @@ class ElectricPotentialFunction(Function):
             #potential_map = discrete_spectral_transform.idcct2(auv_by_wu2_plus_wv2, exact_expkM, exact_expkN)
             potential_map = idct2.forward(auv_by_wu2_plus_wv2)
             # compute energy
-            energy = potential_map.mul(density_map).sum()
+            energy = potential_map.to(density_map.dtype).mul(density_map).sum()
 
         # torch.set_printoptions(precision=10)
         # logger.debug("initial_density_map")
@@ -211,7 +242,7 @@ class ElectricPotentialFunction(Function):
         #    plot(plot_count, ctx.field_map_y.clone().cpu().numpy(), padding, "summary/%d.field_map_y" % (plot_count))
         #plot_count += 1
 
-        if pos.is_cuda:
+        if pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("density forward %.3f ms" % ((time.time() - tt) * 1000))
         return energy
@@ -225,8 +256,8 @@ class ElectricPotentialFunction(Function):
                 ctx.num_movable_impacted_bins_x,
                 ctx.num_movable_impacted_bins_y,
                 ctx.num_filler_impacted_bins_x, ctx.num_filler_impacted_bins_y,
-                ctx.field_map_x.view([-1]), ctx.field_map_y.view(
-                    [-1]), ctx.pos, ctx.node_size_x_clamped,
+                ctx.field_map_x.view([-1]).to(grad_pos.dtype), ctx.field_map_y.view(
+                    [-1]).to(grad_pos.dtype), ctx.pos, ctx.node_size_x_clamped,
                 ctx.node_size_y_clamped, ctx.offset_x, ctx.offset_y, ctx.ratio,
                 ctx.bin_center_x, ctx.bin_center_y, ctx.xl, ctx.yl, ctx.xh,
                 ctx.yh, ctx.bin_size_x, ctx.bin_size_y, ctx.num_movable_nodes,
@@ -237,8 +268,8 @@ class ElectricPotentialFunction(Function):
                 ctx.num_movable_impacted_bins_x,
                 ctx.num_movable_impacted_bins_y,
                 ctx.num_filler_impacted_bins_x, ctx.num_filler_impacted_bins_y,
-                ctx.field_map_x.view([-1]), ctx.field_map_y.view(
-                    [-1]), ctx.pos, ctx.node_size_x_clamped,
+                ctx.field_map_x.view([-1]).to(grad_pos.dtype), ctx.field_map_y.view(
+                    [-1]).to(grad_pos.dtype), ctx.pos, ctx.node_size_x_clamped,
                 ctx.node_size_y_clamped, ctx.offset_x, ctx.offset_y, ctx.ratio,
                 ctx.bin_center_x, ctx.bin_center_y, ctx.xl, ctx.yl, ctx.xh,
                 ctx.yh, ctx.bin_size_x, ctx.bin_size_y, ctx.num_movable_nodes,
@@ -259,7 +290,7 @@ class ElectricPotentialFunction(Function):
         #pgrad = np.concatenate([np.array(pgradx), np.array(pgrady)])
 
         #output = torch.empty_like(ctx.pos).uniform_(0.0, 0.1)
-        if grad_pos.is_cuda:
+        if grad_pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("density backward %.3f ms" % ((time.time() - tt) * 1000))
         return output, \
@@ -272,7 +303,109 @@ class ElectricPotentialFunction(Function):
             None, None, None, None, \
             None, None, None, None, \
             None, None, None, None, \
-            None
+            None, None, None
+
+
+class ElectricPotentialBatchFunction(Function):
+    """
+    @brief compute electric potential of several placements of the same cells.
+    The density maps are scattered placement by placement on the shared fixed density map,
+    the spectral field solve runs on all of them at once.
+    The scatter and the force gather stay loops over the placements,
+    as the compiled density_map and electric_force kernels take a single placement;
+    they are linear in the cells, so the loop costs what separate calls would.
+    """
+    @staticmethod
+    def forward(ctx, pos, op):
+        """
+        @param pos locations of cells of shape [#placements, 2 * #nodes], x and then y in each row
+        @param op ElectricPotential holding the shared data
+        @return energy of each placement, zeros in fast mode
+        """
+        tt = time.time()
+        bin_area = op.bin_size_x * op.bin_size_y
+        density_maps = []
+        overflow = []
+        max_density = []
+        for pos_b in pos:
+            # fillers are added on top of the map ElectricOverflow evaluates
+            density_map = ElectricDensityMapFunction.forward(
+                pos_b, op.node_size_x_clamped, op.node_size_y_clamped, op.offset_x, op.offset_y,
+                op.ratio, op.bin_center_x, op.bin_center_y, op.initial_density_map,
+                op.target_density, op.xl, op.yl, op.xh, op.yh, op.bin_size_x, op.bin_size_y,
+                op.num_movable_nodes, 0, op.padding, op.padding_mask,
+                op.num_bins_x, op.num_bins_y, op.num_movable_impacted_bins_x,
+                op.num_movable_impacted_bins_y, op.num_filler_impacted_bins_x,
+                op.num_filler_impacted_bins_y, op.deterministic_flag, op.sorted_node_map)
+            overflow.append((density_map - op.target_density * bin_area).clamp_(min=0.0).sum())
+            max_density.append(density_map.max() / bin_area)
+            if op.num_filler_nodes:
+                density_map = ElectricDensityMapFunction.forward(
+                    pos_b, op.node_size_x_clamped, op.node_size_y_clamped, op.offset_x, op.offset_y,
+                    op.ratio, op.bin_center_x, op.bin_center_y, density_map,
+                    op.target_density, op.xl, op.yl, op.xh, op.yh, op.bin_size_x, op.bin_size_y,
+                    0, op.num_filler_nodes, op.padding, op.padding_mask,
+                    op.num_bins_x, op.num_bins_y, op.num_movable_impacted_bins_x,
+                    op.num_movable_impacted_bins_y, op.num_filler_impacted_bins_x,
+                    op.num_filler_impacted_bins_y, op.deterministic_flag, op.sorted_node_map)
+            density_maps.append(density_map)
+        op.batch_overflow = torch.stack(overflow)
+        op.batch_max_density = torch.stack(max_density)
+
+        # the batched transforms of discrete_spectral_transform match the 2D ones of dct2_fft2
+        density_map = torch.stack(density_maps).mul_(1.0 / bin_area)
+        auv = discrete_spectral_transform.dct2_N(
+            density_map.to(op.inv_wu2_plus_wv2.dtype), expk0=op.batch_expkM, expk1=op.batch_expkN)
+        ctx.field_map_x = discrete_spectral_transform.idxst_idct(
+            auv.mul(op.wu_by_wu2_plus_wv2_half), op.batch_expkM, op.batch_expkN)
+        ctx.field_map_y = discrete_spectral_transform.idct_idxst(
+            auv.mul(op.wv_by_wu2_plus_wv2_half), op.batch_expkM, op.batch_expkN)
+        if op.fast_mode:
+            energy = torch.zeros(pos.size(0), dtype=pos.dtype, device=pos.device)
+        else:
+            potential_map = discrete_spectral_transform.idct2_2N(
+                auv.mul(op.inv_wu2_plus_wv2), op.batch_expkM, op.batch_expkN)
+            energy = potential_map.to(density_map.dtype).mul(density_map).sum(dim=(1, 2))
+
+        ctx.op = op
+        ctx.pos = pos
+        if pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
+            torch.cuda.synchronize()
+        logger.debug("batch density forward %.3f ms" % ((time.time() - tt) * 1000))
+        return energy
+
+    @staticmethod
+    def backward(ctx, grad_pos):
+        tt = time.time()
+        op = ctx.op
+        output = torch.empty_like(ctx.pos)
+        for b in range(ctx.pos.size(0)):
+            field_map_x = ctx.field_map_x[b].reshape([-1]).to(grad_pos.dtype)
+            field_map_y = ctx.field_map_y[b].reshape([-1]).to(grad_pos.dtype)
+            if grad_pos.is_cuda:
+                output[b] = -electric_potential_cuda.electric_force(
+                    grad_pos[b], op.num_bins_x, op.num_bins_y,
+                    op.num_movable_impacted_bins_x, op.num_movable_impacted_bins_y,
+                    op.num_filler_impacted_bins_x, op.num_filler_impacted_bins_y,
+                    field_map_x, field_map_y, ctx.pos[b], op.node_size_x_clamped,
+                    op.node_size_y_clamped, op.offset_x, op.offset_y, op.ratio,
+                    op.bin_center_x, op.bin_center_y, op.xl, op.yl, op.xh,
+                    op.yh, op.bin_size_x, op.bin_size_y, op.num_movable_nodes,
+                    op.num_filler_nodes, op.deterministic_flag, op.sorted_node_map)
+            else:
+                output[b] = -electric_potential_cpp.electric_force(
+                    grad_pos[b], op.num_bins_x, op.num_bins_y,
+                    op.num_movable_impacted_bins_x, op.num_movable_impacted_bins_y,
+                    op.num_filler_impacted_bins_x, op.num_filler_impacted_bins_y,
+                    field_map_x, field_map_y, ctx.pos[b], op.node_size_x_clamped,
+                    op.node_size_y_clamped, op.offset_x, op.offset_y, op.ratio,
+                    op.bin_center_x, op.bin_center_y, op.xl, op.yl, op.xh,
+                    op.yh, op.bin_size_x, op.bin_size_y, op.num_movable_nodes,
+                    op.num_filler_nodes)
+        if grad_pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
+            torch.cuda.synchronize()
+        logger.debug("batch density backward %.3f ms" % ((time.time() - tt) * 1000))
+        return output, None
 
 
 class ElectricPotential(ElectricOverflow):
@@ -303,7 +436,10 @@ class ElectricPotential(ElectricOverflow):
         region_id=None,
         fence_regions=None, # [n_subregion, 4] as dummy macros added to initial density. (xl,yl,xh,yh) rectangles
         node2fence_region_map=None,
-        placedb=None
+        placedb=None,
+        spectral_dtype=None,
+        incremental_interval=0,
+        incremental_tolerance=0.1
         ):
         """
         @brief initialization
@@ -331,6 +467,9 @@ class ElectricPotential(ElectricOverflow):
         @param fence_regions # [n_subregion, 4] as dummy macros added to initial density. (xl,yl,xh,yh) rectangles
         @param node2fence_region_map node to region id map, non fence region is set to INT_MAX
         @param placedb
+        @param spectral_dtype dtype of the spectral transforms and field maps, e.g., float32 for float64 positions; the dtype of positions if None
+        @param incremental_interval rebuild the density map from scratch every this many evaluations and only scatter the moved cells in between; 0 disables the incremental update
+        @param incremental_tolerance displacement in bins beyond which a cell is scattered again in the incremental update
         """
 
         if(region_id is not None):
@@ -387,10 +526,16 @@ class ElectricPotential(ElectricOverflow):
         self.placedb = placedb
         self.target_density = target_density
         self.region_id = region_id
+        self.spectral_dtype = spectral_dtype
+        self.incremental_interval = incremental_interval
+        self.incremental_tolerance = incremental_tolerance
         ## set by build_density_op func
         self.filler_start_map = None
         self.filler_beg = None
         self.filler_end = None
+        ## overflow and max density of the last forward are recorded if set
+        self.record_overflow = False
+        self.overflow_output = None
 
 
     def compute_fence_region_map(self, fence_region, macro_pos_x=None, macro_pos_y=None, macro_size_x=None, macro_size_y=None):
@@ -449,6 +594,162 @@ class ElectricPotential(ElectricOverflow):
         self.idct_idxst = None
         self.idxst_idct = None
 
+        # incremental density map, cell sizes may have changed
+        self.incremental_groups = None
+        self.incremental_maps = None
+        self.incremental_pos = None
+        self.incremental_count = 0
+
+        # batched forward
+        self.batch_expkM = None
+        self.batch_expkN = None
+        self.batch_overflow = None
+        self.batch_max_density = None
+
+    def scatter_density_map(self, pos, nodes, ratio, initial_density_map, num_impacted_bins_x, num_impacted_bins_y):
+        """
+        @brief add the density of a subset of cells onto a map
+        @param pos location of all cells, x and then y
+        @param nodes indices of the subset
+        @param ratio area ratio of the subset, negative to remove the cells from the map
+        @param initial_density_map map the cells are added onto
+        @param num_impacted_bins_x number of impacted bins for any cell of the subset in x direction
+        @param num_impacted_bins_y number of impacted bins for any cell of the subset in y direction
+        """
+        num_nodes = pos.numel() // 2
+        num_subset_nodes = nodes.numel()
+        return ElectricDensityMapFunction.forward(
+            torch.cat([pos[nodes], pos[num_nodes + nodes]]),
+            self.node_size_x_clamped[nodes], self.node_size_y_clamped[nodes],
+            self.offset_x[nodes], self.offset_y[nodes], ratio,
+            self.bin_center_x, self.bin_center_y, initial_density_map,
+            self.target_density, self.xl, self.yl, self.xh, self.yh,
+            self.bin_size_x, self.bin_size_y, num_subset_nodes, 0,
+            0, self.padding_mask, self.num_bins_x, self.num_bins_y,
+            num_impacted_bins_x, num_impacted_bins_y,
+            num_impacted_bins_x, num_impacted_bins_y,
+            self.deterministic_flag,
+            torch.arange(num_subset_nodes, dtype=torch.int32, device=pos.device))
+
+    def incremental_density_map(self, pos):
+        """
+        @brief density maps of movable cells and fillers, updated only for the cells that moved.
+        Each cell is kept in the maps at a reference position. Once it moves more than
+        incremental_tolerance bins away, its contribution at the reference position is removed,
+        the one at the current position is added and the reference position is updated.
+        So the maps never lag behind by more than the tolerance per cell.
+        They are rebuilt every incremental_interval evaluations to flush the accumulated round-off,
+        and whenever more than half of a group moved, where a rebuild is cheaper.
+        @param pos location of all cells, x and then y
+        @return density maps of movable cells and of fillers without the fixed cells
+        """
+        num_nodes = pos.numel() // 2
+        node_pos = pos.detach().view([2, num_nodes])
+        if self.incremental_groups is None:
+            self.incremental_groups = [
+                (torch.arange(self.num_movable_nodes, dtype=torch.int64, device=pos.device),
+                 self.num_movable_impacted_bins_x, self.num_movable_impacted_bins_y),
+                (torch.arange(num_nodes - self.num_filler_nodes, num_nodes, dtype=torch.int64, device=pos.device),
+                 self.num_filler_impacted_bins_x, self.num_filler_impacted_bins_y)]
+            self.incremental_tolerance_xy = torch.tensor(
+                [[self.bin_size_x * self.incremental_tolerance], [self.bin_size_y * self.incremental_tolerance]],
+                dtype=pos.dtype, device=pos.device)
+        zeros = torch.zeros([self.num_bins_x, self.num_bins_y], dtype=pos.dtype, device=pos.device)
+
+        if self.incremental_maps is None or self.incremental_count >= self.incremental_interval:
+            self.incremental_maps = [
+                self.scatter_density_map(pos, nodes, self.ratio[nodes], zeros, impacted_x, impacted_y)
+                for nodes, impacted_x, impacted_y in self.incremental_groups]
+            self.incremental_pos = node_pos.clone()
+            self.incremental_count = 1
+            return self.incremental_maps
+
+        moved = (node_pos - self.incremental_pos).abs_().gt_(self.incremental_tolerance_xy).any(dim=0)
+        for i, (nodes, impacted_x, impacted_y) in enumerate(self.incremental_groups):
+            moved_nodes = nodes[moved[nodes]]
+            if moved_nodes.numel() * 2 > nodes.numel():
+                self.incremental_maps[i] = self.scatter_density_map(
+                    pos, nodes, self.ratio[nodes], zeros, impacted_x, impacted_y)
+                self.incremental_pos[:, nodes] = node_pos[:, nodes]
+            elif moved_nodes.numel():
+                ratio = self.ratio[moved_nodes]
+                density_map = self.scatter_density_map(
+                    self.incremental_pos.view(-1), moved_nodes, -ratio,
+                    self.incremental_maps[i], impacted_x, impacted_y)
+                self.incremental_maps[i] = self.scatter_density_map(
+                    pos, moved_nodes, ratio, density_map, impacted_x, impacted_y)
+                self.incremental_pos[:, moved_nodes] = node_pos[:, moved_nodes]
+        self.incremental_count += 1
+        return self.incremental_maps
+
+    def initialize(self, pos):
+        """
+        @brief fixed density map, spectral transforms and frequencies, computed at the first forward
+        @param pos location of cells in this electric field, x and then y
+        """
+        num_nodes = pos.size(0)//2
+        if(self.fence_regions is not None):
+            if(self.placedb.num_terminals > 0):
+                ### merge fence region density and macro density together as initial density map
+                ### pay attention to the number of nodes, must use data from self
+                ### here pos is reconstructed pos !
+                self.initial_density_map = self.compute_fence_region_map(
+                    self.fence_regions,
+                    pos[self.num_movable_nodes:self.num_movable_nodes+self.num_terminals],
+                    pos[num_nodes+self.num_movable_nodes:num_nodes+self.num_movable_nodes+self.num_terminals],
+                    self.node_size_x[self.num_movable_nodes:self.num_movable_nodes+self.num_terminals],
+                    self.node_size_y[self.num_movable_nodes:self.num_movable_nodes+self.num_terminals]
+                    )
+            else:
+                self.initial_density_map = self.compute_fence_region_map(self.fence_regions)
+        else:
+            self.compute_initial_density_map(pos)
+        ## sync the initial density map with
+        # self.compute_initial_density_map(pos)
+        # plot(0, self.initial_density_map.clone().div(self.bin_size_x*self.bin_size_y).cpu().numpy(), self.padding, 'summary/initial_potential_map')
+        logger.info("fixed density map: average %g, max %g, bin area %g" %
+                    (self.initial_density_map.mean(),
+                     self.initial_density_map.max(),
+                     self.bin_size_x * self.bin_size_y))
+
+        # expk
+        M = self.num_bins_x
+        N = self.num_bins_y
+        spectral_dtype = self.spectral_dtype if self.spectral_dtype is not None else pos.dtype
+        self.exact_expkM = precompute_expk(M,
+                                           dtype=spectral_dtype,
+                                           device=pos.device)
+        self.exact_expkN = precompute_expk(N,
+                                           dtype=spectral_dtype,
+                                           device=pos.device)
+
+        # init dct2, idct2, idct_idxst, idxst_idct with expkM and expkN
+        self.dct2 = dct.DCT2(self.exact_expkM, self.exact_expkN)
+        if not self.fast_mode:
+            self.idct2 = dct.IDCT2(self.exact_expkM, self.exact_expkN)
+        self.idct_idxst = dct.IDCT_IDXST(self.exact_expkM,
+                                         self.exact_expkN)
+        self.idxst_idct = dct.IDXST_IDCT(self.exact_expkM,
+                                         self.exact_expkN)
+
+        # wu and wv
+        wu = torch.arange(M, dtype=spectral_dtype, device=pos.device).mul(
+            2 * np.pi / M).view([M, 1])
+        # scale wv because the aspect ratio of a bin may not be 1
+        wv = torch.arange(N, dtype=spectral_dtype,
+                          device=pos.device).mul(2 * np.pi / N).view(
+                              [1,
+                               N]).mul_(self.bin_size_x / self.bin_size_y)
+        wu2_plus_wv2 = wu.pow(2) + wv.pow(2)
+        wu2_plus_wv2[0,
+                     0] = 1.0  # avoid zero-division, it will be zeroed out
+        self.inv_wu2_plus_wv2 = 1.0 / wu2_plus_wv2
+        self.inv_wu2_plus_wv2[0, 0] = 0.0
+        self.wu_by_wu2_plus_wv2_half = wu.mul(self.inv_wu2_plus_wv2).mul_(
+            1. / 2)
+        self.wv_by_wu2_plus_wv2_half = wv.mul(self.inv_wu2_plus_wv2).mul_(
+            1. / 2)
+
     def forward(self, pos, mode="density"):
         assert mode in {"density", "overflow"}, "Only support density mode or overflow mode"
         if(self.region_id is not None):
@@ -456,69 +757,25 @@ class ElectricPotential(ElectricOverflow):
             pos = pos[self.pos_mask]
 
         if self.initial_density_map is None:
-            num_nodes = pos.size(0)//2
-            if(self.fence_regions is not None):
-                if(self.placedb.num_terminals > 0):
-                    ### merge fence region density and macro density together as initial density map
-                    ### pay attention to the number of nodes, must use data from self
-                    ### here pos is reconstructed pos !
-                    self.initial_density_map = self.compute_fence_region_map(
-                        self.fence_regions,
-                        pos[self.num_movable_nodes:self.num_movable_nodes+self.num_terminals],
-                        pos[num_nodes+self.num_movable_nodes:num_nodes+self.num_movable_nodes+self.num_terminals],
-                        self.node_size_x[self.num_movable_nodes:self.num_movable_nodes+self.num_terminals],
-                        self.node_size_y[self.num_movable_nodes:self.num_movable_nodes+self.num_terminals]
-                        )
-                else:
-                    self.initial_density_map = self.compute_fence_region_map(self.fence_regions)
-            else:
-                self.compute_initial_density_map(pos)
-            ## sync the initial density map with
-            # self.compute_initial_density_map(pos)
-            # plot(0, self.initial_density_map.clone().div(self.bin_size_x*self.bin_size_y).cpu().numpy(), self.padding, 'summary/initial_potential_map')
-            logger.info("fixed density map: average %g, max %g, bin area %g" %
-                        (self.initial_density_map.mean(),
-                         self.initial_density_map.max(),
-                         self.bin_size_x * self.bin_size_y))
-
-            # expk
-            M = self.num_bins_x
-            N = self.num_bins_y
-            self.exact_expkM = precompute_expk(M,
-                                               dtype=pos.dtype,
-                                               device=pos.device)
-            self.exact_expkN = precompute_expk(N,
-                                               dtype=pos.dtype,
-                                               device=pos.device)
-
-            # init dct2, idct2, idct_idxst, idxst_idct with expkM and expkN
-            self.dct2 = dct.DCT2(self.exact_expkM, self.exact_expkN)
-            if not self.fast_mode:
-                self.idct2 = dct.IDCT2(self.exact_expkM, self.exact_expkN)
-            self.idct_idxst = dct.IDCT_IDXST(self.exact_expkM,
-                                             self.exact_expkN)
-            self.idxst_idct = dct.IDXST_IDCT(self.exact_expkM,
-                                             self.exact_expkN)
-
-            # wu and wv
-            wu = torch.arange(M, dtype=pos.dtype, device=pos.device).mul(
-                2 * np.pi / M).view([M, 1])
-            # scale wv because the aspect ratio of a bin may not be 1
-            wv = torch.arange(N, dtype=pos.dtype,
-                              device=pos.device).mul(2 * np.pi / N).view(
-                                  [1,
-                                   N]).mul_(self.bin_size_x / self.bin_size_y)
-            wu2_plus_wv2 = wu.pow(2) + wv.pow(2)
-            wu2_plus_wv2[0,
-                         0] = 1.0  # avoid zero-division, it will be zeroed out
-            self.inv_wu2_plus_wv2 = 1.0 / wu2_plus_wv2
-            self.inv_wu2_plus_wv2[0, 0] = 0.0
-            self.wu_by_wu2_plus_wv2_half = wu.mul(self.inv_wu2_plus_wv2).mul_(
-                1. / 2)
-            self.wv_by_wu2_plus_wv2_half = wv.mul(self.inv_wu2_plus_wv2).mul_(
-                1. / 2)
+            self.initialize(pos)
 
         if(mode == "density"):
+            # fence region fields use reconstructed positions, padding bins are filled before fillers are added
+            if self.record_overflow and self.region_id is None and self.padding == 0:
+                self.overflow_output = {}
+            else:
+                self.overflow_output = None
+            # the incremental update synchronizes on the moved cells, so a graph capture always rebuilds
+            density_map = None
+            if self.incremental_interval > 0 and self.region_id is None and self.padding == 0 \
+                    and not (pos.is_cuda and torch.cuda.is_current_stream_capturing()):
+                movable_density_map, filler_density_map = self.incremental_density_map(pos)
+                density_map = self.initial_density_map + movable_density_map
+                if self.overflow_output is not None:
+                    bin_area = self.bin_size_x * self.bin_size_y
+                    self.overflow_output["overflow"] = (density_map - self.target_density * bin_area).clamp_(min=0.0).sum().unsqueeze(0)
+                    self.overflow_output["max_density"] = density_map.max().unsqueeze(0) / bin_area
+                density_map.add_(filler_density_map)
             return ElectricPotentialFunction.apply(
                 pos, self.node_size_x_clamped, self.node_size_y_clamped,
                 self.offset_x, self.offset_y, self.ratio, self.bin_center_x,
@@ -532,7 +789,7 @@ class ElectricPotential(ElectricOverflow):
                 self.exact_expkN, self.inv_wu2_plus_wv2,
                 self.wu_by_wu2_plus_wv2_half, self.wv_by_wu2_plus_wv2_half,
                 self.dct2, self.idct2, self.idct_idxst, self.idxst_idct,
-                self.fast_mode)
+                self.fast_mode, self.overflow_output, density_map)
         elif(mode == "overflow"):
             ### num_filler_nodes is set 0
             density_map = ElectricDensityMapFunction.forward(
@@ -552,3 +809,18 @@ class ElectricPotential(ElectricOverflow):
 
             return density_cost, density_map.max() / bin_area
 
+    def forward_batch(self, pos):
+        """
+        @brief electric potential of several placements sharing the cells and the fixed density map
+        @param pos locations of cells of shape [#placements, 2 * #nodes]
+        @return energy of each placement; overflow and max density of each placement are kept in batch_overflow and batch_max_density
+        """
+        assert self.region_id is None and self.padding == 0, "batched density does not support fence regions or padding"
+        if self.initial_density_map is None:
+            self.initialize(pos[0])
+        if self.batch_expkM is None:
+            self.batch_expkM = discrete_spectral_transform.get_expk(
+                self.num_bins_x, dtype=self.inv_wu2_plus_wv2.dtype, device=pos.device)
+            self.batch_expkN = discrete_spectral_transform.get_expk(
+                self.num_bins_y, dtype=self.inv_wu2_plus_wv2.dtype, device=pos.device)
+        return ElectricPotentialBatchFunction.apply(pos, self)
@@ -6,6 +6,7 @@
 #
 
 import math
+import time
 import torch
 from torch import nn
 from torch.autograd import Function
@@ -21,6 +22,245 @@ import pdb
 import logging
 logger = logging.getLogger(__name__)
 
+def segment_max(values, valid, segments, segment_ends, lower, upper):
+    """ 
+    @brief maximum of the valid values in each contiguous segment 
+    @param values values sorted by segment, within [lower, upper]
+    @param valid mask of the values to consider 
+    @param segments segment index of each value, non-decreasing 
+    @param segment_ends end index of each segment 
+    @param lower lower bound of values 
+    @param upper upper bound of values 
+    @return maximum of each segment, -inf if it has no valid value 
+    """
+    # lift segments apart so that a single running maximum does not leak across them;
+    # invalid values sit at the bottom of their segment
+    span = upper - lower + 2
+    base = segments.to(torch.float64) * span
+    lifted = base + torch.where(valid, values - lower + 1, torch.zeros_like(values))
+    running = lifted.cummax(0)[0]
+    result = torch.full((segment_ends.numel(), ), -float('inf'), dtype=torch.float64, device=values.device)
+    nonempty = segment_ends > torch.cat([segment_ends.new_zeros(1), segment_ends[:-1]])
+    ends = segment_ends[nonempty] - 1
+    top = running[ends] - base[ends]
+    result[nonempty] = torch.where(top >= 1, top - 1 + lower, result[nonempty])
+    return result
+
+
+def auction_lap(cost, scaling=4, check_interval=8):
+    """ 
+    @brief solve a batch of linear assignment problems with the auction algorithm and epsilon scaling. 
+    All problems bid in the same vectorized rounds, without host synchronization 
+    except for a check every check_interval rounds whether all rows are assigned. 
+    The assignment is optimal for integer costs. 
+    @param cost [#problems, n, n] cost of assigning row i to column j 
+    @param scaling epsilon is divided by scaling between phases; 
+    as a phase starts from the prices of the previous one, it is capped at (scaling + 2) * n rounds 
+    @param check_interval number of rounds between checks for completion 
+    @return column assigned to each row [#problems, n], and whether each problem converged 
+    """
+    num_problems, n, _ = cost.size()
+    device = cost.device
+    benefit = -cost.to(torch.float64)
+    flat_benefit = benefit.view(num_problems, -1)
+    spread = (flat_benefit.max(1)[0] - flat_benefit.min(1)[0]).clamp(min=1)
+    final_eps = 1.0 / (n + 1)
+    eps = spread / scaling
+    num_phases = max(1, int(math.ceil(math.log(float(spread.max()) / final_eps, scaling))))
+    max_rounds = (scaling + 2) * n
+    prices = benefit.new_zeros(num_problems, n)
+    lowest = -float('inf')
+    # buffers reused by all rounds, the extra column takes writes of rows and columns without a change
+    bids = benefit.new_empty(num_problems, n, n)
+    assign = torch.empty(num_problems, n + 1, dtype=torch.long, device=device)
+    owner = torch.empty(num_problems, n, dtype=torch.long, device=device)
+    outbid = torch.empty(num_problems, n + 1, dtype=torch.bool, device=device)
+    columns = torch.arange(n, device=device).expand(num_problems, n)
+    unused = torch.full((num_problems, n), n, dtype=torch.long, device=device)
+    for phase in range(num_phases):
+        assign.fill_(-1)
+        owner.fill_(-1)
+        for i in range(max_rounds):
+            bidders = assign[:, :n] < 0
+            if i % check_interval == 0 and not bidders.any():
+                break
+            values, choices = (benefit - prices.unsqueeze(1)).topk(2, dim=2)
+            best = choices[..., 0]
+            bid = prices.gather(1, best) + (values[..., 0] - values[..., 1]) + eps.unsqueeze(1)
+            bid.masked_fill_(~bidders, lowest)
+            # bids[p, column, row], the highest bidder wins the column
+            bids.fill_(lowest)
+            bids.scatter_(1, best.unsqueeze(1), bid.unsqueeze(1))
+            win_bid, winner = bids.max(2)
+            won = win_bid > lowest
+            # previous owners of the won columns bid again
+            outbid.fill_(False)
+            outbid.scatter_(1, torch.where(won & (owner >= 0), owner, unused), True)
+            assign.masked_fill_(outbid, -1)
+            owner = torch.where(won, winner, owner)
+            assign.scatter_(1, torch.where(won, winner, unused), columns)
+            prices = torch.where(won, win_bid, prices)
+        eps = (eps / scaling).clamp(min=final_eps)
+    # only the last phase, run with the final epsilon, has to be complete
+    converged = (assign[:, :n] >= 0).all(1)
+    return assign[:, :n].clone(), converged
+
+
+def batched_independent_set_matching(
+        pos, node_size_x, node_size_y, flat_region_boxes,
+        flat_region_boxes_start, node2fence_region_map, flat_net2pin_map,
+        flat_net2pin_start_map, pin2net_map, flat_node2pin_map,
+        flat_node2pin_start_map, pin2node_map, pin_offset_x, pin_offset_y,
+        net_mask, xl, yl, xh, yh, site_width, row_height, num_bins_x,
+        num_bins_y, num_movable_nodes, num_terminal_NIs, num_filler_nodes,
+        batch_size, set_size, max_iters):
+    """ 
+    @brief independent set matching with tensor operations. 
+    Each iteration draws one independent set of movable cells that share no net (a Luby step on random priorities), 
+    partitions it by cell size, fence region and bin into sets of at most set_size cells, 
+    and solves the matchings of batch_size sets at a time with @ref auction_lap. 
+    Matching only permutes cells of the same size among their own locations, so legality is kept. 
+    The work is spread over the intra-op threads of torch. 
+    """
+    tt = time.time()
+    cpu_tt = time.process_time()
+    num_nodes = node_size_x.numel()
+    out = pos.clone()
+    if num_movable_nodes < 2:
+        return out
+    x = out[:num_nodes]
+    y = out[num_nodes:]
+    device = pos.device
+
+    # pins grouped by nets
+    pin_net = pin2net_map[flat_net2pin_map.long()].long()
+    pin_node = pin2node_map[flat_net2pin_map.long()].long()
+    offset_x = pin_offset_x[flat_net2pin_map.long()].to(torch.float64)
+    offset_y = pin_offset_y[flat_net2pin_map.long()].to(torch.float64)
+    net_ends = flat_net2pin_start_map[1:].long()
+    pin_masked = net_mask[pin_net].bool()
+    movable_pin = pin_masked & (pin_node < num_movable_nodes)
+
+    # cells may only trade places with cells of the same size and fence region
+    size = torch.stack([node_size_x[:num_movable_nodes], node_size_y[:num_movable_nodes]], dim=1)
+    size_class = torch.unique(size, dim=0, return_inverse=True)[1]
+    num_regions = max(0, flat_region_boxes_start.numel() - 1)
+    if node2fence_region_map.numel():
+        region = node2fence_region_map[:num_movable_nodes].long().clamp(max=num_regions)
+    else:
+        region = torch.zeros_like(size_class)
+    bin_size_x = (xh - xl) / num_bins_x
+    bin_size_y = (yh - yl) / num_bins_y
+
+    def extremes(values, valid):
+        lower = float(values.min())
+        upper = float(values.max())
+        high = segment_max(values, valid, pin_net, net_ends, lower, upper)
+        low = -segment_max(-values, valid, pin_net, net_ends, -upper, -lower)
+        return low, high
+
+    total_gain = 0.0
+    for iteration in range(max_iters):
+        node_x = x.to(torch.float64)
+        node_y = y.to(torch.float64)
+
+        # Luby step: a cell is selected if it has the lowest priority on all its nets
+        priority = torch.randperm(num_movable_nodes, device=device).to(torch.float64)
+        pin_priority = torch.zeros_like(offset_x)
+        pin_priority[movable_pin] = priority[pin_node[movable_pin]]
+        net_low = -segment_max(-pin_priority, movable_pin, pin_net, net_ends, -float(num_movable_nodes), 0.0)
+        conflict = movable_pin & (net_low[pin_net] < pin_priority)
+        blocked = torch.zeros(num_movable_nodes, dtype=torch.int32, device=device)
+        blocked.index_add_(0, pin_node[conflict], torch.ones_like(pin_node[conflict], dtype=torch.int32))
+        cells = (blocked == 0).nonzero().view(-1)
+
+        # partition into sets of the same size, region and bin
+        bx = ((node_x[cells] - xl) / bin_size_x).floor().clamp(0, num_bins_x - 1).long()
+        by = ((node_y[cells] - yl) / bin_size_y).floor().clamp(0, num_bins_y - 1).long()
+        key = ((size_class[cells] * (num_regions + 1) + region[cells]) * num_bins_y + by) * num_bins_x + bx
+        key, order = key.sort()
+        cells = cells[order]
+        counts = torch.unique_consecutive(key, return_counts=True)[1]
+        rank = torch.arange(cells.numel(), device=device) - (counts.cumsum(0) - counts).repeat_interleave(counts)
+        set_ids = (rank % set_size == 0).long().cumsum(0) - 1
+        local = rank % set_size
+        keep = torch.bincount(set_ids)[set_ids] >= 2
+        cells = cells[keep]
+        local = local[keep]
+        if cells.numel() == 0:
+            break
+        set_ids = torch.unique_consecutive(set_ids[keep], return_inverse=True)[1]
+        num_sets = int(set_ids[-1]) + 1
+        n = int(local.max()) + 1
+        slot_valid = torch.zeros(num_sets, n, dtype=torch.bool, device=device)
+        slot_valid[set_ids, local] = True
+        slot_x = node_x.new_zeros(num_sets, n)
+        slot_y = node_x.new_zeros(num_sets, n)
+        slot_x[set_ids, local] = node_x[cells]
+        slot_y[set_ids, local] = node_y[cells]
+
+        # each masked net has at most one selected cell; cost[s, i, j] sums
+        # the HPWL of the nets of cell i in set s when it moves to slot j
+        selected = torch.zeros(num_nodes, dtype=torch.bool, device=device)
+        selected[cells] = True
+        pin_selected = pin_masked & selected[pin_node]
+        others = pin_masked & ~pin_selected
+        other_xl, other_xh = extremes(node_x[pin_node] + offset_x, others)
+        other_yl, other_yh = extremes(node_y[pin_node] + offset_y, others)
+        own_xl, own_xh = extremes(offset_x, pin_selected)
+        own_yl, own_yh = extremes(offset_y, pin_selected)
+        owner = segment_max(pin_node.to(torch.float64), pin_selected, pin_net, net_ends, 0.0, float(num_nodes))
+        nets = (owner > -float('inf')).nonzero().view(-1)
+        node2set = torch.zeros(num_nodes, dtype=torch.long, device=device)
+        node2local = torch.zeros(num_nodes, dtype=torch.long, device=device)
+        node2set[cells] = set_ids
+        node2local[cells] = local
+        owners = owner[nets].long()
+        sets = node2set[owners]
+        sx = slot_x[sets]
+        sy = slot_y[sets]
+        hpwl = torch.max(other_xh[nets].unsqueeze(1), sx + own_xh[nets].unsqueeze(1)) \
+            - torch.min(other_xl[nets].unsqueeze(1), sx + own_xl[nets].unsqueeze(1)) \
+            + torch.max(other_yh[nets].unsqueeze(1), sy + own_yh[nets].unsqueeze(1)) \
+            - torch.min(other_yl[nets].unsqueeze(1), sy + own_yl[nets].unsqueeze(1))
+        cost = node_x.new_zeros(num_sets * n, n)
+        cost.index_add_(0, sets * n + node2local[owners], hpwl)
+        cost = cost.view(num_sets, n, n)
+        # padding rows and columns only match each other
+        pair_valid = slot_valid.unsqueeze(2) & slot_valid.unsqueeze(1)
+        pair_padding = ~slot_valid.unsqueeze(2) & ~slot_valid.unsqueeze(1)
+        forbidden = cost.max() * n + 1
+        cost = torch.where(pair_valid, cost, torch.where(pair_padding, torch.zeros_like(cost), forbidden * torch.ones_like(cost)))
+
+        identity = torch.arange(n, device=device).expand(num_sets, n)
+        assign = torch.empty_like(identity)
+        for begin in range(0, num_sets, batch_size):
+            end = min(begin + batch_size, num_sets)
+            columns, converged = auction_lap(cost[begin:end])
+            assign[begin:end] = torch.where(converged.unsqueeze(1), columns, identity[begin:end])
+        before = cost.diagonal(dim1=1, dim2=2).sum(1)
+        after = cost.gather(2, assign.unsqueeze(2)).sum((1, 2))
+        improved = after < before
+        gain = float((before - after)[improved].sum())
+        if gain <= 0:
+            break
+        total_gain += gain
+        moved = improved[set_ids]
+        targets = assign[set_ids, local][moved]
+        moved_sets = set_ids[moved]
+        x[cells[moved]] = slot_x[moved_sets, targets].to(x.dtype)
+        y[cells[moved]] = slot_y[moved_sets, targets].to(y.dtype)
+        logger.debug("batched ISM iteration %d, %d sets, %d cells, HPWL gain %g" %
+                     (iteration, num_sets, cells.numel(), gain))
+
+    logger.info("batched ISM HPWL gain %g" % (total_gain))
+    if not pos.is_cuda:
+        # share of the intra-op threads kept busy, CPU time does not cover device kernels
+        efficiency = (time.process_time() - cpu_tt) / (max(time.time() - tt, 1e-6) * torch.get_num_threads())
+        logger.info("batched ISM parallel efficiency %.1f%% of %d threads" % (efficiency * 100, torch.get_num_threads()))
+    return out
+
+
 class IndependentSetMatchingFunction(Function):
     """ Detailed placement with independent set matching
     """
@@ -33,7 +273,17 @@ class IndependentSetMatchingFunction(Function):
                 site_width, row_height, num_bins_x, num_bins_y,
                 num_movable_nodes, num_terminal_NIs, num_filler_nodes,
                 batch_size, set_size, max_iters, algorithm):
-        if pos.is_cuda:
+        if algorithm == 'batched':
+            output = batched_independent_set_matching(
+                pos.view(pos.numel()), node_size_x, node_size_y,
+                flat_region_boxes, flat_region_boxes_start,
+                node2fence_region_map, flat_net2pin_map,
+                flat_net2pin_start_map, pin2net_map, flat_node2pin_map,
+                flat_node2pin_start_map, pin2node_map, pin_offset_x,
+                pin_offset_y, net_mask, xl, yl, xh, yh, site_width, row_height,
+                num_bins_x, num_bins_y, num_movable_nodes, num_terminal_NIs,
+                num_filler_nodes, batch_size, set_size, max_iters)
+        elif pos.is_cuda:
             output = independent_set_matching_cuda.independent_set_matching(
                 pos.view(pos.numel()), node_size_x, node_size_y,
                 flat_region_boxes, flat_region_boxes_start,
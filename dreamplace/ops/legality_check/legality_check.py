@@ -5,6 +5,7 @@
 #
 
 import math
+import logging
 import torch
 from torch import nn
 from torch.autograd import Function
@@ -61,3 +62,237 @@ class LegalityCheck(object):
             self.node2fence_region_map, self.xl, self.yl, self.xh, self.yh,
             self.site_width, self.row_height, self.scale_factor,
             self.num_terminals, self.num_movable_nodes)
+
+
+class IncrementalLegalityCheck(LegalityCheck):
+    """ Vectorized legality check with the same criteria as @ref LegalityCheck. 
+    Once a placement has been verified legal, a per-row occupancy index of sorted intervals is kept, 
+    and later calls only re-verify the rows touched by the cells that moved since then, 
+    e.g., by global swap, k-reorder or independent set matching. 
+    A full scan runs when there is no index yet or when too many cells moved. 
+    """
+    def __init__(self, node_size_x, node_size_y, flat_region_boxes,
+                 flat_region_boxes_start, node2fence_region_map, xl, yl, xh,
+                 yh, site_width, row_height, scale_factor, num_terminals,
+                 num_movable_nodes, full_check_ratio=0.5):
+        """
+        @param full_check_ratio fall back to a full scan if more than this fraction of movable cells moved
+        """
+        super(IncrementalLegalityCheck, self).__init__(
+            node_size_x, node_size_y, flat_region_boxes,
+            flat_region_boxes_start, node2fence_region_map, xl, yl, xh, yh,
+            site_width, row_height, scale_factor, num_terminals,
+            num_movable_nodes)
+        self.full_check_ratio = full_check_ratio
+        # coordinates are integers before being scaled
+        self.precision = scale_factor * 1e-2
+        self.num_rows = int(math.ceil((yh - yl) / row_height - 1e-6))
+        self.num_regions = max(0, self.flat_region_boxes_start.numel() - 1)
+        # rows are lifted apart along x so that one sort orders all rows
+        self.row_span = (xh - xl) + site_width
+        self.device = None
+        self.reset()
+
+    def reset(self):
+        """ 
+        @brief drop the occupancy index so that the next call runs a full scan 
+        """
+        self.index = None
+        self.ref_x = None
+        self.ref_y = None
+
+    def prepare(self, device):
+        """ 
+        @brief move cell sizes and fence regions to the device of the positions 
+        """
+        if self.device == device:
+            return
+        self.device = device
+        num_checked = self.num_movable_nodes + self.num_terminals
+        self.size_x = self.node_size_x[:num_checked].to(device=device, dtype=torch.float64)
+        self.size_y = self.node_size_y[:num_checked].to(device=device, dtype=torch.float64)
+        if self.num_regions > 0:
+            self.fence_map = self.node2fence_region_map[:self.num_movable_nodes].to(device).long()
+            self.region_boxes = self.flat_region_boxes.to(device=device, dtype=torch.float64).view(-1, 4)
+            counts = self.flat_region_boxes_start[1:] - self.flat_region_boxes_start[:-1]
+            self.box2region_map = torch.arange(self.num_regions).repeat_interleave(counts.long()).to(device)
+        self.reset()
+
+    def row_intervals(self, nodes, x, y):
+        """ 
+        @brief expand cells into one interval per row they cover 
+        @param nodes cell indices 
+        @param x lower-left x of the cells 
+        @param y lower-left y of the cells 
+        @return lifted left, lifted right, row and cell of the intervals, sorted by lifted left 
+        """
+        w = self.size_x[nodes]
+        h = self.size_y[nodes]
+        row_l = ((y - self.yl + self.precision) / self.row_height).floor().clamp(0, self.num_rows).long()
+        row_h = ((y + h - self.yl - self.precision) / self.row_height).ceil().clamp(0, self.num_rows).long()
+        counts = (row_h - row_l).clamp(min=0)
+        counts.masked_fill_(w <= self.precision, 0)
+        total = int(counts.sum())
+        starts = counts.cumsum(0) - counts
+        offsets = torch.arange(total, device=x.device) - starts.repeat_interleave(counts)
+        rows = row_l.repeat_interleave(counts) + offsets
+        lifted = rows.to(x.dtype) * self.row_span
+        left = lifted + (x - self.xl).clamp(0, self.xh - self.xl).repeat_interleave(counts)
+        right = lifted + (x + w - self.xl).clamp(0, self.xh - self.xl).repeat_interleave(counts)
+        left, order = left.sort()
+        return left, right[order], rows[order], nodes.repeat_interleave(counts)[order]
+
+    def overlap(self, left, right, nodes):
+        """ 
+        @brief overlap among intervals sorted by lifted left; fixed cells may overlap each other 
+        @return mask of intervals overlapping an earlier one 
+        """
+        if left.numel() < 2:
+            return torch.zeros_like(left, dtype=torch.bool)
+        movable = nodes < self.num_movable_nodes
+        lowest = right.new_full((1, ), -float('inf'))
+        reach = torch.cat([lowest, right.cummax(0)[0][:-1]])
+        movable_right = torch.where(movable, right, lowest.expand_as(right))
+        movable_reach = torch.cat([lowest, movable_right.cummax(0)[0][:-1]])
+        return torch.where(movable, left < reach - self.precision,
+                           left < movable_reach - self.precision)
+
+    def cell_errors(self, nodes, x, y):
+        """ 
+        @brief boundary, alignment and fence region violations of movable cells 
+        """
+        w = self.size_x[nodes]
+        h = self.size_y[nodes]
+        boundary = (x < self.xl - self.precision) | (x + w > self.xh + self.precision) \
+            | (y < self.yl - self.precision) | (y + h > self.yh + self.precision)
+        sites = (x - self.xl) / self.site_width
+        rows = (y - self.yl) / self.row_height
+        alignment = ((sites - sites.round()).abs() * self.site_width > self.precision) \
+            | ((rows - rows.round()).abs() * self.row_height > self.precision)
+        fence = torch.zeros_like(boundary)
+        if self.num_regions > 0:
+            # cells must lie inside the boxes of their own fence region,
+            # and cells of other regions must not overlap them
+            region = self.fence_map[nodes]
+            boxes = self.region_boxes
+            chunk = max(1, (1 << 22) // max(1, boxes.size(0)))
+            for begin in range(0, nodes.numel(), chunk):
+                end = min(begin + chunk, nodes.numel())
+                cx = x[begin:end].unsqueeze(1)
+                cy = y[begin:end].unsqueeze(1)
+                cw = w[begin:end].unsqueeze(1)
+                ch = h[begin:end].unsqueeze(1)
+                area = (torch.min(cx + cw, boxes[:, 2]) - torch.max(cx, boxes[:, 0])).clamp(min=0) \
+                    * (torch.min(cy + ch, boxes[:, 3]) - torch.max(cy, boxes[:, 1])).clamp(min=0)
+                own = self.box2region_map.unsqueeze(0) == region[begin:end].unsqueeze(1)
+                inside = (area * own).sum(1)
+                outside = (area * ~own).sum(1)
+                tolerance = self.precision * (w[begin:end] + h[begin:end])
+                fence[begin:end] = ((region[begin:end] < self.num_regions)
+                                    & (inside < w[begin:end] * h[begin:end] - tolerance)) \
+                    | (outside > tolerance)
+        return boundary, alignment, fence
+
+    def report(self, nodes, boundary, alignment, fence, overlap_nodes):
+        """ 
+        @brief log violations 
+        @return whether the placement is legal 
+        """
+        legal = True
+        for name, mask in (("out of boundary", boundary),
+                           ("not aligned to rows or sites", alignment),
+                           ("violating fence regions", fence)):
+            num_errors = int(mask.sum())
+            if num_errors:
+                logging.error("%d cells %s, e.g., %s" %
+                              (num_errors, name, nodes[mask][:8].tolist()))
+                legal = False
+        if overlap_nodes.numel():
+            logging.error("%d overlapping cells, e.g., %s" %
+                          (overlap_nodes.numel(), overlap_nodes[:8].tolist()))
+            legal = False
+        return legal
+
+    def forward(self, pos):
+        """ 
+        @param pos current roughly legal position
+        """
+        self.prepare(pos.device)
+        num_nodes = self.node_size_x.numel()
+        num_checked = self.num_movable_nodes + self.num_terminals
+        # copies, as the detailed placers may update pos in place
+        x = pos[:num_checked].detach().to(torch.float64, copy=True)
+        y = pos[num_nodes:num_nodes + num_checked].detach().to(torch.float64, copy=True)
+
+        if self.index is not None:
+            moved = ((x != self.ref_x) | (y != self.ref_y)).nonzero().view(-1)
+            if moved.numel() == 0:
+                return True
+            if moved.numel() <= self.full_check_ratio * self.num_movable_nodes:
+                return self.forward_rows(moved, x, y)
+        return self.forward_full(x, y)
+
+    def forward_full(self, x, y):
+        """ 
+        @brief scan all cells and rebuild the occupancy index 
+        """
+        movable = torch.arange(self.num_movable_nodes, device=x.device)
+        errors = self.cell_errors(movable, x[:self.num_movable_nodes], y[:self.num_movable_nodes])
+        index = self.row_intervals(torch.arange(x.numel(), device=x.device), x, y)
+        overlap_nodes = index[3][self.overlap(index[0], index[1], index[3])].unique()
+        legal = self.report(movable, *errors, overlap_nodes)
+        if legal:
+            self.index = index
+            self.ref_x = x
+            self.ref_y = y
+        else:
+            self.reset()
+        return legal
+
+    def forward_rows(self, moved, x, y):
+        """ 
+        @brief re-verify the moved cells and the rows they left or entered 
+        @param moved cells whose positions differ from the last legal placement 
+        """
+        left, right, rows, nodes = self.index
+        moved_movable = moved[moved < self.num_movable_nodes]
+        errors = self.cell_errors(moved_movable, x[moved_movable], y[moved_movable])
+
+        moved_mask = torch.zeros_like(x, dtype=torch.bool)
+        moved_mask[moved] = True
+        stale = moved_mask[nodes]
+        entries = self.row_intervals(moved, x[moved], y[moved])
+        touched = torch.zeros(self.num_rows, dtype=torch.bool, device=x.device)
+        touched[rows[stale]] = True
+        touched[entries[2]] = True
+        in_touched = touched[rows]
+        resident = in_touched & ~stale
+        left_t, order = torch.cat([left[resident], entries[0]]).sort()
+        right_t = torch.cat([right[resident], entries[1]])[order]
+        rows_t = torch.cat([rows[resident], entries[2]])[order]
+        nodes_t = torch.cat([nodes[resident], entries[3]])[order]
+        overlap_nodes = nodes_t[self.overlap(left_t, right_t, nodes_t)].unique()
+
+        legal = self.report(moved_movable, *errors, overlap_nodes)
+        if not legal:
+            self.reset()
+            return legal
+
+        # merge the re-verified rows back into the sorted index
+        kept = ~in_touched
+        kept_left = left[kept]
+        slots = torch.searchsorted(kept_left, left_t) \
+            + torch.arange(left_t.numel(), device=x.device)
+        slot_mask = torch.zeros(kept_left.numel() + left_t.numel(), dtype=torch.bool, device=x.device)
+        slot_mask[slots] = True
+        merged = []
+        for old, new in ((kept_left, left_t), (right[kept], right_t),
+                         (rows[kept], rows_t), (nodes[kept], nodes_t)):
+            values = old.new_empty(slot_mask.numel())
+            values[slots] = new
+            values[~slot_mask] = old
+            merged.append(values)
+        self.index = tuple(merged)
+        self.ref_x = x
+        self.ref_y = y
+        return legal
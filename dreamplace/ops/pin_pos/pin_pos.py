@@ -6,6 +6,7 @@
 #
 
 import math
+import logging
 import torch
 from torch import nn
 from torch.autograd import Function
@@ -18,6 +19,8 @@ if configure.compile_configurations["CUDA_FOUND"] == "TRUE":
 
 import pdb
 
+logger = logging.getLogger(__name__)
+
 
 class PinPosFunction(Function):
     """
@@ -79,7 +82,7 @@ class PinPosSegmentFunction(Function):
         ctx.flat_node2pin_start_map = flat_node2pin_start_map
         ctx.num_physical_nodes = num_physical_nodes
 
-        if pos.is_cuda:
+        if pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
 
         return output
@@ -94,7 +97,7 @@ class PinPosSegmentFunction(Function):
                 ctx.flat_node2pin_start_map, ctx.num_physical_nodes)
         else:
             assert 0, "CPU version NOT implemented"
-        if grad_pin_pos.is_cuda:
+        if grad_pin_pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
 
         return output, None, None, None, None, None, None
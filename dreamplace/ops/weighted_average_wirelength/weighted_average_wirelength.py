@@ -63,7 +63,7 @@ class WeightedAverageWirelengthFunction(Function):
         ctx.xyexp_xy_sum = output[5]
         ctx.xyexp_nxy_sum = output[6]
 
-        if pos.is_cuda:
+        if pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("wirelength forward %.3f ms" %
                      ((time.time() - tt) * 1000))
@@ -84,7 +84,7 @@ class WeightedAverageWirelengthFunction(Function):
                       ctx.net_mask, ctx.inv_gamma)
         output[:output.numel() // 2].masked_fill_(ctx.pin_mask, 0.0)
         output[output.numel() // 2:].masked_fill_(ctx.pin_mask, 0.0)
-        if grad_pos.is_cuda:
+        if grad_pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("wirelength backward %.3f ms" %
                      ((time.time() - tt) * 1000))
@@ -129,7 +129,7 @@ class WeightedAverageWirelengthAtomicFunction(Function):
         ctx.pos = pos
         #if torch.isnan(ctx.exp_xy).any() or torch.isnan(ctx.exp_nxy).any() or torch.isnan(ctx.exp_xy_sum).any() or torch.isnan(ctx.exp_nxy_sum).any() or torch.isnan(output[0]).any():
         #    pdb.set_trace()
-        if pos.is_cuda:
+        if pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("wirelength forward %.3f ms" %
                      ((time.time() - tt) * 1000))
@@ -150,7 +150,7 @@ class WeightedAverageWirelengthAtomicFunction(Function):
                       ctx.net_mask, ctx.inv_gamma)
         output[:int(output.numel() // 2)].masked_fill_(ctx.pin_mask, 0.0)
         output[int(output.numel() // 2):].masked_fill_(ctx.pin_mask, 0.0)
-        if grad_pos.is_cuda:
+        if grad_pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("wirelength backward %.3f ms" %
                      ((time.time() - tt) * 1000))
@@ -188,7 +188,7 @@ class WeightedAverageWirelengthMergedFunction(Function):
         ctx.inv_gamma = inv_gamma
         ctx.grad_intermediate = output[1]
         ctx.pos = pos
-        if pos.is_cuda:
+        if pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("wirelength forward %.3f ms" %
                      ((time.time() - tt) * 1000))
@@ -206,7 +206,102 @@ class WeightedAverageWirelengthMergedFunction(Function):
                       ctx.net_weights, ctx.net_mask, ctx.inv_gamma)
         output[:int(output.numel() // 2)].masked_fill_(ctx.pin_mask, 0.0)
         output[int(output.numel() // 2):].masked_fill_(ctx.pin_mask, 0.0)
-        if grad_pos.is_cuda:
+        if grad_pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
+            torch.cuda.synchronize()
+        logger.debug("wirelength backward %.3f ms" %
+                     ((time.time() - tt) * 1000))
+        return output, None, None, None, None, None, None, None
+
+
+def net_extremes(pin_pos, flat_netpin, netpin_start, pin2net_map):
+    """
+    @brief maximum and minimum pin location of each net, reduced by pin2net_map in the dtype of pin_pos
+    so that no buffer larger than the pin locations is needed.
+    @param pin_pos pin locations of shape [#rows, #pins], e.g., x and y rows of one or several placements
+    @return (max, min) of shape [#rows, #nets] in the dtype of pin_pos, 0 for empty nets
+    """
+    with torch.no_grad():
+        shape = [pin_pos.size(0), netpin_start.numel() - 1]
+        nets = pin2net_map.long().view([1, -1]).expand_as(pin_pos)
+        net_max = pin_pos.new_zeros(shape).scatter_reduce_(1, nets, pin_pos, "amax", include_self=False)
+        net_min = pin_pos.new_zeros(shape).scatter_reduce_(1, nets, pin_pos, "amin", include_self=False)
+    return net_max, net_min
+
+
+class WeightedAverageWirelengthLeanFunction(Function):
+    """
+    @brief compute weighted average wirelength, keeping only per-net values for backward.
+    Per net and direction, the log of the exponential sums and the exponentially weighted means are kept,
+    the per-pin exponentials are recomputed in backward.
+    Pin locations of several placements can be stacked as (x array, y array) pairs;
+    the output is the sum over them, so each placement receives its own gradient.
+    """
+    @staticmethod
+    def forward(ctx, pos, flat_netpin, netpin_start, pin2net_map, net_weights,
+                net_mask, pin_mask, inv_gamma):
+        """
+        @param pos pin location (x array, y array), not cell location, possibly for several placements in a row
+        @param flat_netpin flat netpin map, length of #pins
+        @param netpin_start starting index in netpin map for each net, length of #nets+1, the last entry is #pins
+        @param pin2net_map pin2net map
+        @param net_weights weight of nets
+        @param net_mask whether to compute wirelength, 1 means to compute, 0 means to ignore
+        @param pin_mask whether compute gradient for a pin, 1 means to fill with zero, 0 means to compute
+        @param inv_gamma 1/gamma, the larger, the closer to HPWL; a scalar or one per x and y array of shape [#arrays, 1]
+        """
+        tt = time.time()
+        pin_pos = pos.view([-1, pin2net_map.numel()])
+        num_nets = netpin_start.numel() - 1
+        nets = pin2net_map.long()
+        net_max, net_min = net_extremes(pin_pos, flat_netpin, netpin_start, pin2net_map)
+        tiny = torch.finfo(pos.dtype).tiny
+
+        # x_max + gamma*log(sum(exp((x-x_max)/gamma))) and sum(x*exp(x/gamma))/sum(exp(x/gamma)), and their mirrors
+        exp_xy = (pin_pos - net_max[:, nets]).mul_(inv_gamma).exp_()
+        exp_xy_sum = pin_pos.new_zeros([pin_pos.size(0), num_nets]).index_add_(1, nets, exp_xy).clamp_(min=tiny)
+        xy_mean = pin_pos.new_zeros([pin_pos.size(0), num_nets]).index_add_(1, nets, exp_xy.mul_(pin_pos)).div_(exp_xy_sum)
+        del exp_xy
+        exp_nxy = (net_min[:, nets] - pin_pos).mul_(inv_gamma).exp_()
+        exp_nxy_sum = pin_pos.new_zeros([pin_pos.size(0), num_nets]).index_add_(1, nets, exp_nxy).clamp_(min=tiny)
+        nxy_mean = pin_pos.new_zeros([pin_pos.size(0), num_nets]).index_add_(1, nets, exp_nxy.mul_(pin_pos)).div_(exp_nxy_sum)
+        del exp_nxy
+
+        weights = net_mask.to(pos.dtype)
+        if net_weights.numel():
+            weights = weights * net_weights
+        output = (xy_mean - nxy_mean).sum(dim=0).mul_(weights).sum()
+
+        ctx.pin2net_map = pin2net_map
+        ctx.pin_mask = pin_mask
+        ctx.inv_gamma = inv_gamma
+        ctx.weights = weights
+        ctx.pos = pos
+        ctx.xy_lse = exp_xy_sum.log_().div_(inv_gamma).add_(net_max)
+        ctx.nxy_lse = exp_nxy_sum.log_().div_(inv_gamma).neg_().add_(net_min)
+        ctx.xy_mean = xy_mean
+        ctx.nxy_mean = nxy_mean
+
+        if pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
+            torch.cuda.synchronize()
+        logger.debug("wirelength forward %.3f ms" %
+                     ((time.time() - tt) * 1000))
+        return output
+
+    @staticmethod
+    def backward(ctx, grad_pos):
+        tt = time.time()
+        pin_pos = ctx.pos.view([-1, ctx.pin2net_map.numel()])
+        nets = ctx.pin2net_map.long()
+        inv_gamma = ctx.inv_gamma
+        # exp((x-x_max)/gamma)/sum * (1 + (x - mean)/gamma) - exp((x_min-x)/gamma)/sum * (1 - (x - mean)/gamma)
+        output = (pin_pos - ctx.xy_lse[:, nets]).mul_(inv_gamma).exp_().mul_(
+                (pin_pos - ctx.xy_mean[:, nets]).mul_(inv_gamma).add_(1))
+        output.sub_((ctx.nxy_lse[:, nets] - pin_pos).mul_(inv_gamma).exp_().mul_(
+                (ctx.nxy_mean[:, nets] - pin_pos).mul_(inv_gamma).add_(1)))
+        output.mul_(ctx.weights[nets]).mul_(grad_pos)
+        output.masked_fill_(ctx.pin_mask.bool().view([1, -1]), 0.0)
+        output = output.view([-1])
+        if grad_pos.is_cuda and logger.isEnabledFor(logging.DEBUG):
             torch.cuda.synchronize()
         logger.debug("wirelength backward %.3f ms" %
                      ((time.time() - tt) * 1000))
@@ -218,7 +313,12 @@ class WeightedAverageWirelength(nn.Module):
     @brief Compute weighted average wirelength.
     CPU only supports net-by-net algorithm.
     GPU supports three algorithms: net-by-net, atomic, merged.
+    The lean algorithm runs on both and recomputes the per-pin exponentials in backward
+    instead of keeping them, for designs where peak memory matters more than time.
     Different parameters are required for different algorithms.
+    With a precision lower than the dtype of the positions, pin locations are rounded to it,
+    so the exponentials and the buffers kept for backward take less memory,
+    while the wirelength and the gradient are returned in the dtype of the positions.
     """
     def __init__(self,
                  flat_netpin=None,
@@ -228,7 +328,9 @@ class WeightedAverageWirelength(nn.Module):
                  net_mask=None,
                  pin_mask=None,
                  gamma=None,
-                 algorithm='atomic'):
+                 algorithm='atomic',
+                 precision=None,
+                 check_interval=100):
         """
         @brief initialization
         @param flat_netpin flat netpin map, length of #pins
@@ -238,14 +340,16 @@ class WeightedAverageWirelength(nn.Module):
         @param net_mask whether to compute wirelength, 1 means to compute, 0 means to ignore
         @param pin_mask whether compute gradient for a pin, 1 means to fill with zero, 0 means to compute
         @param gamma the smaller, the closer to HPWL
-        @param algorithm must be net-by-net | atomic | merged
+        @param algorithm must be net-by-net | atomic | merged | lean
+        @param precision dtype of the wirelength kernels, the dtype of positions if None
+        @param check_interval evaluations between two checks for non-finite wirelength in reduced precision
         """
         super(WeightedAverageWirelength, self).__init__()
         assert net_weights is not None \
                 and net_mask is not None \
                 and pin_mask is not None \
                 and gamma is not None, "net_weights, net_mask, pin_mask, gamma are requried parameters"
-        if algorithm in ['net-by-net', 'merged']:
+        if algorithm in ['net-by-net', 'merged', 'lean']:
             assert flat_netpin is not None and netpin_start is not None and pin2net_map is not None, "flat_netpin, netpin_start, pin2net_map are requried parameters for algorithm %s" % (
                 algorithm)
         elif algorithm == 'atomic':
@@ -260,18 +364,56 @@ class WeightedAverageWirelength(nn.Module):
         self.pin_mask = pin_mask
         self.gamma = gamma
         self.algorithm = algorithm
+        self.precision = precision
+        self.check_interval = check_interval
+        # like loss scaling, reduced precision is backed off for a growing number of evaluations
+        # once non-finite values show up, the flag is only read every check_interval evaluations
+        self.nonfinite = None
+        self.num_evaluations = 0
+        self.num_fallback_evaluations = 0
+        self.fallback_interval = check_interval
 
     def forward(self, pos):
+        if self.precision is None or self.precision == pos.dtype:
+            return self.wirelength(pos, self.net_weights)
+        if self.num_fallback_evaluations > 0:
+            self.num_fallback_evaluations -= 1
+            return self.wirelength(pos, self.net_weights)
+
+        result = self.wirelength(pos.to(self.precision), self.net_weights.to(self.precision)).to(pos.dtype)
+        # a captured CUDA graph cannot read the flag back
+        if pos.is_cuda and torch.cuda.is_current_stream_capturing():
+            return result
+        nonfinite = ~torch.isfinite(result)
+        self.nonfinite = nonfinite if self.nonfinite is None else self.nonfinite | nonfinite
+        self.num_evaluations += 1
+        if self.num_evaluations % self.check_interval == 0:
+            if self.nonfinite.any().item():
+                logger.warning("non-finite wirelength in %s, use %s for the next %d evaluations"
+                        % (self.precision, pos.dtype, self.fallback_interval))
+                self.num_fallback_evaluations = self.fallback_interval
+                self.fallback_interval *= 2
+            self.nonfinite = None
+        return result
+
+    def wirelength(self, pos, net_weights):
+        """
+        @brief wirelength in the dtype of pos
+        @param pos pin location (x array, y array)
+        @param net_weights weight of nets in the dtype of pos
+        """
+        # do not store inv_gamma as gamma is changing
+        inv_gamma = (1.0 / self.gamma).to(pos.dtype)
         if self.algorithm == 'net-by-net':
             return WeightedAverageWirelengthFunction.apply(
                 pos,
                 self.flat_netpin,
                 self.netpin_start,
                 self.pin2net_map,
-                self.net_weights,
+                net_weights,
                 self.net_mask,
                 self.pin_mask,
-                1.0 / self.gamma  # do not store inv_gamma as gamma is changing
+                inv_gamma
             )
         elif self.algorithm == 'atomic':
             return WeightedAverageWirelengthAtomicFunction.apply(
@@ -279,10 +421,10 @@ class WeightedAverageWirelength(nn.Module):
                 self.pin2net_map,
                 self.flat_netpin,
                 self.netpin_start,
-                self.net_weights,
+                net_weights,
                 self.net_mask,
                 self.pin_mask,
-                1.0 / self.gamma  # do not store inv_gamma as gamma is changing
+                inv_gamma
             )
         elif self.algorithm == 'merged':
             return WeightedAverageWirelengthMergedFunction.apply(
@@ -290,8 +432,19 @@ class WeightedAverageWirelength(nn.Module):
                 self.flat_netpin,
                 self.netpin_start,
                 self.pin2net_map,
-                self.net_weights,
+                net_weights,
+                self.net_mask,
+                self.pin_mask,
+                inv_gamma
+            )
+        elif self.algorithm == 'lean':
+            return WeightedAverageWirelengthLeanFunction.apply(
+                pos,
+                self.flat_netpin,
+                self.netpin_start,
+                self.pin2net_map,
+                net_weights,
                 self.net_mask,
                 self.pin_mask,
-                1.0 / self.gamma  # do not store inv_gamma as gamma is changing
+                inv_gamma
             )
@@ -22,6 +22,19 @@ def get_args_parser():
 	return parser
 
 
+def extract_result_records(record_file, design=None):
+	# json lines written by Placer.place when result_record_file is set
+	records = []
+	with open(record_file, "r") as f:
+		for line in f:
+			line = line.strip()
+			if line:
+				record = json.loads(line)
+				if design is None or record["design"] == design:
+					records.append(record)
+	return records
+
+
 def extract_all_wHPWL_values(content=None, log_file=None):
 	wHPWL_values = []
 	if content is not None:
@@ -0,0 +1,300 @@
+# coding: utf-8
+
+'''
+sweep scheduler for (candidate x case) evaluation jobs
+jobs are packed longest-first onto a pool of warm worker processes, each pinned
+to one GPU or to a CPU thread budget; every finished job is appended to a
+checkpoint so an interrupted sweep resumes without re-running finished pairs
+'''
+
+import os
+import sys
+import time
+import json
+import queue
+import argparse
+import multiprocessing
+
+from total_check import benchmark_cases, case_macro_init_files, save_candidate_results
+
+root_dir = os.path.dirname(os.path.abspath(__file__))
+
+# component each candidate kind replaces, see batch_eval.build_placer
+candidate_kinds = {
+	"macro": "basic_place",
+	"preconditioner": "place_obj",
+	"optimizer": "custom_optimizer",
+}
+
+
+def job_id(candidate, case_name):
+	return "{}::{}".format(candidate, case_name)
+
+
+def case_cost(benchmark, case_name, baseline):
+	"""
+	@brief expected cost of a case, baseline running time if recorded, otherwise benchmark size on disk
+	"""
+	record = baseline.get(case_name)
+	if record is not None and "running-time" in record:
+		return float(record["running-time"])
+	with open(os.path.join(root_dir, "test/{}_llm4placement/{}.json".format(benchmark, case_name)), "r") as f:
+		case_params = json.load(f)
+	input_file = case_params.get("aux_input") or case_params.get("def_input") or ""
+	input_file = os.path.join(root_dir, input_file)
+	if not os.path.isfile(input_file):
+		return 0.0
+	benchmark_dir = os.path.dirname(input_file)
+	# scale bytes to be far below any recorded runtime, so measured cases still go first
+	return sum(os.path.getsize(os.path.join(benchmark_dir, i)) for i in os.listdir(benchmark_dir)) * 1e-12
+
+
+def load_checkpoint(checkpoint):
+	"""
+	@brief finished records of an earlier sweep, {job id: record}
+	"""
+	records = {}
+	if checkpoint and os.path.exists(checkpoint):
+		with open(checkpoint, "r") as f:
+			for line in f:
+				line = line.strip()
+				if not line:
+					continue
+				try:
+					record = json.loads(line)
+				except ValueError:
+					# partially written last line of a crashed sweep
+					continue
+				records[job_id(record["candidate"], record["case"])] = record
+	return records
+
+
+def worker_main(slot, job_queue, result_queue):
+	"""
+	@brief worker loop; the device is pinned before torch is imported
+	@param slot {"name", "device", "num_threads"}
+	"""
+	if slot["device"] is not None:
+		os.environ["CUDA_VISIBLE_DEVICES"] = str(slot["device"])
+	else:
+		os.environ["CUDA_VISIBLE_DEVICES"] = ""
+	import batch_eval
+	import EarlyAbort
+
+	overrides = {"gpu": int(slot["device"] is not None)}
+	if slot["num_threads"]:
+		overrides["num_threads"] = slot["num_threads"]
+	if slot.get("abort_reference"):
+		overrides["abort_reference_file"] = slot["abort_reference"]
+	while True:
+		job = job_queue.get()
+		if job is None:
+			break
+		record = {"candidate": job["candidate"], "case": job["case"], "slot": slot["name"]}
+		start_time = time.time()
+		try:
+			placer_module = batch_eval.build_placer(**job["components"])
+			cur_HPWL, running_time = batch_eval.run_case(job["params_file"], placer_module, job["timeout"], overrides)
+			record.update({"status": "ok", "cur_HPWL": cur_HPWL, "running-time": running_time})
+		except EarlyAbort.PlacementAborted as e:
+			record.update({"status": "aborted", "cur_HPWL": e.censored_hpwl, "abort_iteration": e.iteration,
+			               "running-time": time.time() - start_time})
+		except batch_eval.CaseTimeout:
+			record.update({"status": "timeout", "cur_HPWL": 1E+16, "running-time": time.time() - start_time})
+		except Exception as e:
+			record.update({"status": "error", "error": repr(e), "cur_HPWL": 1E+16, "running-time": time.time() - start_time})
+		result_queue.put((slot["name"], record))
+
+
+class SweepScheduler(object):
+	"""
+	@brief dispatch jobs to pinned workers, enforce timeouts and checkpoint results
+	"""
+	def __init__(self, slots, checkpoint, grace=60):
+		"""
+		@param slots list of {"name", "device", "num_threads"}, one worker process each
+		@param checkpoint json-lines file of finished records
+		@param grace seconds on top of a job timeout before its worker is killed,
+		covers C++ kernels that do not return to python in time
+		"""
+		self.ctx = multiprocessing.get_context("spawn")
+		self.slots = {slot["name"]: slot for slot in slots}
+		self.checkpoint = checkpoint
+		self.grace = grace
+		self.result_queue = self.ctx.Queue()
+		self.workers = {}
+
+	def start_worker(self, name):
+		job_queue = self.ctx.Queue()
+		process = self.ctx.Process(target=worker_main, args=(self.slots[name], job_queue, self.result_queue), daemon=True)
+		process.start()
+		self.workers[name] = {"process": process, "queue": job_queue, "job": None, "start": None}
+
+	def finish(self, name, record, records):
+		records[job_id(record["candidate"], record["case"])] = record
+		with open(self.checkpoint, "a") as f:
+			f.write(json.dumps(record) + "\n")
+		self.workers[name]["job"] = None
+		print("[{}] {} {} {} cur_HPWL {} running-time {:.1f}".format(
+			name, record["status"], record["candidate"], record["case"], record["cur_HPWL"], record["running-time"]))
+
+	def run(self, jobs):
+		"""
+		@brief run jobs, which should already be ordered by decreasing cost
+		@return {job id: record} including records restored from the checkpoint
+		"""
+		records = load_checkpoint(self.checkpoint)
+		pending = [job for job in jobs if job_id(job["candidate"], job["case"]) not in records]
+		print("jobs {}, finished in checkpoint {}, pending {}".format(len(jobs), len(jobs) - len(pending), len(pending)))
+		pending.reverse()  # pop from the end
+		for name in self.slots:
+			self.start_worker(name)
+		try:
+			while pending or any(worker["job"] is not None for worker in self.workers.values()):
+				for name, worker in self.workers.items():
+					if worker["job"] is None and pending:
+						worker["job"] = pending.pop()
+						worker["start"] = time.time()
+						worker["queue"].put(worker["job"])
+				try:
+					name, record = self.result_queue.get(timeout=1)
+					job = self.workers[name]["job"]
+					# drop late results of a worker that was already killed and respawned
+					if job is not None and (job["candidate"], job["case"]) == (record["candidate"], record["case"]):
+						self.finish(name, record, records)
+				except queue.Empty:
+					pass
+				# kill workers stuck past the timeout or dead on a crash, then respawn them
+				for name, worker in list(self.workers.items()):
+					job = worker["job"]
+					if job is None:
+						continue
+					elapsed = time.time() - worker["start"]
+					expired = job["timeout"] and elapsed > job["timeout"] + self.grace
+					if expired or not worker["process"].is_alive():
+						worker["process"].terminate()
+						worker["process"].join()
+						record = {"candidate": job["candidate"], "case": job["case"], "slot": name,
+						          "status": "timeout" if expired else "crash", "cur_HPWL": 1E+16, "running-time": elapsed}
+						self.finish(name, record, records)
+						self.start_worker(name)
+		finally:
+			for worker in self.workers.values():
+				worker["queue"].put(None)
+			for worker in self.workers.values():
+				worker["process"].join(timeout=10)
+				if worker["process"].is_alive():
+					worker["process"].terminate()
+		return records
+
+
+def build_slots(args):
+	"""
+	@brief one slot per GPU in --devices, otherwise --cpu_workers slots sharing the CPU threads
+	"""
+	if args.devices:
+		slots = [{"name": "gpu{}".format(device), "device": device, "num_threads": args.threads_per_worker}
+		         for device in args.devices.split(",")]
+	else:
+		slots = [{"name": "cpu{}".format(i), "device": None, "num_threads": args.threads_per_worker}
+		         for i in range(args.cpu_workers)]
+	for slot in slots:
+		slot["abort_reference"] = os.path.abspath(args.abort_reference) if args.abort_reference else None
+	return slots
+
+
+def build_jobs(args, candidates, case_names, baseline):
+	case_basic_place = {}
+	if args.kind == "preconditioner" and args.root_path:
+		case_basic_place = case_macro_init_files(args.root_path, args.benchmark, case_names)
+	jobs = []
+	for candidate in candidates:
+		for case_name in case_names:
+			components = {"basic_place": case_basic_place.get(case_name)}
+			components[candidate_kinds[args.kind]] = candidate
+			jobs.append({
+				"candidate": candidate,
+				"case": case_name,
+				"components": components,
+				"params_file": os.path.join(root_dir, "test/{}_llm4placement/{}.json".format(args.benchmark, case_name)),
+				"timeout": args.timeout,
+				"cost": case_cost(args.benchmark, case_name, baseline),
+			})
+	# longest processing time first, so a slow case never trails at the end of the sweep
+	jobs.sort(key=lambda job: -job["cost"])
+	return jobs
+
+
+def save_results(args, candidates, case_names, baseline, records):
+	"""
+	@brief per-candidate result files in the layout of total_check.py
+	"""
+	if not args.save_dir:
+		return
+	if any(case_name not in baseline for case_name in case_names):
+		print("baseline is incomplete, skip saving results")
+		return
+	os.makedirs(args.save_dir, exist_ok=True)
+	for candidate in candidates:
+		cur_records = [records.get(job_id(candidate, case_name)) for case_name in case_names]
+		if any(record is None for record in cur_records):
+			continue
+		total_HPWL = {}
+		total_improvement = []
+		for case_name, record in zip(case_names, cur_records):
+			total_HPWL[case_name] = {}
+			total_HPWL[case_name]["cur_HPWL"] = record["cur_HPWL"]
+			total_HPWL[case_name]["running-time"] = str(record["running-time"])
+			total_HPWL[case_name]["status"] = record["status"]
+			total_HPWL[case_name]["improve_ratio"] = 1 - record["cur_HPWL"] / baseline[case_name]["cur_HPWL"] * 1.
+			total_improvement.append(total_HPWL[case_name]["improve_ratio"])
+		total_HPWL["total_improvement_rato"] = sum(total_improvement) / len(total_improvement) * 1.
+		total_HPWL["path"] = candidate
+		filename = os.path.basename(candidate)
+		cur_save_path = os.path.join(args.save_dir, filename.replace("best_", "") + ".json")
+		save_candidate_results(total_HPWL, cur_save_path, args.save_dir, filename)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="schedule candidate x case evaluation on a worker pool")
+	parser.add_argument('--benchmark', default="mms", type=str)
+	parser.add_argument('--kind', default="preconditioner", choices=sorted(candidate_kinds.keys()),
+	                    help='component the candidates replace')
+	parser.add_argument('--candidates', nargs='+', required=True, type=str, help='candidate python files')
+	parser.add_argument('--cases', nargs='+', default=None, type=str, help='default all cases of the benchmark')
+	parser.add_argument('--root_path', default="./DAC25", type=str,
+	                    help='root path of best configs, per-case macro init for preconditioner sweeps')
+	parser.add_argument('--baseline', default=None, type=str, help='default ./prompt/{benchmark}_baseline.json')
+	parser.add_argument('--devices', default="", type=str, help='comma separated GPU ids, one worker each')
+	parser.add_argument('--cpu_workers', default=1, type=int, help='number of CPU workers if no GPU is given')
+	parser.add_argument('--threads_per_worker', default=0, type=int, help='num_threads override, 0 keeps the case setting')
+	parser.add_argument('--timeout', default=600, type=int, help='timeout for each case')
+	parser.add_argument('--checkpoint', default="./sweep_checkpoint.jsonl", type=str)
+	parser.add_argument('--save_dir', default=None, type=str, help='write per-candidate results like total_check.py')
+	parser.add_argument('--abort_reference', default=None, type=str,
+	                    help='baseline result records with trajectories, enables early abort of hopeless runs')
+	parser.add_argument('--baseline_store', action='store_true',
+	                    help='take the baseline and abort reference from the baseline store, rerun stale cases first')
+	args = parser.parse_args()
+
+	case_names = args.cases or benchmark_cases(args.benchmark)
+	baseline_path = args.baseline or "./prompt/{}_baseline.json".format(args.benchmark)
+	baseline = {}
+	if args.baseline_store:
+		from baseline_store import load_baseline
+		case_basic_place = {}
+		if args.kind == "preconditioner" and args.root_path:
+			case_basic_place = case_macro_init_files(args.root_path, args.benchmark, case_names)
+		baseline, abort_reference = load_baseline(args.benchmark, case_names, case_basic_place, args.timeout)
+		baseline = {k: v for k, v in baseline.items() if v is not None}
+		if args.abort_reference is None:
+			args.abort_reference = abort_reference
+	elif os.path.exists(baseline_path):
+		with open(baseline_path, "r") as json_f:
+			baseline = {k: v for k, v in json.load(json_f).items() if v is not None}
+	candidates = [os.path.abspath(i) for i in args.candidates]
+
+	jobs = build_jobs(args, candidates, case_names, baseline)
+	scheduler = SweepScheduler(build_slots(args), args.checkpoint)
+	records = scheduler.run(jobs)
+	save_results(args, candidates, case_names, baseline, records)
@@ -16,8 +16,8 @@ import argparse
 import subprocess
 from extract_results import extract_all_wHPWL_values
 
-# Set CUDA_VISIBLE_DEVICES to 1
-os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+# Set CUDA_VISIBLE_DEVICES to 0 unless the caller pinned a device
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '0')
 
 
 def chunk_list(files, num_chunks):
@@ -47,6 +47,58 @@ def get_chunk(files, num_chunks, idx):
 		raise IndexError(f"Index {idx} is out of range. Must be between 0 and {len(chunks) - 1}.")
 
 
+def benchmark_cases(benchmark):
+	if benchmark == "ispd2005free":
+		return ["adaptec1_allfree", "adaptec2_allfree", "adaptec3_allfree", "adaptec4_allfree",
+		        "bigblue1_allfree", "bigblue2_allfree", "bigblue3_allfree", "bigblue4_allfree"]
+	elif benchmark == "mms":
+		return ["adaptec1", "adaptec2", "adaptec3", "adaptec4", "adaptec5",
+		        "bigblue1", "bigblue2", "bigblue3", "bigblue4", "newblue1",
+		        "newblue2", "newblue3", "newblue4", "newblue5", "newblue6", "newblue7"]
+	elif benchmark == "ispd2019":
+		return ["ispd19_test1", "ispd19_test2", "ispd19_test3", "ispd19_test4", "ispd19_test5",
+		        "ispd19_test6", "ispd19_test7", "ispd19_test8", "ispd19_test9", "ispd19_test10"]
+	else:
+		raise ValueError("Please ensure your benchmark is correct.")
+
+
+def restore_default_modules():
+	## default macro init, precondition and custom optimizer
+	for module_name in ["BasicPlace", "PlaceObj", "CustomOptimizer"]:
+		command_run = "cp ./dreamplace/{0}_backup.py ./dreamplace/{0}.py".format(module_name)
+		process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
+		                           stderr=subprocess.PIPE,
+		                           universal_newlines=True, bufsize=1024 * 1024 * 5)
+		results, stderr = process.communicate()  # results: output; stderr: error message
+
+
+def case_macro_init_files(root_path, benchmark, total_case_name):
+	# best evolved macro init of each case, {case: path}
+	case_macro_init = {}
+	for case in total_case_name:
+		macro_init_path = os.path.join(root_path, "total_best_configs/{}/{}".format(benchmark, case))
+		macro_filename = [i for i in os.listdir(macro_init_path) if "MacroInit" in i]
+		if len(macro_filename) > 1:
+			raise ValueError("should be only one initialization algorithm")
+		elif len(macro_filename) == 1:
+			case_macro_init[case] = os.path.join(macro_init_path, macro_filename[0])
+	return case_macro_init
+
+
+def save_candidate_results(total_HPWL, cur_save_path, save_dir, filename):
+	with open(cur_save_path, "w")as json_f:
+		json.dump(total_HPWL, json_f)
+	
+	if float(total_HPWL["total_improvement_rato"]) > 0:
+		cur_best_save_path = os.path.join(save_dir,
+		                                  "best_{}".format(str(total_HPWL["total_improvement_rato"])) +
+		                                  filename.replace("best_", "") + ".json"
+		                                  )
+		
+		with open(cur_best_save_path, "w")as json_f:
+			json.dump(total_HPWL, json_f)
+
+
 def total_macro_check(args):
 	case_name = args.case_name
 	benchmark = args.benchmark
@@ -54,18 +106,7 @@ def total_macro_check(args):
 	timeout = args.timeout
 	sel_idx = args.sel_idx
 	
-	if benchmark == "ispd2005free":
-		total_case_name = ["adaptec1_allfree", "adaptec2_allfree", "adaptec3_allfree", "adaptec4_allfree",
-		                   "bigblue1_allfree", "bigblue2_allfree", "bigblue3_allfree", "bigblue4_allfree"]
-	elif benchmark == "mms":
-		total_case_name = ["adaptec1", "adaptec2", "adaptec3", "adaptec4", "adaptec5",
-		                   "bigblue1", "bigblue2", "bigblue3", "bigblue4", "newblue1",
-		                   "newblue2", "newblue3", "newblue4", "newblue5", "newblue6", "newblue7"]
-	elif benchmark == "ispd2019":
-		total_case_name = ["ispd19_test1", "ispd19_test2", "ispd19_test3", "ispd19_test4", "ispd19_test5",
-		                   "ispd19_test6", "ispd19_test7", "ispd19_test8", "ispd19_test9", "ispd19_test10"]
-	else:
-		raise ValueError("Please ensure your benchmark is correct.")
+	total_case_name = benchmark_cases(benchmark)
 	
 	total_macro_init_path = os.path.join(root_path, "total_macro_init")
 	total_macro_init_filenames = [i for i in os.listdir(total_macro_init_path) if "best" in i]
@@ -89,30 +130,20 @@ def total_macro_check(args):
 	selected_macro_init_filenames = get_chunk(total_macro_init_filenames, 16, sel_idx)
 	print("selected_macro_init_filenames", selected_macro_init_filenames[:5])
 	
-	## default macro init
-	command_run = "cp ./dreamplace/BasicPlace_backup.py ./dreamplace/BasicPlace.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
-	
-	## default precondition
-	command_run = "cp ./dreamplace/PlaceObj_backup.py ./dreamplace/PlaceObj.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
-	
-	## default custom optimizer
-	command_run = "cp ./dreamplace/CustomOptimizer_backup.py ./dreamplace/CustomOptimizer.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
+	if args.in_process:
+		import batch_eval
+		from baseline_store import load_baseline
+		# a warm session per case, candidates loop over all cases
+		batch_eval.max_sessions = len(total_case_name)
+	else:
+		restore_default_modules()
 	
 	######### run default performance baseline  #########
 	save_path = "./prompt/{}_baseline.json".format(benchmark)
-	if os.path.exists(save_path):
+	if args.in_process:
+		# keyed by design, components, params and code, never shared with the subprocess baseline
+		baseline, record_path = load_baseline(benchmark, total_case_name)
+	elif os.path.exists(save_path):
 		pass
 	else:
 		total_HPWL = {}
@@ -141,8 +172,9 @@ def total_macro_check(args):
 			json.dump(total_HPWL, json_f)
 	
 	######### run macro init performance  #########
-	with open(save_path, "r")as json_f:
-		baseline = json.load(json_f)
+	if not args.in_process:
+		with open(save_path, "r")as json_f:
+			baseline = json.load(json_f)
 	
 	save_path_macro_init = os.path.join(root_path, "total_best_configs/macro_init/{}".format(benchmark))
 	if os.path.exists(save_path_macro_init):
@@ -154,6 +186,15 @@ def total_macro_check(args):
 		try:
 			cur_save_path = os.path.join(save_path_macro_init, filename.replace("best_", "") + ".json")
 			macro_filename = os.path.join(total_macro_init_path, filename)
+			if args.in_process:
+				total_HPWL = batch_eval.evaluate_candidate(benchmark, total_case_name, baseline, timeout,
+				                                           basic_place=macro_filename,
+				                                           abort_reference=record_path if args.early_abort else None,
+				                                           reuse_session=args.reuse_session)
+				total_HPWL["path"] = macro_filename
+				save_candidate_results(total_HPWL, cur_save_path, save_path_macro_init, filename)
+				continue
+			
 			# cp current macro file to dreamplace install directory
 			command_run = "cp {} ./dreamplace/BasicPlace.py".format(macro_filename)
 			process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
@@ -212,18 +253,7 @@ def total_preconditioner_check(args):
 	sel_idx = args.sel_idx
 	chunk_num = args.chunk_list
 	
-	if benchmark == "ispd2005free":
-		total_case_name = ["adaptec1_allfree", "adaptec2_allfree", "adaptec3_allfree", "adaptec4_allfree",
-		                   "bigblue1_allfree", "bigblue2_allfree", "bigblue3_allfree", "bigblue4_allfree"]
-	elif benchmark == "mms":
-		total_case_name = ["adaptec1", "adaptec2", "adaptec3", "adaptec4", "adaptec5",
-		                   "bigblue1", "bigblue2", "bigblue3", "bigblue4", "newblue1",
-		                   "newblue2", "newblue3", "newblue4", "newblue5", "newblue6", "newblue7"]
-	elif benchmark == "ispd2019":
-		total_case_name = ["ispd19_test1", "ispd19_test2", "ispd19_test3", "ispd19_test4", "ispd19_test5",
-		                   "ispd19_test6", "ispd19_test7", "ispd19_test8", "ispd19_test9", "ispd19_test10"]
-	else:
-		raise ValueError("Please ensure your benchmark is correct.")
+	total_case_name = benchmark_cases(benchmark)
 	
 	total_preconditioner_init_path = os.path.join(root_path, "total_preconditioner_init")
 	total_preconditioner_init_filenames = [i for i in os.listdir(total_preconditioner_init_path) if ".py" in i]
@@ -258,30 +288,21 @@ def total_preconditioner_check(args):
 	selected_preconditioner_init_filenames = get_chunk(total_preconditioner_init_filenames, chunk_num, sel_idx)
 	print("selected_preconditioner_init_filenames", selected_preconditioner_init_filenames[:5])
 	
-	## default macro init
-	command_run = "cp ./dreamplace/BasicPlace_backup.py ./dreamplace/BasicPlace.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
-	
-	## default precondition
-	command_run = "cp ./dreamplace/PlaceObj_backup.py ./dreamplace/PlaceObj.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
-	
-	## default custom optimizer
-	command_run = "cp ./dreamplace/CustomOptimizer_backup.py ./dreamplace/CustomOptimizer.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
+	if args.in_process:
+		import batch_eval
+		from baseline_store import load_baseline
+		# a warm session per case, candidates loop over all cases
+		batch_eval.max_sessions = len(total_case_name)
+	else:
+		restore_default_modules()
 	
 	######### run default performance baseline  #########
 	save_path = "./prompt/{}_baseline.json".format(benchmark)
-	if os.path.exists(save_path):
+	if args.in_process:
+		# keyed by design, components, params and code, never shared with the subprocess baseline
+		baseline, record_path = load_baseline(benchmark, total_case_name,
+		                                      case_basic_place=case_macro_init_files(root_path, benchmark, total_case_name))
+	elif os.path.exists(save_path):
 		pass
 	else:
 		total_HPWL = {}
@@ -327,8 +348,9 @@ def total_preconditioner_check(args):
 			json.dump(total_HPWL, json_f)
 	
 	######### run preconditioner init performance  #########
-	with open(save_path, "r")as json_f:
-		baseline = json.load(json_f)
+	if not args.in_process:
+		with open(save_path, "r")as json_f:
+			baseline = json.load(json_f)
 	
 	save_path_preconditioner_init = os.path.join(root_path, "total_best_configs/preconditioner_init/{}".format(benchmark))
 	if os.path.exists(save_path_preconditioner_init):
@@ -341,6 +363,17 @@ def total_preconditioner_check(args):
 		# try:
 		cur_save_path = os.path.join(save_path_preconditioner_init, filename.replace("best_", "") + ".json")
 		preconditioner_filename = os.path.join(total_preconditioner_init_path, filename)
+		if args.in_process:
+			# preconditioner candidates are PlaceObj.py files holding PreconditionOp
+			total_HPWL = batch_eval.evaluate_candidate(benchmark, total_case_name, baseline, timeout,
+			                                           place_obj=preconditioner_filename,
+			                                           case_basic_place=case_macro_init_files(root_path, benchmark, total_case_name),
+			                                           abort_reference=record_path if args.early_abort else None,
+			                                           reuse_session=args.reuse_session)
+			total_HPWL["path"] = preconditioner_filename
+			save_candidate_results(total_HPWL, cur_save_path, save_path_preconditioner_init, filename)
+			continue
+		
 		# cp current preconditioner file to dreamplace install directory
 		command_run = "cp {} ./dreamplace/BasicPlace.py".format(preconditioner_filename)
 		process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
@@ -416,18 +449,7 @@ def total_optimizer_check(args):
 	timeout = args.timeout
 	sel_idx = args.sel_idx
 	
-	if benchmark == "ispd2005free":
-		total_case_name = ["adaptec1_allfree", "adaptec2_allfree", "adaptec3_allfree", "adaptec4_allfree",
-		                   "bigblue1_allfree", "bigblue2_allfree", "bigblue3_allfree", "bigblue4_allfree"]
-	elif benchmark == "mms":
-		total_case_name = ["adaptec1", "adaptec2", "adaptec3", "adaptec4", "adaptec5",
-		                   "bigblue1", "bigblue2", "bigblue3", "bigblue4", "newblue1",
-		                   "newblue2", "newblue3", "newblue4", "newblue5", "newblue6", "newblue7"]
-	elif benchmark == "ispd2019":
-		total_case_name = ["ispd19_test1", "ispd19_test2", "ispd19_test3", "ispd19_test4", "ispd19_test5",
-		                   "ispd19_test6", "ispd19_test7", "ispd19_test8", "ispd19_test9", "ispd19_test10"]
-	else:
-		raise ValueError("Please ensure your benchmark is correct.")
+	total_case_name = benchmark_cases(benchmark)
 	
 	total_macro_init_path = os.path.join(root_path, "total_macro_init")
 	total_macro_init_filenames = [i for i in os.listdir(total_macro_init_path) if "best" in i]
@@ -451,30 +473,20 @@ def total_optimizer_check(args):
 	selected_macro_init_filenames = get_chunk(total_macro_init_filenames, 16, sel_idx)
 	print("selected_macro_init_filenames", selected_macro_init_filenames[:5])
 	
-	## default macro init
-	command_run = "cp ./dreamplace/BasicPlace_backup.py ./dreamplace/BasicPlace.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
-	
-	## default precondition
-	command_run = "cp ./dreamplace/PlaceObj_backup.py ./dreamplace/PlaceObj.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
-	
-	## default custom optimizer
-	command_run = "cp ./dreamplace/CustomOptimizer_backup.py ./dreamplace/CustomOptimizer.py"
-	process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
-	                           stderr=subprocess.PIPE,
-	                           universal_newlines=True, bufsize=1024 * 1024 * 5)
-	results, stderr = process.communicate()  # results: output; stderr: error message
+	if args.in_process:
+		import batch_eval
+		from baseline_store import load_baseline
+		# a warm session per case, candidates loop over all cases
+		batch_eval.max_sessions = len(total_case_name)
+	else:
+		restore_default_modules()
 	
 	######### run default performance baseline  #########
 	save_path = "./prompt/{}_baseline.json".format(benchmark)
-	if os.path.exists(save_path):
+	if args.in_process:
+		# keyed by design, components, params and code, never shared with the subprocess baseline
+		baseline, record_path = load_baseline(benchmark, total_case_name)
+	elif os.path.exists(save_path):
 		pass
 	else:
 		total_HPWL = {}
@@ -503,8 +515,9 @@ def total_optimizer_check(args):
 			json.dump(total_HPWL, json_f)
 	
 	######### run macro init performance  #########
-	with open(save_path, "r")as json_f:
-		baseline = json.load(json_f)
+	if not args.in_process:
+		with open(save_path, "r")as json_f:
+			baseline = json.load(json_f)
 	
 	save_path_macro_init = os.path.join(root_path, "total_best_configs/macro_init/{}".format(benchmark))
 	if os.path.exists(save_path_macro_init):
@@ -516,6 +529,15 @@ def total_optimizer_check(args):
 		try:
 			cur_save_path = os.path.join(save_path_macro_init, filename.replace("best_", "") + ".json")
 			macro_filename = os.path.join(total_macro_init_path, filename)
+			if args.in_process:
+				total_HPWL = batch_eval.evaluate_candidate(benchmark, total_case_name, baseline, timeout,
+				                                           basic_place=macro_filename,
+				                                           abort_reference=record_path if args.early_abort else None,
+				                                           reuse_session=args.reuse_session)
+				total_HPWL["path"] = macro_filename
+				save_candidate_results(total_HPWL, cur_save_path, save_path_macro_init, filename)
+				continue
+			
 			# cp current macro file to dreamplace install directory
 			command_run = "cp {} ./dreamplace/BasicPlace.py".format(macro_filename)
 			process = subprocess.Popen(command_run, shell=True, stdout=subprocess.PIPE,
@@ -580,5 +602,11 @@ if __name__ == "__main__":
 	parser.add_argument('--chunk_list', default=16, type=int)
 	parser.add_argument('--sel_idx', default=0,
 	                    type=int, help='default 0-15')
+	parser.add_argument('--in_process', action='store_true',
+	                    help='load candidates by path and run all cases in this interpreter instead of cp + subprocess')
+	parser.add_argument('--early_abort', action='store_true',
+	                    help='with --in_process, stop candidates whose trajectory falls behind the baseline and record a censored score')
+	parser.add_argument('--reuse_session', action='store_true',
+	                    help='with --in_process, keep one warm placer per case and only swap the candidate component')
 	args = parser.parse_args()
 	total_preconditioner_check(args)
@@ -0,0 +1,136 @@
+##
+# @file   auction_lap_unittest.py
+# @brief  check the batched auction solver and batched independent set matching against the C++ op
+#
+
+import os
+import sys
+import numpy as np
+import unittest
+import torch
+from scipy.optimize import linear_sum_assignment
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from dreamplace.ops.independent_set_matching import independent_set_matching
+sys.path.pop()
+
+
+class AuctionLAPOpTest(unittest.TestCase):
+    def test_auctionLAP(self):
+        np.random.seed(1)
+        cost = np.random.randint(0, 100, size=(16, 9, 9)).astype(np.float64)
+        assign, converged = independent_set_matching.auction_lap(torch.from_numpy(cost))
+        self.assertTrue(converged.all())
+        assign = assign.numpy()
+        for i in range(cost.shape[0]):
+            # a permutation with the optimal cost
+            np.testing.assert_array_equal(np.sort(assign[i]), np.arange(cost.shape[1]))
+            rows, columns = linear_sum_assignment(cost[i])
+            golden = cost[i][rows, columns].sum()
+            result = cost[i][np.arange(cost.shape[1]), assign[i]].sum()
+            self.assertEqual(result, golden)
+
+    def test_segmentMax(self):
+        values = torch.tensor([3, 1, 5, 2, 7, 4], dtype=torch.float64)
+        valid = torch.tensor([1, 1, 0, 0, 1, 1], dtype=torch.bool)
+        segments = torch.tensor([0, 0, 1, 1, 3, 3])
+        ends = torch.tensor([2, 4, 4, 6])
+        result = independent_set_matching.segment_max(values, valid, segments, ends, 1.0, 7.0)
+        np.testing.assert_array_equal(result.numpy(), [3, -np.inf, -np.inf, 7])
+
+
+def hpwl(pos, num_nodes, pin2node_map, pin_offset_x, pin_offset_y, pin2net_map, num_nets):
+    x = pos[:num_nodes][pin2node_map] + pin_offset_x
+    y = pos[num_nodes:][pin2node_map] + pin_offset_y
+    result = 0.0
+    for i in range(num_nets):
+        pins = pin2net_map == i
+        result += x[pins].max() - x[pins].min() + y[pins].max() - y[pins].min()
+    return result
+
+
+class BatchedIndependentSetMatchingOpTest(unittest.TestCase):
+    def test_batchedISM(self):
+        # legal row-based placement of unit and double width cells on a 24x6 layout
+        np.random.seed(2)
+        torch.manual_seed(2)
+        num_rows = 6
+        num_sites = 24
+        node_size_x = np.array([1] * 48 + [2] * 16, dtype=np.float32)
+        num_nodes = len(node_size_x)
+        node_size_y = np.ones(num_nodes, dtype=np.float32)
+        sites = np.random.permutation(num_rows * num_sites // 2)[:num_nodes]
+        # every cell owns a slot of two sites, so cells never overlap
+        pos = np.concatenate([(sites % (num_sites // 2)) * 2, sites // (num_sites // 2)]).astype(np.float32)
+
+        num_nets = 40
+        net2pin_map = []
+        pin2node_map = []
+        for i in range(num_nets):
+            degree = np.random.randint(2, 5)
+            nodes = np.random.choice(num_nodes, degree, replace=False)
+            net2pin_map.append(np.arange(len(pin2node_map), len(pin2node_map) + degree))
+            pin2node_map.extend(nodes)
+        pin2node_map = np.array(pin2node_map, dtype=np.int32)
+        num_pins = len(pin2node_map)
+        pin2net_map = np.concatenate([np.full(len(pins), i) for i, pins in enumerate(net2pin_map)]).astype(np.int32)
+        flat_net2pin_map = np.arange(num_pins, dtype=np.int32)
+        flat_net2pin_start_map = np.array([0] + [pins[-1] + 1 for pins in net2pin_map], dtype=np.int32)
+        flat_node2pin_map = np.argsort(pin2node_map, kind='stable').astype(np.int32)
+        flat_node2pin_start_map = np.concatenate([[0], np.cumsum(np.bincount(pin2node_map, minlength=num_nodes))]).astype(np.int32)
+        pin_offset_x = node_size_x[pin2node_map] / 2
+        pin_offset_y = node_size_y[pin2node_map] / 2
+
+        def run(algorithm):
+            op = independent_set_matching.IndependentSetMatching(
+                node_size_x=torch.from_numpy(node_size_x),
+                node_size_y=torch.from_numpy(node_size_y),
+                flat_region_boxes=torch.zeros(0, dtype=torch.float32),
+                flat_region_boxes_start=torch.zeros(1, dtype=torch.int32),
+                node2fence_region_map=torch.full((num_nodes, ), np.iinfo(np.int32).max, dtype=torch.int32),
+                flat_net2pin_map=torch.from_numpy(flat_net2pin_map),
+                flat_net2pin_start_map=torch.from_numpy(flat_net2pin_start_map),
+                pin2net_map=torch.from_numpy(pin2net_map),
+                flat_node2pin_map=torch.from_numpy(flat_node2pin_map),
+                flat_node2pin_start_map=torch.from_numpy(flat_node2pin_start_map),
+                pin2node_map=torch.from_numpy(pin2node_map),
+                pin_offset_x=torch.from_numpy(pin_offset_x),
+                pin_offset_y=torch.from_numpy(pin_offset_y),
+                net_mask=torch.ones(num_nets, dtype=torch.uint8),
+                xl=0,
+                yl=0,
+                xh=num_sites,
+                yh=num_rows,
+                site_width=1,
+                row_height=1,
+                num_bins_x=2,
+                num_bins_y=2,
+                num_movable_nodes=num_nodes,
+                num_terminal_NIs=0,
+                num_filler_nodes=0,
+                batch_size=32,
+                set_size=16,
+                max_iters=10,
+                algorithm=algorithm)
+            return op(torch.from_numpy(pos.copy())).numpy()
+
+        def wirelength(result):
+            return hpwl(result, num_nodes, pin2node_map, pin_offset_x, pin_offset_y, pin2net_map, num_nets)
+
+        golden = run("concurrent")
+        result = run("batched")
+        # cells only trade places with cells of the same width
+        for width in (1, 2):
+            cells = node_size_x == width
+            before = sorted(zip(pos[:num_nodes][cells], pos[num_nodes:][cells]))
+            after = sorted(zip(result[:num_nodes][cells], result[num_nodes:][cells]))
+            self.assertEqual(before, after)
+        initial = wirelength(pos)
+        self.assertLess(wirelength(result), initial)
+        # the matchings are solved to optimality, only the independent sets differ from the C++ op,
+        # so the batched mode should recover most of its gain
+        self.assertLessEqual(wirelength(result), wirelength(golden) + 0.5 * (initial - wirelength(golden)))
+
+
+if __name__ == '__main__':
+    unittest.main()
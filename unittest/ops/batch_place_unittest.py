@@ -0,0 +1,44 @@
+##
+# @file   batch_place_unittest.py
+# @brief  check that each row of batched global placement runs as an independent placement
+#
+
+import os
+import sys
+import numpy as np
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "dreamplace"))
+from dreamplace import Params
+from dreamplace import PlacerSession
+sys.path.pop()
+sys.path.pop()
+
+
+class BatchPlaceTest(unittest.TestCase):
+    def test_simple(self):
+        params = Params.Params()
+        params.aux_input = os.path.join(os.path.dirname(os.path.abspath(__file__)), "place_io_unittest/simple/simple.aux")
+        params.gpu = 0
+        params.dtype = "float64"
+        params.global_place_stages[0]["iteration"] = 300
+        session = PlacerSession.PlacerSession(params)
+
+        # the two rows differ in seed and settings, so they stop at different iterations
+        seeds = [1, 2]
+        configs = [{"density_weight": 8e-5}, {"density_weight": 8e-3, "learning_rate": 0.02}]
+        results = session.run_batch(seeds, configs)
+        for b in range(len(seeds)):
+            golden = session.run_batch(seeds[b:b + 1], configs[b:b + 1])[0]
+            # per-row step sizes, density weights, gammas and stop rule
+            self.assertEqual(results[b]["iteration"], golden["iteration"])
+            np.testing.assert_allclose(results[b]["pos"], golden["pos"], rtol=1e-6, atol=1e-6)
+            np.testing.assert_allclose(results[b]["hpwl"], golden["hpwl"], rtol=1e-6)
+            np.testing.assert_allclose(results[b]["overflow"], golden["overflow"], rtol=1e-6, atol=1e-9)
+        # a row that is done keeps its position while the other one goes on
+        self.assertNotEqual(results[0]["iteration"], results[1]["iteration"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+##
+# @file   clustering_unittest.py
+# @brief  check netlist clustering, the clustered PlaceDB view and declustering
+#
+
+import os
+import sys
+import numpy as np
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "dreamplace"))
+from dreamplace import PlaceDB
+from dreamplace import Clustering
+from dreamplace import Params
+sys.path.pop()
+sys.path.pop()
+
+"""
+return a placement database of movable cells, one movable macro, fixed cells and fillers
+"""
+def random_placedb(num_movable_nodes, num_fixed_nodes, num_filler_nodes, num_pins, num_nets):
+    np.random.seed(0)
+    db = PlaceDB.PlaceDB()
+    db.dtype = np.float64
+    db.xl, db.yl, db.xh, db.yh = 0.0, 0.0, 200.0, 160.0
+    db.row_height, db.site_width = 4.0, 1.0
+    db.num_physical_nodes = num_movable_nodes + num_fixed_nodes
+    db.num_terminals = num_fixed_nodes
+    db.num_terminal_NIs = 0
+    db.num_filler_nodes = num_filler_nodes
+    num_nodes = db.num_physical_nodes + num_filler_nodes
+    db.node_size_x = np.random.randint(1, 6, num_nodes).astype(np.float64)
+    db.node_size_y = np.full(num_nodes, db.row_height)
+    db.node_size_x[0], db.node_size_y[0] = 30.0, 24.0
+    db.node_x = np.random.uniform(db.xl, db.xh - 30, db.num_physical_nodes)
+    db.node_y = np.random.uniform(db.yl, db.yh - 24, db.num_physical_nodes)
+    db.node_names = np.array(["o%d" % (i) for i in range(db.num_physical_nodes)], dtype=np.string_)
+    db.node_orient = np.full(db.num_physical_nodes, b"N", dtype=np.string_)
+    db.movable_macro_mask = np.zeros(num_movable_nodes, dtype=bool)
+    db.movable_macro_mask[0] = True
+    # two fence regions and the default region
+    db.regions = [np.zeros([1, 4]), np.zeros([1, 4])]
+    db.node2fence_region_map = np.random.choice([0, 1, np.iinfo(np.int32).max], db.num_physical_nodes).astype(np.int32)
+
+    db.pin2node_map = np.random.randint(0, db.num_physical_nodes, num_pins).astype(np.int32)
+    db.pin_offset_x = np.random.uniform(0, 1, num_pins)
+    db.pin_offset_y = np.random.uniform(0, 1, num_pins)
+    net_degrees = np.random.multinomial(num_pins, np.ones(num_nets) / num_nets)
+    db.flat_net2pin_start_map = np.concatenate([[0], np.cumsum(net_degrees)]).astype(np.int32)
+    db.flat_net2pin_map = np.random.permutation(num_pins).astype(np.int32)
+    db.net2pin_map = np.split(db.flat_net2pin_map, db.flat_net2pin_start_map[1:-1])
+    db.pin2net_map = np.zeros(num_pins, dtype=np.int32)
+    db.pin2net_map[db.flat_net2pin_map] = np.repeat(np.arange(num_nets), net_degrees)
+    db.flat_node2pin_map = np.argsort(db.pin2node_map, kind="stable").astype(np.int32)
+    db.flat_node2pin_start_map = np.concatenate([[0], np.cumsum(np.bincount(db.pin2node_map, minlength=db.num_physical_nodes))]).astype(np.int32)
+    db.net_weights = np.random.uniform(0.5, 2, num_nets)
+    return db
+
+class ClusteringTest(unittest.TestCase):
+    def test_clusteringRandom(self):
+        db = random_placedb(num_movable_nodes=300, num_fixed_nodes=20, num_filler_nodes=30, num_pins=1500, num_nets=400)
+        params = Params.Params()
+        params.cluster_ratio = 4
+        params.cluster_max_area = 6
+        params.cluster_max_net_degree = 16
+        num_movable_nodes = db.num_movable_nodes
+
+        clusters, num_clusters = Clustering.best_choice_clustering(params, db)
+        self.assertEqual(len(np.unique(clusters)), num_clusters)
+        self.assertLess(num_clusters, num_movable_nodes)
+        # macros stay single, clusters keep their fence region and area limit
+        self.assertEqual(np.count_nonzero(clusters == clusters[0]), 1)
+        regions = db.node2fence_region_map[:num_movable_nodes]
+        for c in range(num_clusters):
+            self.assertEqual(len(np.unique(regions[clusters == c])), 1)
+        areas = np.bincount(clusters, weights=db.node_size_x[:num_movable_nodes] * db.node_size_y[:num_movable_nodes])
+        cell_areas = db.node_size_x[1:num_movable_nodes] * db.node_size_y[1:num_movable_nodes]
+        counts = np.bincount(clusters)
+        self.assertTrue(np.all(areas[counts > 1] <= params.cluster_max_area * cell_areas.mean() + 1e-6))
+
+        coarse_db = Clustering.coarsen_placedb(db, clusters, num_clusters)
+        self.assertEqual(coarse_db.num_movable_nodes, num_clusters)
+        self.assertEqual(coarse_db.num_filler_nodes, db.num_filler_nodes)
+        np.testing.assert_allclose(coarse_db.node_size_x[:num_clusters] * coarse_db.node_size_y[:num_clusters], areas)
+        # every remaining net spans more than one node and keeps its pins
+        node_map = np.concatenate([clusters, np.arange(num_clusters, coarse_db.num_physical_nodes)])
+        flat_nodes = node_map[db.pin2node_map]
+        golden_nets = [net for net in db.net2pin_map if len(np.unique(flat_nodes[net])) > 1]
+        self.assertEqual(coarse_db.num_nets, len(golden_nets))
+        for net, golden_net in zip(coarse_db.net2pin_map, golden_nets):
+            np.testing.assert_array_equal(coarse_db.pin2node_map[net], flat_nodes[golden_net])
+        for node in range(coarse_db.num_physical_nodes):
+            np.testing.assert_array_equal(coarse_db.pin2node_map[coarse_db.node2pin_map[node]], node)
+
+        coarse_pos = np.random.uniform(0, 100, coarse_db.num_nodes * 2)
+        pos = Clustering.decluster(db, coarse_db, clusters, coarse_pos, np.zeros(db.num_nodes * 2))
+        x, y = pos[:num_movable_nodes], pos[db.num_nodes:db.num_nodes + num_movable_nodes]
+        self.assertTrue(np.all(x >= db.xl) and np.all(x + db.node_size_x[:num_movable_nodes] <= db.xh))
+        self.assertTrue(np.all(y >= db.yl) and np.all(y + db.node_size_y[:num_movable_nodes] <= db.yh))
+        np.testing.assert_array_equal(pos[db.num_physical_nodes:db.num_nodes], coarse_pos[coarse_db.num_physical_nodes:coarse_db.num_nodes])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -176,6 +176,17 @@ class ElectricPotentialOpTest(unittest.TestCase):
         grad = pos.grad.clone()
         print("custom_grad = ", grad)
 
+        # test batched forward, identical placements match the single placement
+        pos_batch = pos.detach().repeat(3, 1).requires_grad_(True)
+        result_batch = custom.forward_batch(pos_batch)
+        result_batch.sum().backward()
+        np.testing.assert_allclose(result_batch.detach().numpy(),
+                                   np.full(3, result.item()),
+                                   rtol=1e-6)
+        np.testing.assert_allclose(pos_batch.grad.numpy(),
+                                   np.tile(grad.numpy(), (3, 1)),
+                                   rtol=1e-6, atol=1e-6)
+
         # test cuda
         if torch.cuda.device_count():
             custom_cuda = electric_potential.ElectricPotential(
@@ -219,6 +230,74 @@ class ElectricPotentialOpTest(unittest.TestCase):
             np.testing.assert_allclose(grad.detach().numpy(),
                                        grad_cuda.data.cpu().detach().numpy())
 
+    def test_incrementalDensityMap(self):
+        # cells larger than sqrt(2) bins on a quarter-bin grid keep every bin overlap
+        # a multiple of 1/16, so the maps are exact whatever the order of the updates
+        np.random.seed(3)
+        dtype = torch.float64
+        num_bins = 16
+        num_movable_nodes = 24
+        num_terminals = 2
+        num_filler_nodes = 12
+        num_nodes = num_movable_nodes + num_terminals + num_filler_nodes
+        node_size_x = np.random.choice([2.0, 3.0], num_nodes)
+        node_size_y = np.random.choice([2.0, 2.5], num_nodes)
+        node_size_x[-num_filler_nodes:] = 2.0
+        node_size_y[-num_filler_nodes:] = 2.0
+
+        def random_pos():
+            xx = np.random.randint(0, 4 * (num_bins - 3), num_nodes) / 4.0
+            yy = np.random.randint(0, 4 * (num_bins - 3), num_nodes) / 4.0
+            return np.concatenate([xx, yy])
+
+        def build(incremental_interval):
+            return electric_potential.ElectricPotential(
+                torch.tensor(node_size_x, dtype=dtype),
+                torch.tensor(node_size_y, dtype=dtype),
+                torch.arange(num_bins, dtype=dtype) + 0.5,
+                torch.arange(num_bins, dtype=dtype) + 0.5,
+                target_density=torch.tensor(0.8, dtype=dtype),
+                xl=0.0,
+                yl=0.0,
+                xh=float(num_bins),
+                yh=float(num_bins),
+                bin_size_x=1.0,
+                bin_size_y=1.0,
+                num_movable_nodes=num_movable_nodes,
+                num_terminals=num_terminals,
+                num_filler_nodes=num_filler_nodes,
+                padding=0,
+                sorted_node_map=torch.argsort(torch.tensor(node_size_x[:num_movable_nodes])).to(torch.int32),
+                movable_macro_mask=None,
+                deterministic_flag=False,
+                incremental_interval=incremental_interval,
+                incremental_tolerance=0.0)
+
+        golden_op = build(0)
+        incremental_op = build(4)
+        pos = random_pos()
+        # move fewer than half of the movable cells and fillers in each step, so the maps take the delta update;
+        # more steps than incremental_interval also run the scheduled rebuilds
+        movable = np.arange(num_movable_nodes)
+        fillers = np.arange(num_nodes - num_filler_nodes, num_nodes)
+        for step in range(11):
+            if step:
+                target = random_pos()
+                moved = np.concatenate([np.random.choice(movable, 5, replace=False),
+                                        np.random.choice(fillers, 3, replace=False)])
+                pos[moved] = target[moved]
+                pos[num_nodes + moved] = target[num_nodes + moved]
+            pos_incremental = torch.tensor(pos, dtype=dtype, requires_grad=True)
+            result_incremental = incremental_op.forward(pos_incremental)
+            result_incremental.backward()
+            pos_golden = torch.tensor(pos, dtype=dtype, requires_grad=True)
+            result_golden = golden_op.forward(pos_golden)
+            result_golden.backward()
+            np.testing.assert_array_equal(result_incremental.detach().numpy(),
+                                          result_golden.detach().numpy())
+            np.testing.assert_array_equal(pos_incremental.grad.numpy(),
+                                          pos_golden.grad.numpy())
+
 
 def plot(plot_count, density_map, padding, name):
     """
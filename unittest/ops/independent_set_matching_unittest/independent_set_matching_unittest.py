@@ -298,7 +298,7 @@ if __name__ == '__main__':
     #unittest.main()
     if len(sys.argv) < 4:
         print(
-            "usage: python script.py design.pklz sequential|concurrent cpu|cuda"
+            "usage: python script.py design.pklz sequential|concurrent|batched cpu|cuda"
         )
     else:
         design = sys.argv[1]
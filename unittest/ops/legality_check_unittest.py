@@ -0,0 +1,60 @@
+##
+# @file   legality_check_unittest.py
+# @brief  check the vectorized and incremental legality check
+#
+
+import os
+import sys
+import unittest
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from dreamplace.ops.legality_check import legality_check
+sys.path.pop()
+
+
+class IncrementalLegalityCheckOpTest(unittest.TestCase):
+    def test_incrementalLegalityCheck(self):
+        dtype = torch.float32
+        # 4 movable cells in 2 rows, 2 overlapping fixed blocks
+        node_size_x = torch.tensor([2, 3, 2, 4, 4, 6], dtype=dtype)
+        node_size_y = torch.tensor([10, 10, 10, 10, 20, 10], dtype=dtype)
+        x = torch.tensor([0, 2, 5, 20, 10, 8], dtype=dtype)
+        y = torch.tensor([0, 0, 10, 10, 0, 0], dtype=dtype)
+
+        custom = legality_check.IncrementalLegalityCheck(
+            node_size_x, node_size_y,
+            flat_region_boxes=torch.zeros(0, dtype=dtype),
+            flat_region_boxes_start=torch.tensor([0], dtype=torch.int32),
+            node2fence_region_map=torch.zeros(6, dtype=torch.int32),
+            xl=0.0, yl=0.0, xh=40.0, yh=20.0, site_width=1.0, row_height=10.0,
+            scale_factor=1.0, num_terminals=2, num_movable_nodes=4)
+        self.assertTrue(custom(torch.cat([x, y])))
+        self.assertTrue(custom.index is not None)
+
+        # cell 2 moves into the block spanning both rows
+        x[2] = 12
+        self.assertFalse(custom(torch.cat([x, y])))
+        self.assertTrue(custom.index is None)
+        # full scan again, then an incremental move to a free spot
+        x[2] = 5
+        self.assertTrue(custom(torch.cat([x, y])))
+        x[2] = 30
+        self.assertTrue(custom(torch.cat([x, y])))
+        # cells 3 and 2 swap rows, 3 now overlaps cell 1
+        x[3], y[3] = 1, 0
+        self.assertFalse(custom(torch.cat([x, y])))
+        # off-site position
+        x[3], y[3] = 34.5, 10
+        self.assertFalse(custom(torch.cat([x, y])))
+
+        # a full scan after reset agrees with the incremental result
+        x[3] = 34
+        pos = torch.cat([x, y])
+        self.assertTrue(custom(pos))
+        custom.reset()
+        self.assertTrue(custom(pos))
+
+
+if __name__ == '__main__':
+    unittest.main()
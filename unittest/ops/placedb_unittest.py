@@ -0,0 +1,119 @@
+##
+# @file   placedb_unittest.py
+# @brief  compare vectorized PlaceDB.hpwl and PlaceDB.density_map with per-net and per-bin loops,
+#         and round-trip the vectorized .pl writer and reader
+#
+
+import os
+import sys
+import tempfile
+import numpy as np
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "dreamplace"))
+from dreamplace import PlaceDB
+sys.path.pop()
+sys.path.pop()
+
+"""
+return overlap area between two rectangles
+"""
+def overlap(xl1, yl1, xh1, yh1, xl2, yl2, xh2, yh2):
+    return max(min(xh1, xh2)-max(xl1, xl2), 0.0) * max(min(yh1, yh2)-max(yl1, yl2), 0.0)
+
+"""
+return density map by looping over cells and bins
+"""
+def loop_density_map(db, x, y):
+    density_map = np.zeros([db.num_bins_x, db.num_bins_y])
+    for node_id in range(db.num_physical_nodes):
+        for ix in range(db.num_bins_x):
+            for iy in range(db.num_bins_y):
+                density_map[ix, iy] += overlap(
+                        db.bin_xl(ix), db.bin_yl(iy), db.bin_xh(ix), db.bin_yh(iy),
+                        x[node_id], y[node_id], x[node_id]+db.node_size_x[node_id], y[node_id]+db.node_size_y[node_id]
+                        )
+    for ix in range(db.num_bins_x):
+        for iy in range(db.num_bins_y):
+            density_map[ix, iy] /= (db.bin_xh(ix)-db.bin_xl(ix))*(db.bin_yh(iy)-db.bin_yl(iy))
+    return density_map
+
+def random_placedb(num_nodes, num_pins, num_nets):
+    np.random.seed(0)
+    db = PlaceDB.PlaceDB()
+    db.xl, db.yl, db.xh, db.yh = 10.0, 5.0, 110.0, 85.0
+    db.num_bins_x, db.num_bins_y = 7, 6
+    db.bin_size_x = (db.xh - db.xl) / db.num_bins_x
+    db.bin_size_y = (db.yh - db.yl) / db.num_bins_y
+    db.num_physical_nodes = num_nodes
+    db.node_size_x = np.random.uniform(1, 10, num_nodes)
+    db.node_size_y = np.random.uniform(1, 10, num_nodes)
+    # a macro spanning many bins
+    db.node_size_x[0], db.node_size_y[0] = 45.0, 33.0
+
+    db.pin2node_map = np.random.randint(0, num_nodes, num_pins).astype(np.int32)
+    db.pin_offset_x = np.random.uniform(0, 1, num_pins)
+    db.pin_offset_y = np.random.uniform(0, 1, num_pins)
+    # random net degrees including empty and single-pin nets
+    net_degrees = np.random.multinomial(num_pins, np.ones(num_nets) / num_nets)
+    net_degrees[1] += net_degrees[2]
+    net_degrees[2] = 0
+    db.flat_net2pin_start_map = np.concatenate([[0], np.cumsum(net_degrees)]).astype(np.int32)
+    db.flat_net2pin_map = np.random.permutation(num_pins).astype(np.int32)
+    db.net2pin_map = [db.flat_net2pin_map[db.flat_net2pin_start_map[i]:db.flat_net2pin_start_map[i+1]]
+            for i in range(num_nets)]
+    db.net_weights = np.random.uniform(0.5, 2, num_nets)
+    return db
+
+class PlaceDBTest(unittest.TestCase):
+    def test_hpwlRandom(self):
+        db = random_placedb(num_nodes=50, num_pins=200, num_nets=40)
+        x = np.random.uniform(db.xl, db.xh, db.num_physical_nodes)
+        y = np.random.uniform(db.yl, db.yh, db.num_physical_nodes)
+
+        golden_value = sum(db.net_hpwl(x, y, net_id) for net_id in range(len(db.net2pin_map)) if len(db.net2pin_map[net_id]))
+        hpwl_value = db.hpwl(x, y)
+        print("golden_value = ", golden_value, "hpwl_value = ", hpwl_value)
+        np.testing.assert_allclose(hpwl_value, golden_value)
+
+    def test_densityMapRandom(self):
+        db = random_placedb(num_nodes=50, num_pins=200, num_nets=40)
+        # include cells partially outside the layout
+        x = np.random.uniform(db.xl - 5, db.xh, db.num_physical_nodes)
+        y = np.random.uniform(db.yl - 5, db.yh, db.num_physical_nodes)
+
+        golden_value = loop_density_map(db, x, y)
+        density_map = db.density_map(x, y)
+        np.testing.assert_allclose(density_map, golden_value, rtol=1e-6, atol=1e-9)
+
+    def test_plRoundTrip(self):
+        db = random_placedb(num_nodes=50, num_pins=200, num_nets=40)
+        db.num_terminals, db.num_terminal_NIs = 0, 5
+        db.node_names = np.array(["o%d" % (i) for i in range(db.num_physical_nodes)], dtype=np.string_)
+        db.node_name2id_map = {name.decode() : i for i, name in enumerate(db.node_names)}
+        db.node_orient = np.array(["N", "FS"] * (db.num_physical_nodes // 2), dtype=np.string_)
+        db.fixed_pl_content = ""
+        x = np.round(np.random.uniform(db.xl, db.xh, db.num_physical_nodes), 2)
+        y = np.round(np.random.uniform(db.yl, db.yh, db.num_physical_nodes), 2)
+
+        class Params(object):
+            shift_factor = [0, 0]
+            scale_factor = 1.0
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pl_file = os.path.join(tmp_dir, "test.pl")
+            db.write_pl(Params(), pl_file, x, y, chunk_size=16)
+            with open(pl_file, "r") as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines[2], "o0 %g %g : N" % (x[0], y[0]))
+            self.assertEqual(lines[-1], "o49 %g %g : FS /FIXED_NI" % (x[49], y[49]))
+            db.node_x = np.zeros(db.num_physical_nodes)
+            db.node_y = np.zeros(db.num_physical_nodes)
+            db.node_orient = np.zeros(db.num_physical_nodes, dtype="S2")
+            db.read_pl(Params(), pl_file, chunk_size=16)
+        np.testing.assert_allclose(db.node_x, x)
+        np.testing.assert_allclose(db.node_y, y)
+        np.testing.assert_array_equal(db.node_orient[:2], [b"N", b"FS"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+##
+# @file   quadratic_init_unittest.py
+# @brief  compare the conjugate gradient quadratic placement with a dense solve of the same net model
+#
+
+import os
+import sys
+import numpy as np
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "dreamplace"))
+from dreamplace import QuadraticInit
+sys.path.pop()
+sys.path.pop()
+
+
+class Params(object):
+    gpu = 0
+    quadratic_init_clique_degree = 3
+    ignore_net_degree = 100
+    quadratic_init_iterations = 1000
+    quadratic_init_tolerance = 1e-12
+
+
+class PlaceDB(object):
+    def __init__(self):
+        np.random.seed(0)
+        self.xl, self.yl, self.xh, self.yh = 0.0, 0.0, 100.0, 60.0
+        # 4 movable cells and 2 fixed cells
+        self.num_movable_nodes = 4
+        self.num_physical_nodes = 6
+        self.num_nodes = 6
+        self.node_x = np.array([0, 0, 0, 0, 10, 90], dtype=np.float64)
+        self.node_y = np.array([0, 0, 0, 0, 10, 50], dtype=np.float64)
+        self.node_size_x = np.ones(6)
+        self.node_size_y = np.ones(6)
+        self.regions = []
+        # a 3-pin clique, a 2-pin net, a 4-pin net modeled as a star and a 2-pin net to a fixed cell
+        net_nodes = [[0, 1, 4], [1, 2], [2, 3, 5, 0], [3, 5]]
+        self.pin2node_map = np.concatenate(net_nodes).astype(np.int32)
+        self.flat_net2pin_map = np.arange(len(self.pin2node_map), dtype=np.int32)
+        self.flat_net2pin_start_map = np.concatenate([[0], np.cumsum([len(nodes) for nodes in net_nodes])]).astype(np.int32)
+        self.net_weights = np.array([1.0, 2.0, 1.0, 0.5])
+        self.pin_offset_x = np.random.uniform(0, 1, len(self.pin2node_map))
+        self.pin_offset_y = np.random.uniform(0, 1, len(self.pin2node_map))
+
+
+def dense_solve(params, db):
+    """
+    @brief build the Laplacian of the clique/star model entry by entry and solve it densely
+    """
+    starts = db.flat_net2pin_start_map
+    num_nets = len(starts) - 1
+    star_nets = [net for net in range(num_nets) if starts[net + 1] - starts[net] > params.quadratic_init_clique_degree]
+    num_variables = db.num_movable_nodes + len(star_nets)
+    L = np.zeros([num_variables, num_variables])
+    b = np.zeros([num_variables, 2])
+    fixed = np.stack([db.node_x, db.node_y], axis=1)
+
+    def connect(a, offset_a, fixed_a, c, offset_c, fixed_c, w):
+        # w * (pos_a + offset_a - pos_c - offset_c)^2, a variable index or None for fixed ends
+        if a is not None:
+            L[a, a] += w
+            b[a] += w * (offset_c - offset_a) + (w * fixed_c if c is None else 0)
+        if c is not None:
+            L[c, c] += w
+            b[c] += w * (offset_a - offset_c) + (w * fixed_a if a is None else 0)
+        if a is not None and c is not None:
+            L[a, c] -= w
+            L[c, a] -= w
+
+    def end(pin):
+        node = db.pin2node_map[pin]
+        variable = node if node < db.num_movable_nodes else None
+        return variable, np.array([db.pin_offset_x[pin], db.pin_offset_y[pin]]), fixed[node]
+
+    for net in range(num_nets):
+        pins = db.flat_net2pin_map[starts[net]:starts[net + 1]]
+        degree = len(pins)
+        w = db.net_weights[net]
+        if net in star_nets:
+            star = db.num_movable_nodes + star_nets.index(net)
+            for pin in pins:
+                connect(*end(pin), star, np.zeros(2), None, w * degree / (degree - 1))
+        else:
+            for i in range(degree):
+                for j in range(i + 1, degree):
+                    connect(*end(pins[i]), *end(pins[j]), w / (degree - 1))
+    regularization = 1e-3 * L.diagonal()[L.diagonal() > 0].mean()
+    L += regularization * np.eye(num_variables)
+    b += regularization * np.array([(db.xl + db.xh) / 2, (db.yl + db.yh) / 2])
+    return np.linalg.solve(L, b)[:db.num_movable_nodes]
+
+
+class QuadraticInitTest(unittest.TestCase):
+    def test_denseSolve(self):
+        params = Params()
+        db = PlaceDB()
+        init_pos = np.concatenate([db.node_x, db.node_y])
+        init_pos[:db.num_movable_nodes] = 50
+        init_pos[db.num_nodes:db.num_nodes + db.num_movable_nodes] = 30
+        golden = dense_solve(params, db)
+        result = QuadraticInit.quadratic_init(params, db, init_pos.copy())
+        print("golden = ", golden)
+        np.testing.assert_allclose(result[:db.num_movable_nodes], golden[:, 0], rtol=1e-6)
+        np.testing.assert_allclose(result[db.num_nodes:db.num_nodes + db.num_movable_nodes], golden[:, 1], rtol=1e-6)
+        # fixed cells stay
+        np.testing.assert_array_equal(result[db.num_movable_nodes:db.num_nodes], db.node_x[db.num_movable_nodes:])
+
+    def test_fenceRegionsSkipped(self):
+        params = Params()
+        db = PlaceDB()
+        db.regions = [np.array([[0, 0, 50, 30]])]
+        init_pos = np.concatenate([db.node_x, db.node_y])
+        result = QuadraticInit.quadratic_init(params, db, init_pos.copy())
+        np.testing.assert_array_equal(result, init_pos)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+##
+# @file   row_abacus_legalize_unittest.py
+# @brief  check the torch abacus on free row segments
+#
+
+import os
+import sys
+import numpy as np
+import unittest
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from dreamplace.ops.abacus_legalize import abacus_legalize
+sys.path.pop()
+
+
+class RowAbacusLegalizeOpTest(unittest.TestCase):
+    def test_rowAbacusLegalize(self):
+        dtype = torch.float64
+        xl, yl, xh, yh = 0.0, 0.0, 40.0, 20.0
+        site_width, row_height = 1.0, 10.0
+        # 5 movable cells in 2 rows, 1 fixed block cutting row 0 into [0, 10) and [14, 40)
+        node_size_x = torch.tensor([2, 3, 2, 4, 2, 4], dtype=dtype)
+        node_size_y = torch.tensor([10, 10, 10, 10, 10, 10], dtype=dtype)
+        node_weights = torch.tensor([1, 1, 2, 1, 1, 0], dtype=dtype)
+        # greedy legal positions: order 0, 1 in [0, 10), 2 in [14, 40), 3, 4 in row 1
+        x = torch.tensor([0, 5, 30, 10, 20, 10], dtype=dtype)
+        y = torch.tensor([0, 0, 0, 10, 10, 0], dtype=dtype)
+        pos = torch.cat([x, y])
+        # targets: 0 and 1 overlap, 2 is pushed off the block, 3 and 4 overlap at the right boundary
+        init_x = torch.tensor([3, 3.5, 11, 37, 38, 10], dtype=dtype)
+        init_pos = torch.cat([init_x, y])
+
+        custom = abacus_legalize.RowAbacusLegalize(
+            node_size_x, node_size_y, node_weights,
+            xl=xl, yl=yl, xh=xh, yh=yh, site_width=site_width, row_height=row_height,
+            num_movable_nodes=5, num_terminals=1, num_terminal_NIs=0, num_filler_nodes=0)
+        result = custom(init_pos, pos)
+        result_x = result[:6].numpy()
+        print("row abacus x = ", result_x)
+
+        # rows, fixed cells and y stay
+        np.testing.assert_array_equal(result[6:].numpy(), y.numpy())
+        self.assertEqual(result_x[5], 10)
+        # 0 and 1 form one cluster around their weighted target, 2 goes to the block edge
+        self.assertEqual(result_x[1], result_x[0] + 2)
+        self.assertTrue(1 <= result_x[0] <= 3)
+        self.assertEqual(result_x[2], 14)
+        # 3 and 4 are packed against the right boundary
+        np.testing.assert_array_equal(result_x[3:5], [34, 38])
+        # site aligned
+        np.testing.assert_array_equal(result_x, np.round(result_x))
+
+    def test_rowSegments(self):
+        rows, seg_xl, seg_xh = abacus_legalize.row_segments(
+            np.array([10.0, 12.0, 30.0]), np.array([0.0, 0.0, 5.0]),
+            np.array([14.0, 13.0, 31.5]), np.array([10.0, 20.0, 15.0]),
+            0.0, 0.0, 40.0, 20.0, 1.0, 10.0)
+        np.testing.assert_array_equal(rows, [0, 0, 0, 1, 1, 1])
+        np.testing.assert_array_equal(seg_xl, [0, 14, 32, 0, 13, 32])
+        np.testing.assert_array_equal(seg_xh, [10, 30, 40, 12, 30, 40])
+
+
+if __name__ == '__main__':
+    unittest.main()
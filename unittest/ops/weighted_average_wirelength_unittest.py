@@ -211,6 +211,71 @@ class WeightedAverageWirelengthOpTest(unittest.TestCase):
                                    rtol=1e-6,
                                    atol=1e-6)
 
+        # test cpu lean
+        pin_pos_var.grad.zero_()
+        custom = weighted_average_wirelength.WeightedAverageWirelength(
+            flat_netpin=Variable(torch.from_numpy(flat_net2pin_map)),
+            netpin_start=Variable(torch.from_numpy(flat_net2pin_start_map)),
+            pin2net_map=torch.from_numpy(pin2net_map),
+            net_weights=torch.from_numpy(net_weights),
+            net_mask=torch.from_numpy(net_mask),
+            pin_mask=torch.from_numpy(pin_mask),
+            gamma=torch.tensor(gamma, dtype=dtype),
+            algorithm='lean')
+        result = custom.forward(pin_pos_var)
+        print("custom_cpu_result lean = ", result.data)
+        result.backward()
+        grad_lean = pin_pos_var.grad.clone()
+        print("custom_grad_cpu lean = ", grad_lean.data)
+
+        np.testing.assert_allclose(result.data.numpy(),
+                                   golden_value,
+                                   atol=1e-6)
+        np.testing.assert_allclose(grad_lean.data.numpy(),
+                                   grad.data.numpy(),
+                                   rtol=1e-6,
+                                   atol=1e-6)
+
+        # test cpu lean with two placements stacked, the second one shifted, and one gamma per placement
+        pin_pos_batch = Variable(torch.cat([pin_pos_var.data, pin_pos_var.data + 1]), requires_grad=True)
+        inv_gamma = torch.tensor([[1.0 / gamma]] * 4, dtype=dtype)
+        result = weighted_average_wirelength.WeightedAverageWirelengthLeanFunction.apply(
+            pin_pos_batch, custom.flat_netpin, custom.netpin_start, custom.pin2net_map,
+            custom.net_weights, custom.net_mask, custom.pin_mask, inv_gamma)
+        result.backward()
+        np.testing.assert_allclose(result.data.numpy(),
+                                   2 * golden_value,
+                                   atol=1e-6)
+        np.testing.assert_allclose(pin_pos_batch.grad.data.numpy(),
+                                   np.concatenate([grad.data.numpy()] * 2),
+                                   rtol=1e-6,
+                                   atol=1e-6)
+
+        # test cpu merged in float32 for float64 positions
+        pin_pos_var64 = Variable(pin_pos_var.data.double(), requires_grad=True)
+        custom = weighted_average_wirelength.WeightedAverageWirelength(
+            flat_netpin=Variable(torch.from_numpy(flat_net2pin_map)),
+            netpin_start=Variable(torch.from_numpy(flat_net2pin_start_map)),
+            pin2net_map=torch.from_numpy(pin2net_map),
+            net_weights=torch.from_numpy(net_weights).double(),
+            net_mask=torch.from_numpy(net_mask),
+            pin_mask=torch.from_numpy(pin_mask),
+            gamma=torch.tensor(gamma, dtype=torch.float64),
+            algorithm='merged',
+            precision=torch.float32)
+        result = custom.forward(pin_pos_var64)
+        print("custom_cpu_result mixed = ", result.data)
+        result.backward()
+        self.assertEqual(result.dtype, torch.float64)
+        self.assertEqual(pin_pos_var64.grad.dtype, torch.float64)
+        np.testing.assert_allclose(result.data.numpy(),
+                                   golden_value,
+                                   atol=1e-5)
+        np.testing.assert_allclose(pin_pos_var64.grad.data.numpy(),
+                                   grad.data.numpy(),
+                                   rtol=1e-5,
+                                   atol=1e-5)
+
         # test gpu
         if torch.cuda.device_count():
             pin_pos_var.grad.zero_()